@@ -0,0 +1,109 @@
+"""
+Confronto dei backend di generazione dei documenti.
+
+Uso:
+    python benchmarks/bench_backends.py [--documents N]
+
+Genera N documenti in memoria con immagini di prova per:
+- python-docx senza cache (il layout ricostruito a ogni documento)
+- backend "docx" (scheletro python-docx in cache)
+- backend "ooxml" (document.xml scritto direttamente da template)
+- backend "pdf" (PDF disegnato direttamente, da inviare a lp)
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from PIL import Image, ImageDraw
+from manrev.settings import manrev_settings
+from manrev.generator import build_document, get_renderer, number_to_words_it
+
+SAMPLE_DATA = {
+    'Tipo': 'Mandato di Pagamento',
+    'Numero': '123',
+    'Capitolo': 'Spese generali',
+    'Importo in €': '1234,56',
+    'Descrizione del pagamento': 'Acquisto materiale di cancelleria per la segreteria',
+    'Data': '15/12/2025',
+    'anno': '2025',
+    'Luogo': 'Decimoputzu',
+    'Il Tesoriere': 'Mario Rossi',
+    'Il Presidente': 'Anna Bianchi',
+    "L'Addetto Contabile": 'Luca Verdi'
+}
+
+def create_sample_images(directory):
+    """Crea immagine della sede e firme di prova"""
+    paths = {}
+    for name, size in [("sede", (1200, 500)), ("tesoriere", (600, 250)),
+                       ("presidente", (600, 250)), ("addetto", (600, 250))]:
+        img = Image.new("RGB", size, "white")
+        draw = ImageDraw.Draw(img)
+        draw.line((0, size[1], size[0], 0), fill="black", width=6)
+        draw.ellipse((size[0] // 6, size[1] // 6, size[0] // 2, size[1] // 2), outline="navy", width=4)
+        paths[name] = os.path.join(directory, f"{name}.png")
+        img.save(paths[name])
+    return paths
+
+def configure_settings(paths):
+    manrev_settings.current_settings["sede_image"] = paths["sede"]
+    manrev_settings.current_settings["firme"] = {
+        "tesoriere_firma": paths["tesoriere"],
+        "presidente_firma": paths["presidente"],
+        "addetto_firma": paths["addetto"]
+    }
+    manrev_settings.update_revision()
+
+def render_python_docx(data):
+    buffer = io.BytesIO()
+    doc = build_document(data, number_to_words_it(data['Importo in €']))
+    doc.save(buffer)
+    return buffer.getvalue()
+
+def make_backend_renderer(backend):
+    def render(data):
+        buffer = io.BytesIO()
+        get_renderer(backend).render(data, number_to_words_it(data['Importo in €']), buffer)
+        return buffer.getvalue()
+    return render
+
+def measure(render, documents):
+    """Restituisce (secondi totali, bytes medi per documento)"""
+    # Il primo documento prepara le cache e non viene conteggiato
+    render(dict(SAMPLE_DATA))
+    total_bytes = 0
+    start = time.perf_counter()
+    for number in range(documents):
+        data = dict(SAMPLE_DATA, Numero=str(number + 1))
+        total_bytes += len(render(data))
+    return time.perf_counter() - start, total_bytes / documents
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto dei backend di generazione")
+    parser.add_argument("--documents", type=int, default=200, help="documenti per backend")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        configure_settings(create_sample_images(directory))
+        renderers = [
+            ("python-docx (senza cache)", render_python_docx),
+            ("docx (scheletro)", make_backend_renderer("docx")),
+            ("ooxml (diretto)", make_backend_renderer("ooxml")),
+            ("pdf (diretto)", make_backend_renderer("pdf")),
+        ]
+        print(f"{'Backend':<28}{'doc/s':>10}{'ms/doc':>10}{'KB/doc':>10}")
+        for name, render in renderers:
+            elapsed, size = measure(render, args.documents)
+            print(f"{name:<28}{args.documents / elapsed:>10.1f}"
+                  f"{elapsed / args.documents * 1000:>10.2f}{size / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,385 @@
+"""
+Benchmark della generazione dei documenti, per confrontare le prestazioni
+tra un commit e l'altro.
+
+Uso:
+    python benchmarks/bench_pipeline.py [--documents N] [--output risultati.json]
+                                        [--compare precedente.json [--max-regression PCT]]
+
+Ogni scenario gira in un processo separato, con impostazioni, immagini,
+archivio e cartella dati sintetici in una directory temporanea (nessun file
+dell'utente viene letto o modificato) e dati generati con un seme fisso:
+- number_to_words_it: conversione degli importi in lettere;
+- layout: documento costruito con python-docx metodo per metodo di
+  DocumentLayout (add_header, add_signatures, ...) più il salvataggio;
+- generate_docx / generate_ooxml / generate_pdf: generate_documents
+  completo su file, con archivio, per ogni backend, suddiviso nelle sue fasi.
+
+Per ogni scenario riporta documenti (o operazioni) al secondo, p50/p99 per
+fase, il primo documento (cache fredde), byte per documento e picco di
+memoria (RSS) del processo. Con --output i risultati sono salvati in JSON;
+con --compare vengono confrontati con un file precedente e, con
+--max-regression, il comando termina con codice 1 se una fase peggiora
+oltre la percentuale indicata.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+
+SCENARIOS = ["number_to_words_it", "layout", "generate_docx", "generate_ooxml", "generate_pdf"]
+LAYOUT_STAGES = ["set_margins", "add_header", "add_details_table", "add_amount_text",
+                 "add_signatures", "add_footer"]
+
+DESCRIPTIONS = [
+    "Acquisto materiale di cancelleria per la segreteria",
+    "Rimborso spese di viaggio per la trasferta del consiglio direttivo",
+    "Quota associativa annuale",
+    "Manutenzione ordinaria della sede sociale e degli impianti",
+    "Contributo per l'organizzazione della manifestazione estiva"
+]
+CHAPTERS = ["Spese generali", "Quote associative", "Manutenzione", "Eventi", "Rimborsi"]
+
+def percentile(sorted_values, p):
+    """Percentile con il metodo nearest-rank su valori già ordinati"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+def stage_stats(samples):
+    """Statistiche in millisecondi di una fase"""
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values) * 1000, 4),
+        "p50_ms": round(percentile(values, 50) * 1000, 4),
+        "p99_ms": round(percentile(values, 99) * 1000, 4),
+        "max_ms": round(values[-1] * 1000, 4)
+    }
+
+def peak_rss_kb():
+    """Picco di memoria residente del processo in KB, None dove non disponibile"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss è in byte su macOS e in kilobyte su Linux
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+def sample_documents(count, seed):
+    """Dati sintetici riproducibili: lo stesso seme produce gli stessi documenti"""
+    rng = random.Random(seed)
+    for number in range(1, count + 1):
+        amount = rng.choice([rng.randint(1, 999), rng.randint(1000, 99999)]) + rng.randint(0, 99) / 100
+        yield {
+            'Tipo': rng.choice(['Mandato di Pagamento', 'Reversale di Esazione']),
+            'Numero': str(number),
+            'Capitolo': rng.choice(CHAPTERS),
+            'Importo in €': f"{amount:.2f}".replace('.', ','),
+            'Descrizione del pagamento': rng.choice(DESCRIPTIONS),
+            'Data': f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2025",
+            'anno': '2025',
+            'Luogo': 'Decimoputzu',
+            'Il Tesoriere': 'Mario Rossi',
+            'Il Presidente': 'Anna Bianchi',
+            "L'Addetto Contabile": 'Luca Verdi'
+        }
+
+def setup_environment(directory):
+    """Impostazioni, immagini e archivio sintetici nella directory temporanea"""
+    sys.path.insert(0, SRC_DIR)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from bench_backends import create_sample_images, configure_settings
+    from manrev.settings import manrev_settings
+    from manrev.archive import archive_index
+
+    # Nessuna scrittura nei file dell'utente, anche se qualcosa salvasse le impostazioni
+    manrev_settings.settings_file = os.path.join(directory, "manrev_config.json")
+    manrev_settings.current_settings["compact_output"] = False
+    archive_index.db_path = os.path.join(directory, "manrev_archive.db")
+    configure_settings(create_sample_images(directory))
+
+def run_number_to_words(count, seed, directory):
+    from manrev.generator import number_to_words_it
+
+    amounts = [data['Importo in €'] for data in sample_documents(count * 20, seed)]
+    number_to_words_it(amounts[0])
+    samples = []
+    start = time.perf_counter()
+    for amount in amounts:
+        started_at = time.perf_counter()
+        number_to_words_it(amount)
+        samples.append(time.perf_counter() - started_at)
+    elapsed = time.perf_counter() - start
+    return {
+        "operations": len(amounts),
+        "ops_per_sec": round(len(amounts) / elapsed, 1),
+        "stages": {"number_to_words_it": stage_stats(samples)}
+    }
+
+def run_layout(count, seed, directory):
+    from docx import Document
+    from manrev.generator import number_to_words_it
+    from manrev.layout_man_rev import DocumentLayout
+
+    def build(data, samples):
+        started_at = time.perf_counter()
+        doc = Document()
+        layout = DocumentLayout(doc)
+        samples["Document"].append(time.perf_counter() - started_at)
+        arguments = {
+            "set_margins": (),
+            "add_header": (data['Tipo'], data['anno'], data['Numero']),
+            "add_details_table": ({
+                'Capitolo': data['Capitolo'],
+                'Importo': data['Importo in €'],
+                'Descrizione': data['Descrizione del pagamento']
+            },),
+            "add_amount_text": (number_to_words_it(data['Importo in €']),),
+            "add_signatures": ({
+                'Il Tesoriere': data['Il Tesoriere'],
+                'Il Presidente': data['Il Presidente'],
+                "L'Addetto Contabile": data["L'Addetto Contabile"]
+            },),
+            "add_footer": (data['Luogo'], data['Data'])
+        }
+        for stage in LAYOUT_STAGES:
+            stage_start = time.perf_counter()
+            getattr(layout, stage)(*arguments[stage])
+            samples[stage].append(time.perf_counter() - stage_start)
+        stage_start = time.perf_counter()
+        buffer = io.BytesIO()
+        doc.save(buffer)
+        samples["save"].append(time.perf_counter() - stage_start)
+        samples["total"].append(time.perf_counter() - started_at)
+        return len(buffer.getvalue())
+
+    documents = list(sample_documents(count + 1, seed))
+    first_start = time.perf_counter()
+    build(documents[0], defaultdict(list))
+    first_ms = (time.perf_counter() - first_start) * 1000
+
+    samples = defaultdict(list)
+    total_bytes = 0
+    start = time.perf_counter()
+    for data in documents[1:]:
+        total_bytes += build(data, samples)
+    elapsed = time.perf_counter() - start
+    return {
+        "documents": count,
+        "docs_per_sec": round(count / elapsed, 2),
+        "first_document_ms": round(first_ms, 2),
+        "bytes_per_doc": round(total_bytes / count),
+        "stages": {stage: stage_stats(values) for stage, values in samples.items()}
+    }
+
+class _TimedRenderer:
+    """Renderer che misura la durata di render() lasciando invariato il resto"""
+
+    def __init__(self, renderer, samples):
+        self._renderer = renderer
+        self._samples = samples
+
+    def render(self, *args, **kwargs):
+        started_at = time.perf_counter()
+        try:
+            return self._renderer.render(*args, **kwargs)
+        finally:
+            self._samples["render"].append(time.perf_counter() - started_at)
+
+    def __getattr__(self, name):
+        return getattr(self._renderer, name)
+
+def run_generate(backend):
+    def run(count, seed, directory):
+        from manrev import generator
+
+        samples = defaultdict(list)
+
+        def timed(stage, function):
+            def wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    samples[stage].append(time.perf_counter() - started_at)
+            return wrapper
+
+        # generate_documents cerca queste funzioni nel modulo a ogni chiamata:
+        # sostituirle permette di misurare le fasi senza modificare il generatore
+        get_renderer = timed("get_renderer", generator.get_renderer)
+        generator.amount_in_words = timed("amount_in_words", generator.amount_in_words)
+        generator._archive = timed("archive", generator._archive)
+        generator.get_renderer = lambda backend=None: _TimedRenderer(get_renderer(backend), samples)
+
+        output_dir = os.path.join(directory, "output")
+        documents = list(sample_documents(count + 1, seed))
+        first_start = time.perf_counter()
+        extension = generator.document_extension(backend)
+        generator.generate_documents(documents[0], os.path.join(output_dir, f"0{extension}"), backend=backend)
+        first_ms = (time.perf_counter() - first_start) * 1000
+        samples.clear()
+
+        total_bytes = 0
+        start = time.perf_counter()
+        for index, data in enumerate(documents[1:], 1):
+            output_file = os.path.join(output_dir, f"{index}{extension}")
+            started_at = time.perf_counter()
+            generator.generate_documents(data, output_file, backend=backend)
+            samples["generate_documents"].append(time.perf_counter() - started_at)
+            total_bytes += os.path.getsize(output_file)
+        elapsed = time.perf_counter() - start
+        return {
+            "documents": count,
+            "docs_per_sec": round(count / elapsed, 2),
+            "first_document_ms": round(first_ms, 2),
+            "bytes_per_doc": round(total_bytes / count),
+            "stages": {stage: stage_stats(values) for stage, values in samples.items()}
+        }
+    return run
+
+SCENARIO_FUNCTIONS = {
+    "number_to_words_it": run_number_to_words,
+    "layout": run_layout,
+    "generate_docx": run_generate("docx"),
+    "generate_ooxml": run_generate("ooxml"),
+    "generate_pdf": run_generate("pdf")
+}
+
+def run_child(args):
+    """Esegue un solo scenario nel processo corrente e scrive il risultato in JSON"""
+    with tempfile.TemporaryDirectory() as directory:
+        setup_environment(directory)
+        result = SCENARIO_FUNCTIONS[args.child](args.documents, args.seed, directory)
+        result["peak_rss_kb"] = peak_rss_kb()
+    with open(args.child_output, "w", encoding="utf-8") as f:
+        json.dump(result, f)
+
+def run_scenario(name, documents, seed):
+    """Esegue uno scenario in un processo nuovo, con la home in una directory temporanea"""
+    with tempfile.TemporaryDirectory() as home:
+        env = dict(os.environ, HOME=home, USERPROFILE=home, APPDATA=home)
+        output_path = os.path.join(home, "result.json")
+        result = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", name,
+             "--documents", str(documents), "--seed", str(seed), "--child-output", output_path],
+            env=env, capture_output=True, text=True
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Scenario {name} non riuscito:\n{result.stderr.strip()}")
+        with open(output_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return None
+
+def print_results(results):
+    for name, scenario in results["scenarios"].items():
+        rate = (f"{scenario['docs_per_sec']} doc/s" if "docs_per_sec" in scenario
+                else f"{scenario['ops_per_sec']} op/s")
+        details = [rate]
+        if "bytes_per_doc" in scenario:
+            details.append(f"{scenario['bytes_per_doc'] / 1024:.1f} KB/doc")
+            details.append(f"primo documento {scenario['first_document_ms']} ms")
+        if scenario.get("peak_rss_kb"):
+            details.append(f"picco RSS {scenario['peak_rss_kb'] / 1024:.1f} MB")
+        print(f"\n{name}: {', '.join(details)}")
+        print(f"  {'Fase':<22}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+        for stage, stats in scenario["stages"].items():
+            print(f"  {stage:<22}{stats['p50_ms']:>10.3f}{stats['p99_ms']:>10.3f}{stats['max_ms']:>10.3f}")
+
+def compare_results(results, baseline, max_regression=None):
+    """
+    Confronta con un risultato precedente; restituisce le regressioni oltre
+    max_regression (percentuale) come elenco di descrizioni
+    """
+    regressions = []
+    print(f"\nConfronto con {baseline['meta'].get('commit') or 'risultato precedente'}:")
+    for name, scenario in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        rate_key = "docs_per_sec" if "docs_per_sec" in scenario else "ops_per_sec"
+        # Per il throughput un calo è un peggioramento, per i tempi un aumento
+        changes = [(rate_key, previous.get(rate_key), scenario[rate_key], -1)]
+        for stage, stats in scenario["stages"].items():
+            old_stats = previous.get("stages", {}).get(stage)
+            if old_stats:
+                changes.append((f"{stage} p50", old_stats["p50_ms"], stats["p50_ms"], 1))
+        print(f"  {name}")
+        for label, old, new, direction in changes:
+            if not old:
+                continue
+            change = (new - old) / old * 100
+            print(f"    {label:<26}{old:>12.3f}{new:>12.3f}{change:>+9.1f}%")
+            if max_regression is not None and change * direction > max_regression:
+                regressions.append(f"{name} {label}: {change:+.1f}%")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark della generazione dei documenti")
+    parser.add_argument("--documents", type=int, default=200, help="documenti per scenario")
+    parser.add_argument("--seed", type=int, default=2025, help="seme dei dati sintetici")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--output", metavar="FILE", help="salva i risultati in JSON")
+    parser.add_argument("--compare", metavar="FILE", help="confronta con un risultato JSON precedente")
+    parser.add_argument("--max-regression", type=float, metavar="PCT",
+                        help="con --compare, termina con codice 1 oltre questo peggioramento")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--child-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args)
+        return 0
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "documents": args.documents,
+            "seed": args.seed
+        },
+        "scenarios": {}
+    }
+    for name in args.scenarios:
+        results["scenarios"][name] = run_scenario(name, args.documents, args.seed)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nRisultati salvati in {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.max_regression)
+        if regressions:
+            print("\nRegressioni oltre la soglia:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""
+Tempo di avvio dell'interfaccia, per accorgersi delle regressioni.
+
+Uso:
+    python benchmarks/bench_startup.py [--runs N] [--max-ms SOGLIA]
+
+Avvia N volte `main.py --startup-time` in processi separati (a freddo per
+l'interprete, con la piattaforma Qt "offscreen" se non c'è un display) e
+riporta minimo, mediana e massimo del tempo fino alla finestra visibile.
+Con --max-ms termina con codice 1 se la mediana supera la soglia.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_PATH = os.path.join(ROOT_DIR, "main.py")
+
+def measure_startup(env):
+    """Un avvio completo; restituisce i millisecondi riportati da main.py"""
+    result = subprocess.run(
+        [sys.executable, MAIN_PATH, "--startup-time"],
+        cwd=ROOT_DIR, env=env, capture_output=True, text=True, timeout=60
+    )
+    match = re.search(r"Avvio: (\d+) ms", result.stdout)
+    if result.returncode != 0 or not match:
+        raise RuntimeError(f"Avvio non riuscito ({result.returncode}): {result.stderr.strip()}")
+    return int(match.group(1))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, help="soglia sulla mediana in millisecondi")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not env.get("DISPLAY") and sys.platform.startswith("linux"):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+    # Il primo avvio compila i .pyc e non fa parte della misura
+    measure_startup(env)
+    timings = [measure_startup(env) for _ in range(args.runs)]
+
+    median = statistics.median(timings)
+    print(f"Avvio su {args.runs} esecuzioni: min {min(timings)} ms, "
+          f"mediana {median:.0f} ms, max {max(timings)} ms")
+    if args.max_ms is not None and median > args.max_ms:
+        print(f"Mediana oltre la soglia di {args.max_ms:.0f} ms")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
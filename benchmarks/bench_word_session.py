@@ -0,0 +1,83 @@
+"""
+Stampa con Word: un avvio per documento contro la sessione condivisa.
+
+Uso:
+    python benchmarks/bench_word_session.py [--documents N] [--start-delay S] [--print-delay S]
+
+Usa il backend di Word simulato (FakeWordBackend), quindi gira anche su
+Linux: l'avvio di Word e la stampa di un documento attendono i secondi
+indicati. Confronta:
+- un avvio e una chiusura di Word per ogni documento (il comportamento
+  precedente di print_with_word);
+- WordSessionPool con un documento per chiamata;
+- WordSessionPool con tutti i documenti in un solo lotto.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from manrev.word_session import FakeWordBackend, WordSessionPool
+
+def print_one_word_per_document(backend, file_paths, printer):
+    for file_path in file_paths:
+        app = backend.start()
+        try:
+            backend.set_printer(app, printer)
+            backend.print_file(app, file_path)
+        finally:
+            backend.quit(app)
+
+def print_pooled(backend, file_paths, printer):
+    pool = WordSessionPool(backend=backend)
+    try:
+        for file_path in file_paths:
+            pool.print_file(file_path, printer)
+    finally:
+        pool.close()
+
+def print_pooled_batch(backend, file_paths, printer):
+    pool = WordSessionPool(backend=backend)
+    try:
+        errors = pool.print_files(file_paths, printer)
+        if any(errors):
+            raise RuntimeError(f"Stampe fallite: {sum(1 for error in errors if error)}")
+    finally:
+        pool.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Confronto tra avvio di Word per documento e sessione condivisa")
+    parser.add_argument("--documents", type=int, default=20, help="documenti da stampare")
+    parser.add_argument("--start-delay", type=float, default=0.5, help="secondi per avviare Word")
+    parser.add_argument("--print-delay", type=float, default=0.02, help="secondi per stampare un documento")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        file_paths = []
+        for number in range(args.documents):
+            file_path = os.path.join(directory, f"documento_{number + 1}.docx")
+            with open(file_path, "wb") as f:
+                f.write(b"docx")
+            file_paths.append(file_path)
+
+        strategies = [
+            ("Word per documento", print_one_word_per_document),
+            ("sessione condivisa", print_pooled),
+            ("sessione, un lotto", print_pooled_batch),
+        ]
+        print(f"{'Strategia':<24}{'secondi':>10}{'ms/doc':>10}{'avvii':>8}")
+        for name, run in strategies:
+            backend = FakeWordBackend(args.start_delay, args.print_delay)
+            start = time.perf_counter()
+            run(backend, file_paths, "Stampante")
+            elapsed = time.perf_counter() - start
+            print(f"{name:<24}{elapsed:>10.2f}{elapsed / args.documents * 1000:>10.1f}{backend.starts:>8}")
+
+if __name__ == "__main__":
+    main()
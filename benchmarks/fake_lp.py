@@ -0,0 +1,51 @@
+"""
+Sostituto di lp per provare la coda di stampa senza una stampante.
+
+Uso:
+    MANREV_LP_COMMAND="python benchmarks/fake_lp.py" python main.py --batch registro.csv --print
+
+Accetta gli stessi argomenti usati da ManRev (lp [-d STAMPANTE] FILE) e si
+comporta secondo le variabili d'ambiente:
+- FAKE_LP_DELAY: secondi di attesa per ogni stampa (predefinito 0)
+- FAKE_LP_FAIL_RATE: probabilità di errore tra 0 e 1 (predefinito 0)
+- FAKE_LP_LOG: file a cui aggiungere una riga "stampante<TAB>file" per ogni stampa
+- FAKE_LP_REJECT: testo contenuto nel nome dei file che lp rifiuta (fallisce
+  l'intera richiesta, come lp con un file non stampabile)
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+def main():
+    parser = argparse.ArgumentParser(prog="lp")
+    parser.add_argument("-d", dest="destination", default="")
+    parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+
+    time.sleep(float(os.environ.get("FAKE_LP_DELAY", "0")))
+    if random.random() < float(os.environ.get("FAKE_LP_FAIL_RATE", "0")):
+        print("lp: Error - scheduler not responding", file=sys.stderr)
+        return 1
+
+    reject = os.environ.get("FAKE_LP_REJECT")
+    for path in args.files:
+        if not os.path.exists(path):
+            print(f"lp: Error - unable to access \"{path}\" - No such file or directory", file=sys.stderr)
+            return 1
+        if reject and reject in os.path.basename(path):
+            print(f"lp: Error - unsupported document-format for \"{path}\"", file=sys.stderr)
+            return 1
+
+    log_path = os.environ.get("FAKE_LP_LOG")
+    if log_path:
+        with open(log_path, "a", encoding="utf-8") as log:
+            for path in args.files:
+                log.write(f"{args.destination}\t{path}\n")
+
+    print(f"request id is {args.destination or 'default'}-{os.getpid()} ({len(args.files)} file(s))")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
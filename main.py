@@ -1,3 +1,9 @@
+import time
+
+# Istante di avvio, il prima possibile per misurare anche gli import
+STARTED_AT = time.perf_counter()
+
+import argparse
 import os
 import sys
 
@@ -5,14 +11,241 @@ SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "src")
 if SRC_DIR not in sys.path:
     sys.path.insert(0, SRC_DIR)
 
-from PyQt5.QtWidgets import QApplication
-from manrev.gui import ManRevGUI
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="ManRev - Gestione mandati e reversali")
+    parser.add_argument(
+        "--batch",
+        metavar="REGISTRO",
+        help="genera senza interfaccia grafica un documento per ogni riga del registro CSV/JSON/XLSX"
+    )
+    parser.add_argument(
+        "--watch",
+        metavar="CARTELLA",
+        help="resta in attesa e genera i documenti dei registri CSV/JSON/XLSX depositati nella cartella"
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="con --watch, controlla la cartella periodicamente invece di usare inotify"
+    )
+    parser.add_argument(
+        "--serve",
+        nargs="?",
+        const=8765,
+        type=int,
+        metavar="PORTA",
+        help="avvia l'API HTTP locale di generazione su 127.0.0.1 (porta predefinita 8765)"
+    )
+    parser.add_argument(
+        "--output-dir",
+        metavar="DIR",
+        help="directory di destinazione dei documenti generati in modalità batch, --watch o --serve"
+    )
+    parser.add_argument(
+        "--merge",
+        metavar="FILE",
+        help="in modalità batch, unisce tutti i documenti in un unico file (uno per pagina), "
+             ".docx o .pdf secondo il backend"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        metavar="N",
+        help="numero di processi per la generazione batch, --watch, --serve e l'importazione "
+             "(predefinito 0 = uno per core)"
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="incorpora immagini ottimizzate per la stampa (file più piccoli)"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["docx", "ooxml", "pdf"],
+        help="backend di generazione: scheletro python-docx (docx), scrittura diretta (ooxml) o PDF (pdf)"
+    )
+    parser.add_argument(
+        "--print",
+        nargs="?",
+        const="",
+        metavar="STAMPANTE",
+        help="in modalità batch, stampa i documenti generati tramite la coda di stampa"
+    )
+    parser.add_argument(
+        "--search",
+        metavar="TESTO",
+        help="cerca nell'archivio dei documenti generati e stampa i risultati"
+    )
+    parser.add_argument(
+        "--anno",
+        type=int,
+        help="con --search, limita la ricerca a un anno"
+    )
+    parser.add_argument(
+        "--import-docs",
+        nargs="?",
+        const="",
+        metavar="DIR",
+        help="importa nell'archivio i documenti .docx esistenti (predefinita la cartella ManRev)"
+    )
+    parser.add_argument(
+        "--startup-time",
+        action="store_true",
+        help="apre l'interfaccia, stampa il tempo di avvio in millisecondi e termina"
+    )
+    # Qt aggiunge i propri argomenti (es. -style), vanno lasciati passare
+    args, _ = parser.parse_known_args(argv)
+    return args
+
+def run_batch(args):
+    from manrev.batch import run_batch as run, merge_ledger, print_result
+    from manrev.settings import manrev_settings
+
+    if args.compact:
+        manrev_settings.current_settings["compact_output"] = True
+        manrev_settings.update_revision()
+    if args.backend:
+        manrev_settings.current_settings["render_backend"] = args.backend
+
+    # File generati con i doc_data che contengono (più d'uno con --merge)
+    generated = {}
+
+    def on_result(result):
+        print_result(result)
+        if result.ok:
+            generated.setdefault(result.output_file, []).append(result.data)
+
+    if args.merge:
+        from manrev.generator import document_extension
+
+        # L'estensione segue il backend: con --backend pdf il documento unico è un PDF
+        merge_file, extension = os.path.splitext(os.path.abspath(args.merge))
+        if extension.lower() != document_extension():
+            print(f"Il documento unico sarà salvato come {merge_file + document_extension()}")
+        report = merge_ledger(args.batch, merge_file + document_extension(), on_result=on_result)
+    else:
+        report = run(args.batch, args.output_dir, on_result=on_result,
+                     workers=args.workers or None)
+    print(report.summary())
+
+    if args.print is not None and generated:
+        from manrev.print_aftergen import print_manager
+        from manrev.print_queue import print_spooler, DONE, FAILED
+        from manrev.printers import printer_registry
+
+        # Gli stessi file che stamperebbe la GUI: con la stampa tramite PDF
+        # un PDF per documento, che lp stampa senza conversioni
+        print_files = []
+        for output_file, payloads in generated.items():
+            try:
+                print_files.append(print_manager.prepare_print_file(output_file, payloads))
+            except Exception as e:
+                print(f"Errore nella preparazione della stampa di {output_file}: {str(e)}")
+
+        # Nessuna selezione della stampante: quella indicata o l'ultima usata
+        job_ids = print_spooler.submit_many(print_files, args.print or printer_registry.last_printer())
+        counts = print_spooler.run_until_done(job_ids)
+        print(f"Stampa: {counts.get(DONE, 0)} lavori completati, {counts.get(FAILED, 0)} falliti")
+    return 0 if report.failed == 0 else 1
+
+def run_watch(args):
+    from manrev.watcher import InboxWatcher
+    from manrev.batch import print_result
+    from manrev.settings import manrev_settings
+
+    if args.compact:
+        manrev_settings.current_settings["compact_output"] = True
+        manrev_settings.update_revision()
+    if args.backend:
+        manrev_settings.current_settings["render_backend"] = args.backend
+
+    def on_result(name, result):
+        if not result.ok:
+            print(f"{name}: ", end="")
+            print_result(result)
 
+    def on_file(inbox_file, destination):
+        outcome = "ERRORE" if inbox_file.failed else "OK"
+        detail = inbox_file.error or inbox_file.report.summary()
+        print(f"[{outcome}] {inbox_file.name}: {detail} -> {destination}")
+
+    watcher = InboxWatcher(args.watch, args.output_dir, workers=args.workers or None, use_inotify=not args.poll,
+                           on_result=on_result, on_file=on_file)
+    print(f"In attesa di registri in {watcher.inbox_dir} ({watcher.workers} processi)")
+    watcher.run()
+    return 0
+
+def run_serve(args):
+    from manrev.api_server import GenerationServer
+    from manrev.settings import manrev_settings
+
+    if args.compact:
+        manrev_settings.current_settings["compact_output"] = True
+        manrev_settings.update_revision()
+    if args.backend:
+        manrev_settings.current_settings["render_backend"] = args.backend
+
+    def on_ready(server):
+        print(f"API di generazione su http://127.0.0.1:{server.port} ({server.workers} processi)")
+
+    server = GenerationServer(args.serve, args.output_dir, workers=args.workers or None)
+    server.run(on_ready)
+    return 0
+
+def run_search(args):
+    from manrev.archive import archive_index
+
+    results = archive_index.search(args.search, anno=args.anno)
+    for result in results:
+        print(f"{result['anno']} {result['tipo']} n. {result['numero']} - "
+              f"€ {result['importo']} - {result['snippet']}\n    {result['output_path']}")
+    print(f"{len(results)} documenti trovati")
+    return 0
+
+def run_import(args):
+    from manrev.importer import document_importer
+
+    def print_failure(path, documents, error):
+        if error:
+            print(f"{path}: {error}")
+
+    report = document_importer.run(args.import_docs or None, workers=args.workers or None,
+                                   on_result=print_failure)
+    print(report.summary())
+    return 0
 
 def main():
+    args = parse_args(sys.argv[1:])
+    if args.import_docs is not None:
+        sys.exit(run_import(args))
+    if args.search is not None:
+        sys.exit(run_search(args))
+    if args.batch:
+        sys.exit(run_batch(args))
+    if args.watch:
+        sys.exit(run_watch(args))
+    if args.serve is not None:
+        sys.exit(run_serve(args))
+
+    from PyQt5.QtWidgets import QApplication
+    from manrev.gui import ManRevGUI
+
     app = QApplication(sys.argv)
-    window = ManRevGUI(app=app)
+    # La misura dell'avvio non deve riprendere stampe in coda né cercare stampanti
+    window = ManRevGUI(app=app, print_services=not args.startup_time)
     window.show()
+    if args.startup_time:
+        from PyQt5.QtCore import QTimer
+        from manrev.startup import elapsed_ms
+
+        def report_startup():
+            # Prima iterazione del ciclo degli eventi: la finestra è visibile
+            print(f"Avvio: {elapsed_ms(STARTED_AT):.0f} ms")
+            window.close()
+            app.quit()
+
+        QTimer.singleShot(0, report_startup)
     sys.exit(app.exec_())
 
 
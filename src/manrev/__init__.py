@@ -2,7 +2,20 @@
 ManRev - Gestione mandati e reversali
 """
 
-from .gui import ManRevGUI
-from .generator import generate_documents
+__all__ = ['ManRevGUI', 'generate_documents', 'render_document_bytes']
 
-__all__ = ['ManRevGUI', 'generate_documents'] 
\ No newline at end of file
+
+def __getattr__(name):
+    # La GUI viene importata solo se richiesta, così i moduli headless
+    # (es. generazione batch) non dipendono da PyQt5; il generatore porta
+    # con sé python-docx e PIL e viene caricato solo al primo utilizzo
+    if name == 'ManRevGUI':
+        from .gui import ManRevGUI
+        return ManRevGUI
+    if name == 'generate_documents':
+        from .generator import generate_documents
+        return generate_documents
+    if name == 'render_document_bytes':
+        from .generator import render_document_bytes
+        return render_document_bytes
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,187 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from functools import lru_cache
+
+# Importo più alto scritto in lettere; oltre si usano le cifre
+MAX_AMOUNT_IN_WORDS = 10 ** 12 - 1
+CACHE_SIZE = 4096
+
+_UNITS = (
+    "", "uno", "due", "tre", "quattro", "cinque", "sei", "sette", "otto", "nove", "dieci",
+    "undici", "dodici", "tredici", "quattordici", "quindici", "sedici", "diciassette",
+    "diciotto", "diciannove"
+)
+_TENS = ("", "", "venti", "trenta", "quaranta", "cinquanta", "sessanta", "settanta", "ottanta", "novanta")
+
+# Scale oltre le migliaia: valore, forma per 1, plurale
+_SCALES = (
+    (10 ** 9, "un miliardo", "miliardi"),
+    (10 ** 6, "un milione", "milioni")
+)
+
+def _below_hundred(n):
+    if n < 20:
+        return _UNITS[n]
+    tens, unit = divmod(n, 10)
+    # Elisione: ventuno, ventotto (non ventiuno, ventiotto)
+    if unit in (1, 8):
+        return _TENS[tens][:-1] + _UNITS[unit]
+    return _TENS[tens] + _UNITS[unit]
+
+def _below_thousand(n):
+    hundreds, rest = divmod(n, 100)
+    if hundreds == 0:
+        return _below_hundred(rest)
+    prefix = "cento" if hundreds == 1 else _UNITS[hundreds] + "cento"
+    # Elisione davanti a ottanta: centottanta, duecentottantotto
+    if 80 <= rest < 90:
+        prefix = prefix[:-1]
+    return prefix + _below_hundred(rest)
+
+# Tabella delle parole da 0 a 999, calcolata una volta all'import
+_GROUPS = tuple(_below_thousand(n) for n in range(1000))
+
+def _accented(words):
+    """Accento sui composti che finiscono in tre: ventitré, centotré, milletré"""
+    if words.endswith("tre") and words != "tre":
+        return words[:-3] + "tré"
+    return words
+
+def _before_multiplier(words):
+    """
+    Troncamento davanti a mila/milioni/miliardi (ventunmila, trentun milioni)
+    e accento dei composti in tre (ventitrémila, trentatré milioni)
+    """
+    if words.endswith("uno"):
+        return words[:-1]
+    return _accented(words)
+
+def integer_to_words(n):
+    """
+    Intero non negativo in lettere, fino a MAX_AMOUNT_IN_WORDS: le migliaia
+    sono unite alle unità (milleduecento), milioni e miliardi sono parole
+    separate (un milione duecentomila)
+    """
+    if n < 0 or n > MAX_AMOUNT_IN_WORDS:
+        raise ValueError(f"Numero fuori dall'intervallo convertibile: {n}")
+    if n == 0:
+        return "zero"
+
+    parts = []
+    rest = n
+    for value, singular, plural in _SCALES:
+        count, rest = divmod(rest, value)
+        if count == 1:
+            parts.append(singular)
+        elif count:
+            parts.append(f"{_before_multiplier(_GROUPS[count])} {plural}")
+
+    thousands, units = divmod(rest, 1000)
+    tail = ""
+    if thousands == 1:
+        tail = "mille"
+    elif thousands:
+        tail = _before_multiplier(_GROUPS[thousands]) + "mila"
+    tail = _accented(tail + _GROUPS[units])
+    if tail:
+        parts.append(tail)
+    return " ".join(parts)
+
+def parse_amount(value):
+    """
+    Converte un importo (testo come "1.234,56" o "12,5", int, float o
+    Decimal) in Decimal senza passare da float. Solleva ValueError se non valido.
+    """
+    if isinstance(value, Decimal):
+        amount = value
+    elif isinstance(value, int):
+        amount = Decimal(value)
+    elif isinstance(value, float):
+        # repr restituisce la forma decimale più breve: 0.29 resta 0.29
+        amount = Decimal(repr(value))
+    else:
+        text = str(value)
+        for separator in ("€", " ", "\u00a0", "'"):
+            text = text.replace(separator, "")
+        if "," in text and "." in text:
+            # Il separatore che compare per ultimo è quello dei decimali
+            if text.rfind(",") > text.rfind("."):
+                text = text.replace(".", "").replace(",", ".")
+            else:
+                text = text.replace(",", "")
+        elif text.count(".") > 1 or text.count(",") > 1:
+            # Solo separatori delle migliaia: 1.234.567
+            text = text.replace(".", "").replace(",", "")
+        else:
+            text = text.replace(",", ".")
+        try:
+            amount = Decimal(text)
+        except InvalidOperation:
+            raise ValueError(f"Importo non valido: {value}")
+    if not amount.is_finite():
+        raise ValueError(f"Importo non valido: {value}")
+    return amount
+
+def _convert(number):
+    try:
+        amount = abs(parse_amount(number)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    except (ValueError, InvalidOperation):
+        return f"{number} euro"
+
+    int_part = int(amount)
+    dec_part = int((amount - int_part) * 100)
+
+    # Caso zero
+    if int_part == 0 and dec_part == 0:
+        return "zero euro"
+
+    result = []
+
+    # Parte intera
+    if int_part > 0:
+        if int_part > MAX_AMOUNT_IN_WORDS:
+            result.append(str(int_part))
+            result.append("euro")
+        elif int_part == 1:
+            result.append("un euro")
+        else:
+            result.append(integer_to_words(int_part))
+            # Milioni e miliardi tondi: "due milioni di euro"
+            result.append("di euro" if int_part % 10 ** 6 == 0 else "euro")
+
+    # Decimali
+    if dec_part > 0:
+        if result:
+            result.append("e")
+        if dec_part < 10:
+            result.append("zero")
+        result.append(str(dec_part))
+        result.append("centesimi")
+
+    return " ".join(result)
+
+_convert_cached = lru_cache(maxsize=CACHE_SIZE)(_convert)
+
+def number_to_words_it(number):
+    """Converte un importo in parole in italiano (es. "milleduecento euro e 50 centesimi")"""
+    try:
+        return _convert_cached(number)
+    except TypeError:
+        # Valori non hashable: conversione senza cache
+        return _convert(number)
+
+def amounts_to_words(amounts):
+    """
+    Converte in una volta tutti gli importi di un registro, nello stesso
+    ordine: ogni importo distinto viene convertito una sola volta
+    """
+    converted = {}
+    result = []
+    for amount in amounts:
+        try:
+            words = converted.get(amount)
+            if words is None:
+                words = converted[amount] = number_to_words_it(amount)
+        except TypeError:
+            words = number_to_words_it(amount)
+        result.append(words)
+    return result
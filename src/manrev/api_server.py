@@ -0,0 +1,545 @@
+import asyncio
+import io
+import json
+import os
+import signal
+from urllib.parse import parse_qs
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from paths import path_manager
+from .settings import manrev_settings
+from .instrumentation import instrumentation
+from .numbering import NumberSequence, number_allocator
+from .batch import json_to_rows, prepare_row_data, build_output_filename, get_default_output_dir
+from .parallel import PENDING_PER_WORKER, _init_service_worker, _render_bytes, default_workers
+from .zip_writer import ZipEntry, ZipStreamWriter
+
+# Il server accetta solo connessioni dalla macchina locale
+HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+# Nomi accettati nell'intestazione Host: con qualsiasi altro nome la richiesta
+# arriva da una pagina web che ha fatto puntare il proprio dominio a 127.0.0.1
+ALLOWED_HOSTS = ("127.0.0.1", "localhost")
+
+MAX_HEADER_BYTES = 16 * 1024
+MAX_BODY_BYTES = 10 * 1024 * 1024
+MAX_BATCH_DOCUMENTS = 1000
+MAX_CONNECTIONS = 64
+# Documenti accettati per processo oltre i quali le nuove richieste
+# vengono respinte con 503, invece di allungare l'attesa di tutte
+MAX_QUEUED_PER_WORKER = 64
+# Secondi di attesa della richiesta successiva su una connessione aperta
+KEEPALIVE_TIMEOUT = 15
+STREAM_CHUNK = 64 * 1024
+
+CONTENT_TYPES = {
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".pdf": "application/pdf"
+}
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    403: "Forbidden",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    411: "Length Required",
+    413: "Payload Too Large",
+    415: "Unsupported Media Type",
+    431: "Request Header Fields Too Large",
+    500: "Internal Server Error",
+    501: "Not Implemented",
+    503: "Service Unavailable"
+}
+
+class HttpError(Exception):
+    """Errore da restituire al client come risposta JSON {"errore": ...}"""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.headers = headers or {}
+
+class HttpRequest:
+    def __init__(self, method, path, version, headers, body):
+        self.method = method
+        self.path = path
+        self.version = version
+        self.headers = headers
+        self.body = body
+
+    @property
+    def query(self):
+        return parse_qs(self.path.partition("?")[2])
+
+    @property
+    def keep_alive(self):
+        connection = self.headers.get("connection", "").lower()
+        if self.version == "HTTP/1.0":
+            return connection == "keep-alive"
+        return connection != "close"
+
+class GenerationServer:
+    """
+    API HTTP/JSON locale per generare documenti da altri programmi.
+
+    POST /documenti con un oggetto JSON (i campi del registro batch)
+    restituisce il documento generato; con una lista di oggetti, o un
+    oggetto con la lista in "documenti", restituisce uno zip trasmesso man
+    mano che i documenti sono pronti (con errori.txt per quelli non
+    generati). I documenti sono salvati e archiviati come quelli della GUI,
+    nella cartella dell'anno sotto output_dir; con ?salva=0 vengono solo
+    generati in memoria e restituiti, senza usare la numerazione (il Numero
+    va indicato). GET /stato riporta il carico.
+
+    La generazione usa un pool di processi già caldi: al massimo
+    PENDING_PER_WORKER documenti per processo sono nel pool, gli altri
+    attendono nel ciclo degli eventi e ogni richiesta ne invia uno alla
+    volta, così un lotto grande non blocca le richieste singole. Oltre
+    max_queued documenti accettati le nuove richieste ricevono 503.
+    """
+
+    def __init__(self, port=DEFAULT_PORT, output_dir=None, workers=None, max_queued=None):
+        self.port = port
+        self.output_dir = output_dir or get_default_output_dir()
+        self.workers = workers or default_workers()
+        self.max_in_flight = self.workers * PENDING_PER_WORKER
+        self.max_queued = max_queued or self.workers * MAX_QUEUED_PER_WORKER
+        # Documenti delle richieste in corso e documenti nel pool
+        self.queued = 0
+        self.running = 0
+        self._connections = set()
+        # Rilasci dei numeri non usati in attesa dei documenti ancora nel pool
+        self._releases = set()
+        self._slots = None
+        self._executor = None
+        self._server = None
+        self._loop = None
+        self._stop_event = None
+
+    def _start_pool(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_service_worker,
+                                             initargs=(manrev_settings.current_settings,))
+
+    async def start(self):
+        """Avvia i processi di generazione e apre la porta"""
+        self._loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._stop_event = asyncio.Event()
+        self._start_pool()
+        # I processi vengono creati alla prima richiesta: qui si avviano subito
+        # tutti, così anche la prima richiesta trova la parte fissa già pronta
+        await asyncio.gather(*(
+            self._loop.run_in_executor(self._executor, os.getpid) for _ in range(self.workers)
+        ))
+        self._server = await asyncio.start_server(
+            self._handle_connection, HOST, self.port, limit=MAX_HEADER_BYTES
+        )
+        # Con la porta 0 il sistema ne sceglie una libera
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """Chiude la porta e le connessioni, poi ferma i processi"""
+        if self._server is not None:
+            self._server.close()
+        for writer in list(self._connections):
+            writer.close()
+        if self._executor is not None:
+            await self._loop.run_in_executor(None, self._executor.shutdown)
+            self._executor = None
+        if self._releases:
+            await asyncio.gather(*self._releases, return_exceptions=True)
+
+    def stop(self):
+        """Ferma il server (anche da un altro thread)"""
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop_event.set)
+
+    def run(self, on_ready=None):
+        """Esegue il server finché non riceve SIGINT/SIGTERM o viene chiamato stop()"""
+        asyncio.run(self._serve(on_ready))
+
+    async def _serve(self, on_ready):
+        await self.start()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                self._loop.add_signal_handler(signum, self._stop_event.set)
+            except (NotImplementedError, RuntimeError, ValueError):
+                # Windows o thread secondario: Ctrl+C interrompe asyncio.run
+                pass
+        if on_ready:
+            on_ready(self)
+        try:
+            await self._stop_event.wait()
+        finally:
+            await self.close()
+
+    async def _handle_connection(self, reader, writer):
+        if len(self._connections) >= MAX_CONNECTIONS:
+            instrumentation.count("api.respinte")
+            await self._send_json(writer, 503, {"errore": "Troppe connessioni aperte"}, False, {"Retry-After": "1"})
+            writer.close()
+            return
+        self._connections.add(writer)
+        try:
+            # Le connessioni restano aperte per più richieste (keep-alive)
+            while True:
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader, writer), KEEPALIVE_TIMEOUT)
+                except HttpError as e:
+                    await self._send_json(writer, e.status, {"errore": e.message}, False, e.headers)
+                    break
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                if request is None:
+                    break
+
+                keep_alive = request.keep_alive
+                try:
+                    keep_alive = await self._dispatch(request, writer) and keep_alive
+                except HttpError as e:
+                    await self._send_json(writer, e.status, {"errore": e.message}, keep_alive, e.headers)
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        except Exception as e:
+            print(f"Errore nella gestione della richiesta HTTP: {str(e)}")
+        finally:
+            self._connections.discard(writer)
+            writer.close()
+
+    async def _read_request(self, reader, writer):
+        """Legge una richiesta; None se il client ha chiuso la connessione"""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise HttpError(400, "Richiesta incompleta")
+        except asyncio.LimitOverrunError:
+            raise HttpError(431, "Intestazioni troppo lunghe")
+
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, version = lines[0].split(" ")
+        except ValueError:
+            raise HttpError(400, "Riga di richiesta non valida")
+        headers = {}
+        for line in lines[1:]:
+            if line:
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+
+        if "transfer-encoding" in headers:
+            raise HttpError(501, "Transfer-Encoding non supportato: indicare Content-Length")
+        body = b""
+        if "content-length" in headers:
+            try:
+                length = int(headers["content-length"])
+            except ValueError:
+                raise HttpError(400, "Content-Length non valido")
+            if length > MAX_BODY_BYTES:
+                raise HttpError(413, f"Richiesta oltre {MAX_BODY_BYTES} bytes")
+            if headers.get("expect", "").lower() == "100-continue":
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            body = await reader.readexactly(length)
+        elif method in ("POST", "PUT"):
+            raise HttpError(411, "Content-Length obbligatorio")
+        return HttpRequest(method, path, version, headers, body)
+
+    def _check_client(self, request):
+        """
+        Respinge le richieste che un browser può inviare per conto di una
+        pagina web: i programmi locali non indicano Origin e usano 127.0.0.1
+        o localhost come Host
+        """
+        if "origin" in request.headers:
+            raise HttpError(403, "Richieste dal browser non consentite")
+        host = request.headers.get("host", "")
+        if not host.startswith("["):
+            host = host.rsplit(":", 1)[0]
+        if host.lower() not in ALLOWED_HOSTS:
+            raise HttpError(403, f"Host non consentito: {host or '(assente)'}")
+
+    async def _dispatch(self, request, writer):
+        """Risponde alla richiesta; restituisce False se la connessione va chiusa"""
+        self._check_client(request)
+        path = request.path.split("?", 1)[0].rstrip("/")
+        if path == "/stato":
+            if request.method != "GET":
+                raise HttpError(405, "Metodo non consentito", {"Allow": "GET"})
+            await self._send_json(writer, 200, self.status(), request.keep_alive)
+            return True
+        if path == "/documenti":
+            if request.method != "POST":
+                raise HttpError(405, "Metodo non consentito", {"Allow": "POST"})
+            return await self._generate(request, writer)
+        raise HttpError(404, f"Percorso sconosciuto: {path}")
+
+    def status(self):
+        """Carico del server, restituito da GET /stato"""
+        return {
+            "stato": "ok",
+            "backend": manrev_settings.current_settings.get("render_backend", "docx"),
+            "processi": self.workers,
+            "documenti_accettati": self.queued,
+            "documenti_in_generazione": self.running,
+            "max_documenti_accettati": self.max_queued,
+            "connessioni": len(self._connections)
+        }
+
+    def _prepare(self, rows, single, save):
+        """
+        Completa e numera i documenti della richiesta. Restituisce le liste
+        (indice, doc_data, nome del file, output_file) e (indice, errore) e
+        gli indici dei documenti numerati qui; output_file è None se i
+        documenti non vanno salvati. Accede all'archivio e al disco: va
+        eseguita fuori dal ciclo degli eventi.
+        """
+        tasks = []
+        failures = []
+        numbered = set()
+        # I documenti non salvati non consumano numeri della numerazione:
+        # devono indicare il proprio Numero
+        numbers = None
+        if save:
+            # Un blocco della dimensione della richiesta: le richieste concorrenti non lasciano buchi
+            numbers = NumberSequence(block_size=len(rows))
+        try:
+            for index, row in enumerate(rows, start=1):
+                try:
+                    data = prepare_row_data(row, numbers)
+                    if numbers is not None and not row.get("Numero"):
+                        numbered.add(index)
+                    filename = build_output_filename(data)
+                    if os.path.basename(filename) != filename or "/" in filename:
+                        raise ValueError("Tipo e Numero non possono contenere separatori di percorso")
+                    output_file = None
+                    if save:
+                        year_dir = path_manager.get_year_dir(self.output_dir, data["anno"])
+                        output_file = os.path.join(year_dir, filename)
+                    tasks.append((index, data, filename, output_file))
+                except Exception as e:
+                    if single:
+                        raise HttpError(400, str(e))
+                    failures.append((index, str(e)))
+        finally:
+            if numbers is not None:
+                numbers.close()
+        return tasks, failures, numbered
+
+    def _release(self, tasks):
+        """
+        Restituisce alla numerazione i numeri di documenti non generati.
+        Il rilascio ha effetto solo per gli ultimi numeri assegnati (vedi
+        NumberAllocator.release): i documenti non inviati dopo la
+        disconnessione del client, che sono in coda alla richiesta, non
+        lasciano buchi nella numerazione.
+        """
+        by_key = {}
+        for _, data, _, _ in tasks:
+            by_key.setdefault((data["anno"], data["Tipo"]), []).append(int(data["Numero"]))
+        for (anno, tipo), numbers in by_key.items():
+            for number in sorted(numbers, reverse=True):
+                if not number_allocator.release(anno, tipo, range(number, number + 1)):
+                    break
+
+    async def _release_unused(self, tasks, numbered, generated, running=()):
+        """Rilascia i numeri assegnati dalla richiesta ai documenti non generati, dopo quelli ancora in corso"""
+        if running:
+            await asyncio.wait(running)
+        unused = [task for task in tasks if task[0] in numbered and task[0] not in generated]
+        if unused:
+            try:
+                await self._loop.run_in_executor(None, self._release, unused)
+            except Exception as e:
+                print(f"Errore nel rilascio dei numeri non usati: {str(e)}")
+
+    async def _generate(self, request, writer):
+        # Un modulo o una fetch "semplice" di una pagina web non può inviare application/json
+        content_type = request.headers.get("content-type", "").split(";", 1)[0].strip().lower()
+        if content_type != "application/json":
+            raise HttpError(415, "Content-Type deve essere application/json")
+        try:
+            content = json.loads(request.body.decode("utf-8-sig"))
+        except (UnicodeDecodeError, ValueError) as e:
+            raise HttpError(400, f"JSON non valido: {str(e)}")
+        single = isinstance(content, dict) and "documenti" not in content
+        try:
+            rows = json_to_rows(content)
+        except ValueError as e:
+            raise HttpError(400, str(e))
+        if not rows:
+            raise HttpError(400, "Nessun documento nella richiesta")
+        if len(rows) > MAX_BATCH_DOCUMENTS:
+            raise HttpError(413, f"Al massimo {MAX_BATCH_DOCUMENTS} documenti per richiesta")
+        # Una richiesta viene sempre accettata se il server è libero, anche se supera max_queued
+        if self.queued and self.queued + len(rows) > self.max_queued:
+            instrumentation.count("api.respinte")
+            raise HttpError(503, "Server occupato, riprovare più tardi", {"Retry-After": "1"})
+
+        instrumentation.count("api.richieste")
+        self.queued += len(rows)
+        try:
+            save = request.query.get("salva", ["1"])[-1].lower() not in ("0", "no", "false")
+            # Numerazione (transazione SQLite) e cartelle dell'anno in un thread,
+            # così il ciclo degli eventi continua a servire le altre connessioni
+            tasks, failures, numbered = await self._loop.run_in_executor(None, self._prepare, rows, single, save)
+            if single:
+                return await self._send_document(request, writer, tasks[0], numbered)
+            return await self._send_zip(request, writer, tasks, failures, numbered)
+        finally:
+            self.queued -= len(rows)
+
+    async def _render_document(self, index, data, filename, output_file):
+        """Genera un documento nel pool e ne riceve il contenuto; il posto nel pool è già acquisito"""
+        self.running += 1
+        executor = self._executor
+        try:
+            try:
+                # Il worker restituisce i bytes: il documento non viene riletto dal disco
+                _, content, error = await self._loop.run_in_executor(
+                    executor, _render_bytes, index, data, output_file
+                )
+            except BrokenProcessPool:
+                # Un worker è terminato in modo anomalo: il pool viene ricreato una
+                # sola volta, dal primo dei documenti in corso che se ne accorge
+                if self._executor is executor:
+                    print("Errore nel pool di processi: riavvio dei worker")
+                    executor.shutdown(wait=False)
+                    self._start_pool()
+                raise
+            if error:
+                return index, filename, None, error
+            instrumentation.count("api.documenti")
+            return index, filename, content, None
+        except Exception as e:
+            return index, filename, None, str(e)
+        finally:
+            self.running -= 1
+            self._slots.release()
+
+    async def _send_document(self, request, writer, task, numbered):
+        await self._slots.acquire()
+        index, name, content, error = await self._render_document(*task)
+        if error:
+            await self._release_unused([task], numbered, set())
+            raise HttpError(500, error)
+
+        data = task[1]
+        headers = {
+            "Content-Type": CONTENT_TYPES.get(os.path.splitext(name)[1], "application/octet-stream"),
+            "Content-Length": str(len(content)),
+            "Content-Disposition": f'attachment; filename="{name}"',
+            "X-Manrev-Numero": data["Numero"],
+            "X-Manrev-Anno": data["anno"]
+        }
+        writer.write(self._head(200, headers, request.keep_alive))
+        view = memoryview(content)
+        for offset in range(0, len(view), STREAM_CHUNK):
+            writer.write(view[offset:offset + STREAM_CHUNK])
+            # Un client lento rallenta solo la propria risposta
+            await writer.drain()
+        return True
+
+    async def _send_zip(self, request, writer, tasks, failures, numbered):
+        # HTTP/1.0 non conosce la codifica a blocchi: la fine dello zip è la chiusura della connessione
+        chunked = request.version != "HTTP/1.0"
+        keep_alive = request.keep_alive and chunked
+        headers = {
+            "Content-Type": "application/zip",
+            "Content-Disposition": 'attachment; filename="documenti.zip"'
+        }
+        if chunked:
+            headers["Transfer-Encoding"] = "chunked"
+        writer.write(self._head(200, headers, keep_alive))
+
+        buffer = io.BytesIO()
+        archive = ZipStreamWriter(buffer)
+        results = asyncio.Queue()
+        submitted = []
+        generated = set()
+
+        async def submit():
+            # Un documento alla volta: le altre richieste si alternano con questa nel pool
+            for task in tasks:
+                await self._slots.acquire()
+                future = asyncio.ensure_future(self._render_document(*task))
+                future.add_done_callback(results.put_nowait)
+                submitted.append(future)
+
+        def on_rendered(future):
+            if future.cancelled():
+                return
+            index, _, _, error = future.result()
+            if not error:
+                generated.add(index)
+
+        producer = asyncio.ensure_future(submit())
+        try:
+            for _ in tasks:
+                future = await results.get()
+                on_rendered(future)
+                index, name, content, error = future.result()
+                if error:
+                    failures.append((index, error))
+                    continue
+                # I documenti sono già compressi: vengono memorizzati così come sono
+                archive.add(ZipEntry(name, content, compress=False))
+                await self._write_chunk(writer, buffer, chunked)
+            if failures:
+                report = "".join(f"documento {index}: {error}\n" for index, error in sorted(failures))
+                archive.add(ZipEntry("errori.txt", report.encode("utf-8")))
+            archive.close()
+            await self._write_chunk(writer, buffer, chunked)
+            if chunked:
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+        finally:
+            # Se il client si disconnette non vengono inviati altri documenti;
+            # quelli già nel pool vengono completati e liberano il proprio posto
+            producer.cancel()
+            if numbered and len(generated) < len(tasks):
+                running = []
+                for future in submitted:
+                    if future.done():
+                        on_rendered(future)
+                    else:
+                        future.add_done_callback(on_rendered)
+                        running.append(future)
+                # In background: la risposta non attende i documenti rimasti nel pool
+                release = asyncio.ensure_future(self._release_unused(tasks, numbered, generated, running))
+                self._releases.add(release)
+                release.add_done_callback(self._releases.discard)
+        return keep_alive
+
+    async def _write_chunk(self, writer, buffer, chunked):
+        """Invia quanto scritto nel buffer dallo zip e lo svuota"""
+        data = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        if not data:
+            return
+        if chunked:
+            writer.write(f"{len(data):x}\r\n".encode("ascii"))
+            writer.write(data)
+            writer.write(b"\r\n")
+        else:
+            writer.write(data)
+        await writer.drain()
+
+    def _head(self, status, headers, keep_alive):
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append(f"Connection: {'keep-alive' if keep_alive else 'close'}")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1", "replace")
+
+    async def _send_json(self, writer, status, content, keep_alive, headers=None):
+        body = json.dumps(content, ensure_ascii=False).encode("utf-8")
+        headers = dict(headers or {})
+        headers["Content-Type"] = "application/json; charset=utf-8"
+        headers["Content-Length"] = str(len(body))
+        writer.write(self._head(status, headers, keep_alive) + body)
+        await writer.drain()
@@ -0,0 +1,332 @@
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from decimal import ROUND_HALF_UP
+from paths import path_manager
+from .amount_words import parse_amount
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    id INTEGER PRIMARY KEY,
+    tipo TEXT NOT NULL,
+    numero TEXT NOT NULL,
+    anno INTEGER,
+    capitolo TEXT,
+    importo TEXT,
+    importo_centesimi INTEGER,
+    descrizione TEXT,
+    data TEXT,
+    luogo TEXT,
+    tesoriere TEXT,
+    presidente TEXT,
+    addetto TEXT,
+    output_path TEXT NOT NULL,
+    content_hash TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_documents_anno_tipo_numero ON documents (anno, tipo, numero);
+CREATE INDEX IF NOT EXISTS idx_documents_capitolo ON documents (capitolo);
+CREATE INDEX IF NOT EXISTS idx_documents_output_path ON documents (output_path);
+CREATE TABLE IF NOT EXISTS numbering (
+    anno INTEGER NOT NULL,
+    tipo TEXT NOT NULL,
+    last INTEGER NOT NULL,
+    PRIMARY KEY (anno, tipo)
+);
+CREATE TABLE IF NOT EXISTS print_jobs (
+    id INTEGER PRIMARY KEY,
+    file_path TEXT NOT NULL,
+    printer TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    error TEXT,
+    created_at TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_print_jobs_status ON print_jobs (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS scanned_files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    documents INTEGER NOT NULL,
+    error TEXT,
+    scanned_at TEXT NOT NULL
+);
+"""
+
+# Indice full-text (FTS5) su descrizione, capitolo e tipo, sincronizzato
+# con la tabella documents tramite trigger
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5 (
+    descrizione, capitolo, tipo,
+    content='documents', content_rowid='id',
+    tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+);
+CREATE TRIGGER IF NOT EXISTS documents_fts_insert AFTER INSERT ON documents BEGIN
+    INSERT INTO documents_fts (rowid, descrizione, capitolo, tipo)
+    VALUES (new.id, new.descrizione, new.capitolo, new.tipo);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_fts_delete AFTER DELETE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, descrizione, capitolo, tipo)
+    VALUES ('delete', old.id, old.descrizione, old.capitolo, old.tipo);
+END;
+CREATE TRIGGER IF NOT EXISTS documents_fts_update AFTER UPDATE ON documents BEGIN
+    INSERT INTO documents_fts (documents_fts, rowid, descrizione, capitolo, tipo)
+    VALUES ('delete', old.id, old.descrizione, old.capitolo, old.tipo);
+    INSERT INTO documents_fts (rowid, descrizione, capitolo, tipo)
+    VALUES (new.id, new.descrizione, new.capitolo, new.tipo);
+END;
+"""
+
+COLUMNS = [
+    "tipo", "numero", "anno", "capitolo", "importo", "importo_centesimi", "descrizione",
+    "data", "luogo", "tesoriere", "presidente", "addetto", "output_path", "content_hash", "created_at"
+]
+
+# Massimo intero a 64 bit memorizzabile da SQLite
+MAX_CENTS = 2 ** 63 - 1
+
+def amount_to_cents(amount):
+    """Importo in centesimi (intero), oppure None se non valido"""
+    try:
+        # Stesse regole dell'importo in lettere: "1.234,56", "12,5", float, Decimal
+        cents = (parse_amount(amount) * 100).to_integral_value(rounding=ROUND_HALF_UP)
+    except (ValueError, ArithmeticError):
+        return None
+    # Oltre il limite degli interi SQLite l'inserimento fallirebbe
+    if abs(cents) > MAX_CENTS:
+        return None
+    return int(cents)
+
+def _year(data):
+    try:
+        return int(data.get('anno') or datetime.strptime(data.get('Data', ''), "%d/%m/%Y").year)
+    except (TypeError, ValueError):
+        return None
+
+def payload_to_row(data, output_path, content_hash=None):
+    """Converte il dizionario doc_data nella riga dell'archivio"""
+    return (
+        data.get('Tipo', ''),
+        str(data.get('Numero', '')),
+        _year(data),
+        data.get('Capitolo', ''),
+        str(data.get('Importo in €', '')),
+        amount_to_cents(data.get('Importo in €', '')),
+        data.get('Descrizione del pagamento', ''),
+        data.get('Data', ''),
+        data.get('Luogo', ''),
+        data.get('Il Tesoriere', ''),
+        data.get('Il Presidente', ''),
+        data.get("L'Addetto Contabile", ''),
+        os.path.abspath(output_path),
+        content_hash,
+        datetime.now().isoformat(timespec="seconds")
+    )
+
+def build_match_query(text):
+    """
+    Converte il testo cercato in una query FTS5: ogni parola diventa una
+    ricerca per prefisso e tutte le parole devono essere presenti
+    """
+    terms = []
+    for word in re.findall(r"\w+", text or ""):
+        terms.append(f'"{word}"*')
+    return " ".join(terms)
+
+class ArchiveIndex:
+    """
+    Indice SQLite di tutti i documenti generati.
+
+    Ogni thread usa la propria connessione; il database è in modalità WAL,
+    così più processi (es. generazione parallela) possono scrivere insieme.
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = db_path or os.path.join(path_manager.app_data_dir, "manrev_archive.db")
+        self._local = threading.local()
+        self._schema_ready = False
+        self._schema_lock = threading.Lock()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        # Una connessione ereditata con fork non va riutilizzata nel processo figlio
+        if connection is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            connection = sqlite3.connect(self.db_path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with self._schema_lock:
+                if not self._schema_ready:
+                    self.create_schema(connection)
+                    self._schema_ready = True
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def create_schema(self, connection):
+        """Crea tabelle e indici se non esistono"""
+        connection.executescript(SCHEMA)
+        fts_exists = connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'documents_fts'"
+        ).fetchone()
+        connection.executescript(FTS_SCHEMA)
+        if not fts_exists:
+            # Archivio creato da una versione precedente: indicizza i documenti presenti
+            with connection:
+                connection.execute("INSERT INTO documents_fts (documents_fts) VALUES ('rebuild')")
+
+    def record(self, data, output_path, content_hash=None):
+        """Registra un documento generato (sostituisce una voce esistente per lo stesso file)"""
+        self.record_many([data], output_path, content_hash)
+
+    def record_many(self, payloads, output_path, content_hash=None):
+        """Registra più documenti contenuti nello stesso file (es. documento unico)"""
+        try:
+            stat = os.stat(output_path)
+        except OSError:
+            stat = None
+        with self.connection as connection:
+            self._store(connection, payloads, output_path, content_hash, stat)
+
+    def record_scanned(self, results):
+        """
+        Registra in una sola transazione i file letti dall'importazione.
+        results è un iterabile di tuple (path, stat, payloads, content_hash, errore)
+        """
+        with self.connection as connection:
+            for path, stat, payloads, content_hash, error in results:
+                self._store(connection, payloads, path, content_hash, stat, error)
+
+    def _store(self, connection, payloads, output_path, content_hash, stat, error=None):
+        """Sostituisce i documenti di un file e ne memorizza dimensione e data di modifica"""
+        output_path = os.path.abspath(output_path)
+        rows = [payload_to_row(data, output_path, content_hash) for data in payloads]
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        connection.execute("DELETE FROM documents WHERE output_path = ?", (output_path,))
+        connection.executemany(
+            f"INSERT INTO documents ({', '.join(COLUMNS)}) VALUES ({placeholders})", rows
+        )
+        if stat is not None:
+            # Un file già registrato e non modificato non viene riletto dall'importazione
+            connection.execute(
+                "INSERT OR REPLACE INTO scanned_files VALUES (?, ?, ?, ?, ?, ?)",
+                (output_path, stat.st_mtime_ns, stat.st_size, len(rows), error,
+                 datetime.now().isoformat(timespec="seconds"))
+            )
+
+    def scanned_files(self):
+        """File già letti: percorso -> (mtime_ns, dimensione)"""
+        rows = self.connection.execute("SELECT path, mtime_ns, size FROM scanned_files")
+        return {path: (mtime_ns, size) for path, mtime_ns, size in rows}
+
+    def forget_scanned(self, paths):
+        """Dimentica i file non più presenti su disco (i documenti restano in archivio)"""
+        with self.connection as connection:
+            connection.executemany(
+                "DELETE FROM scanned_files WHERE path = ?", ((path,) for path in paths)
+            )
+
+    def find(self, anno=None, tipo=None, numero=None, capitolo=None, limit=None):
+        """Cerca documenti per anno, tipo, numero e capitolo"""
+        conditions = []
+        params = []
+        for column, value in (("anno", anno), ("tipo", tipo), ("numero", numero), ("capitolo", capitolo)):
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(int(value) if column == "anno" else str(value))
+
+        query = "SELECT * FROM documents"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY anno, tipo, CAST(numero AS INTEGER), numero"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def search(self, text="", anno=None, capitolo=None, min_amount=None, max_amount=None, limit=100):
+        """
+        Ricerca full-text nell'archivio.
+
+        Ogni parola di text è cercata come prefisso ("cancell" trova
+        "cancelleria") in descrizione, capitolo e tipo; i risultati sono
+        ordinati per pertinenza. Gli importi minimo e massimo sono in euro.
+        Restituisce dizionari con i campi del documento, rank e snippet.
+        """
+        conditions = []
+        params = []
+        match = build_match_query(text)
+        if match:
+            query = (
+                "SELECT d.*, bm25(documents_fts, 10.0, 3.0, 1.0) AS rank, "
+                "snippet(documents_fts, 0, '[', ']', '…', 12) AS snippet "
+                "FROM documents_fts JOIN documents d ON d.id = documents_fts.rowid"
+            )
+            conditions.append("documents_fts MATCH ?")
+            params.append(match)
+            order = "rank"
+        else:
+            query = "SELECT d.*, 0 AS rank, d.descrizione AS snippet FROM documents d"
+            order = "d.anno DESC, d.tipo, CAST(d.numero AS INTEGER) DESC"
+
+        if anno is not None:
+            conditions.append("d.anno = ?")
+            params.append(int(anno))
+        if capitolo:
+            conditions.append("d.capitolo = ?")
+            params.append(capitolo)
+        # Un importo non valido (es. ancora in digitazione) non filtra
+        min_cents = amount_to_cents(min_amount) if min_amount is not None else None
+        if min_cents is not None:
+            conditions.append("d.importo_centesimi >= ?")
+            params.append(min_cents)
+        max_cents = amount_to_cents(max_amount) if max_amount is not None else None
+        if max_cents is not None:
+            conditions.append("d.importo_centesimi <= ?")
+            params.append(max_cents)
+
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += f" ORDER BY {order} LIMIT ?"
+        params.append(int(limit))
+        return [dict(row) for row in self.connection.execute(query, params)]
+
+    def years(self):
+        """Anni presenti nell'archivio, dal più recente"""
+        rows = self.connection.execute(
+            "SELECT DISTINCT anno FROM documents WHERE anno IS NOT NULL ORDER BY anno DESC"
+        )
+        return [row[0] for row in rows]
+
+    def chapters(self):
+        """Capitoli presenti nell'archivio"""
+        rows = self.connection.execute(
+            "SELECT DISTINCT capitolo FROM documents WHERE capitolo != '' ORDER BY capitolo"
+        )
+        return [row[0] for row in rows]
+
+    def find_by_path(self, output_path):
+        """Documenti registrati per un file"""
+        rows = self.connection.execute(
+            "SELECT * FROM documents WHERE output_path = ?", (os.path.abspath(output_path),)
+        )
+        return [dict(row) for row in rows]
+
+    def count(self):
+        return self.connection.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def close(self):
+        """Chiude la connessione del thread corrente"""
+        connection = getattr(self._local, "connection", None)
+        if connection is not None and self._local.pid == os.getpid():
+            connection.close()
+            self._local.connection = None
+
+# Istanza singleton dell'archivio
+archive_index = ArchiveIndex()
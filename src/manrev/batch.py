@@ -0,0 +1,311 @@
+import csv
+import json
+import os
+import time
+from datetime import date, datetime
+from paths import path_manager
+from .settings import manrev_settings
+from .generator import generate_documents, generate_merged_document, document_extension
+from .numbering import NumberSequence, normalize_tipo
+
+# Campi obbligatori di ogni riga del registro (stessi del form); senza
+# Numero il documento riceve il prossimo numero della numerazione
+REQUIRED_FIELDS = ["Tipo", "Capitolo", "Importo in €", "Descrizione del pagamento"]
+
+# Campi opzionali con il relativo valore predefinito nelle impostazioni
+DEFAULT_FIELDS = {
+    "Luogo": "default_place",
+    "Il Tesoriere": "default_treasurer",
+    "Il Presidente": "default_president",
+    "L'Addetto Contabile": "default_accountant"
+}
+
+def _cell_to_text(key, value):
+    """Converte il valore di una cella (CSV o XLSX) nel testo atteso dal generatore"""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        value = value.date()
+    if isinstance(value, date):
+        return value.strftime("%d/%m/%Y")
+    if isinstance(value, float):
+        if key == "Importo in €":
+            return f"{value:.2f}".replace('.', ',')
+        if value.is_integer():
+            return str(int(value))
+    return str(value).strip()
+
+def _iter_csv_rows(ledger_path):
+    """Legge un registro CSV una riga alla volta, con il numero della riga nel file"""
+    with open(ledger_path, 'r', encoding='utf-8-sig', newline='') as f:
+        sample = f.read(4096)
+        f.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(f, dialect=dialect)
+        for row in reader:
+            # line_num conta anche le righe vuote saltate dal lettore
+            yield reader.line_num, {
+                (key or "").strip(): _cell_to_text((key or "").strip(), value)
+                for key, value in row.items()
+            }
+
+def _iter_xlsx_rows(ledger_path):
+    """Legge il primo foglio di un registro XLSX una riga alla volta, con il numero della riga nel foglio"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ImportError("La lettura dei file XLSX richiede openpyxl (pip install openpyxl)")
+
+    # read_only evita di caricare l'intero foglio in memoria
+    workbook = load_workbook(ledger_path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        keys = [_cell_to_text(None, key) for key in header]
+        # La riga 1 è l'intestazione
+        for row_number, values in enumerate(rows, start=2):
+            if values is None or all(value is None for value in values):
+                continue
+            yield row_number, {
+                key: _cell_to_text(key, value)
+                for key, value in zip(keys, values) if key
+            }
+    finally:
+        workbook.close()
+
+def json_to_rows(content):
+    """
+    Righe del registro da un contenuto JSON già letto: un oggetto per
+    documento, una lista di oggetti oppure un oggetto con la lista in "documenti"
+    """
+    if isinstance(content, dict):
+        content = content.get("documenti", [content])
+    if not isinstance(content, list):
+        raise ValueError("Il JSON deve contenere un oggetto o una lista di oggetti")
+    rows = []
+    for item in content:
+        if not isinstance(item, dict):
+            raise ValueError("Ogni documento del JSON deve essere un oggetto")
+        rows.append({
+            str(key).strip(): _cell_to_text(str(key).strip(), value)
+            for key, value in item.items()
+        })
+    return rows
+
+def _iter_json_rows(ledger_path):
+    """Legge un registro JSON (vedi json_to_rows); le righe sono numerate da 1, come gli oggetti"""
+    with open(ledger_path, 'r', encoding='utf-8-sig') as f:
+        content = json.load(f)
+    yield from enumerate(json_to_rows(content), start=1)
+
+# Formati del registro: estensione -> funzione che ne legge le righe
+LEDGER_READERS = {
+    ".csv": _iter_csv_rows,
+    ".json": _iter_json_rows,
+    ".xlsx": _iter_xlsx_rows,
+    ".xlsm": _iter_xlsx_rows
+}
+
+def iter_ledger(ledger_path):
+    """
+    Restituisce un iteratore sulle righe del registro (CSV, JSON o XLSX)
+    come coppie (numero di riga, riga): la riga del file o del foglio per
+    CSV e XLSX, la posizione dell'oggetto per JSON
+    """
+    ext = os.path.splitext(ledger_path)[1].lower()
+    if ext not in LEDGER_READERS:
+        raise ValueError(f"Formato del registro non supportato: {ext}")
+    return LEDGER_READERS[ext](ledger_path)
+
+def prepare_row_data(row, numbers=None):
+    """
+    Completa e valida una riga del registro trasformandola nel dizionario
+    doc_data. numbers è la NumberSequence che assegna il numero alle righe
+    che non lo indicano.
+    """
+    data = dict(row)
+
+    missing = [field for field in REQUIRED_FIELDS if not data.get(field)]
+    if missing:
+        raise ValueError(f"Campi obbligatori mancanti: {', '.join(missing)}")
+    data["Tipo"] = normalize_tipo(data["Tipo"])
+
+    for field, setting in DEFAULT_FIELDS.items():
+        if not data.get(field):
+            data[field] = manrev_settings.current_settings.get(setting, "")
+
+    if not data.get("Data"):
+        data["Data"] = datetime.now().strftime("%d/%m/%Y")
+    if not data.get("anno"):
+        try:
+            data["anno"] = datetime.strptime(data["Data"], "%d/%m/%Y").strftime("%Y")
+        except ValueError:
+            year = manrev_settings.current_settings.get("year")
+            if not year:
+                raise ValueError(f"Data non valida (gg/mm/aaaa) e anno non impostato: {data['Data']}")
+            data["anno"] = str(year)
+
+    if numbers is not None:
+        if data.get("Numero"):
+            numbers.observe(data["anno"], data["Tipo"], data["Numero"])
+        else:
+            data["Numero"] = str(numbers.next_number(data["anno"], data["Tipo"]))
+    if not data.get("Numero"):
+        raise ValueError("Campi obbligatori mancanti: Numero")
+
+    return data
+
+def build_output_filename(data):
+    """Nome del file generato, nello stesso formato usato dalla GUI"""
+    try:
+        day = datetime.strptime(data["Data"], "%d/%m/%Y").strftime("%Y%m%d")
+    except ValueError:
+        day = datetime.now().strftime("%Y%m%d")
+    return f"{data['Tipo']}_{data['Numero']}_{day}{document_extension()}"
+
+def get_default_output_dir():
+    """Directory di destinazione predefinita, come nella GUI"""
+    output_dir = manrev_settings.current_settings.get("output_directory", "")
+    return output_dir or path_manager.manrev_dir
+
+class BatchRowResult:
+    """Esito della generazione di una singola riga del registro"""
+
+    def __init__(self, row_number, output_file=None, error=None, data=None):
+        self.row_number = row_number
+        self.output_file = output_file
+        self.error = error
+        # doc_data della riga, ad esempio per preparare la stampa
+        self.data = data
+
+    @property
+    def ok(self):
+        return self.error is None
+
+class BatchReport:
+    """Riepilogo di un'esecuzione batch"""
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.failures = []
+        self.started_at = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, result):
+        if result.ok:
+            self.succeeded += 1
+        else:
+            self.failed += 1
+            self.failures.append(result)
+        self.elapsed = time.perf_counter() - self.started_at
+
+    @property
+    def total(self):
+        return self.succeeded + self.failed
+
+    @property
+    def documents_per_second(self):
+        if self.elapsed <= 0:
+            return 0.0
+        return self.succeeded / self.elapsed
+
+    def summary(self):
+        return (
+            f"{self.succeeded} documenti generati, {self.failed} errori "
+            f"in {self.elapsed:.2f}s ({self.documents_per_second:.1f} doc/s)"
+        )
+
+def _iter_tasks(ledger_path, output_dir, report, on_result, numbers, payloads):
+    """
+    Prepara le righe del registro per la generazione parallela; payloads
+    riceve il doc_data di ogni riga accodata
+    """
+    for row_number, row in iter_ledger(ledger_path):
+        try:
+            data = prepare_row_data(row, numbers)
+        except Exception as e:
+            _record(report, BatchRowResult(row_number, error=str(e)), on_result)
+            continue
+        payloads[row_number] = data
+        yield row_number, data, os.path.join(output_dir, build_output_filename(data))
+
+def _record(report, result, on_result):
+    report.add(result)
+    if on_result:
+        on_result(result)
+
+def run_batch(ledger_path, output_dir=None, on_result=None, workers=1):
+    """
+    Genera un documento per ogni riga del registro.
+
+    Le righe vengono lette e generate una alla volta, senza caricare l'intero
+    registro in memoria. on_result, se indicato, viene chiamato con il
+    BatchRowResult di ogni riga. Con workers > 1 (o None, un processo per
+    core) la generazione è distribuita su un pool di processi.
+    """
+    output_dir = output_dir or get_default_output_dir()
+    report = BatchReport()
+
+    with NumberSequence() as numbers:
+        if workers != 1:
+            from .parallel import render_parallel
+
+            # I doc_data restano in questo processo solo finché la riga è nel pool
+            payloads = {}
+            tasks = _iter_tasks(ledger_path, output_dir, report, on_result, numbers, payloads)
+            for row_number, output_file, error in render_parallel(tasks, workers):
+                result = BatchRowResult(row_number, output_file, error, payloads.pop(row_number, None))
+                _record(report, result, on_result)
+            return report
+
+        for row_number, row in iter_ledger(ledger_path):
+            try:
+                data = prepare_row_data(row, numbers)
+                output_file = os.path.join(output_dir, build_output_filename(data))
+                result = BatchRowResult(row_number, generate_documents(data, output_file), data=data)
+            except Exception as e:
+                result = BatchRowResult(row_number, error=str(e))
+
+            _record(report, result, on_result)
+
+    return report
+
+def merge_ledger(ledger_path, output_file, on_result=None, backend=None):
+    """
+    Genera un unico documento con tutte le righe valide del registro,
+    una per pagina, da stampare con un solo lavoro di stampa
+    """
+    report = BatchReport()
+    payloads = []
+    rows = []
+
+    with NumberSequence() as numbers:
+        for row_number, row in iter_ledger(ledger_path):
+            try:
+                payloads.append(prepare_row_data(row, numbers))
+                rows.append(row_number)
+            except Exception as e:
+                _record(report, BatchRowResult(row_number, error=str(e)), on_result)
+
+    try:
+        generate_merged_document(payloads, output_file, backend)
+        results = [BatchRowResult(row_number, output_file, data=data) for row_number, data in zip(rows, payloads)]
+    except Exception as e:
+        results = [BatchRowResult(row_number, error=str(e)) for row_number in rows]
+
+    for result in results:
+        _record(report, result, on_result)
+    return report
+
+def print_result(result):
+    """Stampa a terminale l'esito di una riga"""
+    if result.ok:
+        print(f"[OK] riga {result.row_number}: {result.output_file}")
+    else:
+        print(f"[ERRORE] riga {result.row_number}: {result.error}")
@@ -0,0 +1,17 @@
+from .settings import manrev_settings
+
+# Estensione dei file prodotti da ogni backend di generazione. Sta in un
+# modulo a parte perché l'interfaccia deve conoscere il nome del file senza
+# importare il generatore (python-docx, lxml, PIL)
+FILE_EXTENSIONS = {
+    "docx": ".docx",
+    "ooxml": ".docx",
+    "pdf": ".pdf"
+}
+
+def document_extension(backend=None):
+    """Estensione dei file generati con il backend indicato (o quello delle impostazioni)"""
+    backend = backend or manrev_settings.current_settings.get("render_backend", "docx")
+    if backend not in FILE_EXTENSIONS:
+        raise ValueError(f"Backend di generazione sconosciuto: {backend}")
+    return FILE_EXTENSIONS[backend]
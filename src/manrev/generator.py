@@ -1,155 +1,228 @@
 from docx import Document
 from docx.shared import Pt
 from docx.enum.text import WD_ALIGN_PARAGRAPH
+import hashlib
+import io
 import os
-from PyQt5.QtWidgets import QMessageBox, QFileDialog
 from .settings import manrev_settings
+from .archive import archive_index
+from .instrumentation import instrumentation
+from .amount_words import number_to_words_it, amounts_to_words, parse_amount
 from .layout_man_rev import DocumentLayout
+from .skeleton import skeleton_cache
+from .ooxml_writer import ooxml_cache
+from .pdf_writer import pdf_cache
+from .formats import document_extension
 
-def number_to_words_it(number):
-    """Converte un numero in parole in italiano"""
+# Backend di generazione: nome -> cache della parte fissa del documento.
+# "docx" costruisce lo scheletro con python-docx, "ooxml" scrive
+# direttamente il document.xml da template di stringhe, "pdf" disegna
+# direttamente il PDF da stampare
+RENDER_BACKENDS = {
+    "docx": skeleton_cache,
+    "ooxml": ooxml_cache,
+    "pdf": pdf_cache
+}
+
+def build_document(data, importo_in_lettere):
+    """Costruisce il documento mandato/reversale con python-docx"""
+    # Crea il documento
+    doc = Document()
+    layout = DocumentLayout(doc)
+    
+    # Imposta layout base
+    layout.set_margins()
+    
+    # Aggiungi intestazione
+    layout.add_header(data['Tipo'], data['anno'], data['Numero'])
     
-    # Dizionari di conversione
-    unita = {
-        0: "", 1: "uno", 2: "due", 3: "tre", 4: "quattro", 5: "cinque",
-        6: "sei", 7: "sette", 8: "otto", 9: "nove", 10: "dieci",
-        11: "undici", 12: "dodici", 13: "tredici", 14: "quattordici",
-        15: "quindici", 16: "sedici", 17: "diciassette", 18: "diciotto",
-        19: "diciannove"
+    # Aggiungi dettagli
+    details = {
+        'Capitolo': data['Capitolo'],
+        'Importo': data['Importo in €'],
+        'Descrizione': data['Descrizione del pagamento']
     }
+    layout.add_details_table(details)
     
-    decine = {
-        2: "venti", 3: "trenta", 4: "quaranta", 5: "cinquanta",
-        6: "sessanta", 7: "settanta", 8: "ottanta", 9: "novanta"
+    # Aggiungi importo in lettere
+    layout.add_amount_text(importo_in_lettere)
+    
+    # Aggiungi firme
+    signatures = {
+        'Il Tesoriere': data['Il Tesoriere'],
+        'Il Presidente': data['Il Presidente'],
+        "L'Addetto Contabile": data["L'Addetto Contabile"]
     }
+    layout.add_signatures(signatures)
     
-    def converti_decine(n):
-        if n <= 19:
-            return unita.get(n, str(n))
-        
-        d = n // 10
-        u = n % 10
-        
-        if d not in decine:
-            return str(n)
-        
-        if u == 0:
-            return decine[d]
-        elif u == 1 or u == 8:
-            return decine[d][:-1] + unita[u]
-        else:
-            return decine[d] + unita[u]
+    # Aggiungi piè di pagina
+    layout.add_footer(data['Luogo'], data['Data'])
     
-    def converti_centinaia(n):
-        c = n // 100
-        r = n % 100
-        
-        if c == 0:
-            return converti_decine(r)
-        elif c == 1:
-            return "cento" + converti_decine(r)
-        else:
-            return unita[c] + "cento" + converti_decine(r)
+    return doc
+
+def _backend_name(backend=None):
+    backend = backend or manrev_settings.current_settings.get("render_backend", "docx")
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(f"Backend di generazione sconosciuto: {backend}")
+    return backend
+
+def get_renderer(backend=None):
+    """Restituisce la parte fissa del documento per il backend indicato"""
+    return RENDER_BACKENDS[_backend_name(backend)].get()
+
+class _HashingWriter:
+    """File in scrittura che calcola l'hash del contenuto mentre lo scrive"""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.f.write(data)
+
+    def hexdigest(self):
+        return self.sha256.hexdigest()
+
+def _archive(payloads, output_file, content_hash):
+    """Registra i documenti generati nell'archivio, senza bloccare la generazione in caso di errore"""
+    try:
+        with instrumentation.timer("archive"):
+            archive_index.record_many(payloads, output_file, content_hash)
+    except Exception as e:
+        print(f"Errore nella registrazione del documento in archivio: {e}")
+
+def amount_in_words(data):
+    """Converte in lettere l'importo di un documento (ValueError se non valido)"""
+    return number_to_words_it(parse_amount(data['Importo in €']))
+
+def render_document(data, stream, backend=None):
+    """
+    Scrive il documento su stream (BytesIO, file, socket...) senza passare
+    dal disco e senza registrarlo in archivio
+    """
+    # Converti l'importo in lettere
+    with instrumentation.timer("amount_in_words"):
+        importo_in_lettere = amount_in_words(data)
     
-    def converti_migliaia(n):
-        k = n // 1000
-        r = n % 1000
-        
-        if k == 0:
-            return converti_centinaia(r)
-        elif k == 1:
-            return "mille" + converti_centinaia(r)
-        else:
-            return converti_decine(k) + "mila" + converti_centinaia(r)
+    # La parte fissa del documento viene costruita una sola volta
+    # per revisione delle impostazioni, qui si inseriscono solo i dati
+    skeleton = get_renderer(backend)
     
+    with instrumentation.timer("render"):
+        skeleton.render(data, importo_in_lettere, stream)
+    instrumentation.count("documenti_generati")
+
+# Directory già create da questo processo: su una cartella di rete ogni
+# os.makedirs è un'andata e ritorno verso il server
+_known_dirs = set()
+
+def _write_file(output_file, content):
+    """Salva il contenuto con una sola scrittura, creando la directory se serve"""
+    directory = os.path.dirname(output_file)
+    if directory not in _known_dirs:
+        os.makedirs(directory, exist_ok=True)
+        _known_dirs.add(directory)
     try:
-        # Gestione input non valido
-        try:
-            number = float(str(number).replace(',', '.').strip())
-        except:
-            return f"{number} euro"
-        
-        # Separazione parte intera e decimale
-        int_part = int(abs(number))
-        dec_part = int(round((abs(number) - int_part) * 100))
-        
-        # Caso zero
-        if int_part == 0 and dec_part == 0:
-            return "zero euro"
-        
-        result = []
-        
-        # Parte intera
-        if int_part > 0:
-            if int_part > 99999:
-                result.append(str(int_part))
-            else:
-                result.append(converti_migliaia(int_part))
-            result.append("euro")
-        
-        # Decimali
-        if dec_part > 0:
-            if result:
-                result.append("e")
-            if dec_part < 10:
-                result.append("zero")
-            result.append(str(dec_part))
-            result.append("centesimi")
-        
-        return " ".join(result)
-        
+        f = open(output_file, 'wb')
+    except FileNotFoundError:
+        # Directory cancellata dopo la prima creazione
+        os.makedirs(directory, exist_ok=True)
+        f = open(output_file, 'wb')
+    with f:
+        f.write(content)
+    instrumentation.count("byte_scritti", len(content))
+
+def _generate(data, output_file, backend):
+    buffer = io.BytesIO()
+    render_document(data, buffer, backend)
+    content = buffer.getvalue()
+    if output_file:
+        _write_file(output_file, content)
+        _archive([data], output_file, hashlib.sha256(content).hexdigest())
+    return content
+
+@instrumentation.timed("render_document_bytes")
+def render_document_bytes(data, output_file=None, backend=None):
+    """
+    Genera il documento in memoria e ne restituisce il contenuto (bytes),
+    da comprimere, inviare o stampare senza file temporanei. Con
+    output_file il documento viene anche salvato e registrato in archivio.
+    """
+    try:
+        return _generate(data, output_file, backend)
     except Exception as e:
-        print(f"Errore nella conversione del numero {number}: {str(e)}")
-        return f"{number} euro"
+        raise Exception(f"Errore nella generazione del documento: {str(e)}")
 
-def generate_documents(data, output_file, print_after=False):
+@instrumentation.timed("generate_documents")
+def generate_documents(data, output_file, print_after=False, backend=None):
     """Genera il documento mandato/reversale"""
     try:
-        # Crea il documento
-        doc = Document()
-        layout = DocumentLayout(doc)
+        # Il documento viene composto in memoria e salvato con una sola scrittura
+        _generate(data, output_file, backend)
+        return output_file
         
-        # Imposta layout base
-        layout.set_margins()
+    except Exception as e:
+        raise Exception(f"Errore nella generazione del documento: {str(e)}")
+
+@instrumentation.timed("generate_merged_document")
+def generate_merged_document(payloads, output_file, backend=None):
+    """
+    Genera un unico documento con un mandato/reversale per pagina.
+    Stili e immagini sono condivisi, così il file può essere stampato
+    con un solo lavoro di stampa.
+    """
+    try:
+        payloads = list(payloads)
+        # Ogni importo distinto del registro viene convertito una sola volta
+        amounts = [parse_amount(data['Importo in €']) for data in payloads]
+        items = list(zip(payloads, amounts_to_words(amounts)))
+        if not items:
+            raise ValueError("Nessun documento da unire")
         
-        # Aggiungi intestazione
-        layout.add_header(data['Tipo'], data['anno'], data['Numero'])
+        skeleton = get_renderer(backend)
         
-        # Aggiungi dettagli
-        details = {
-            'Capitolo': data['Capitolo'],
-            'Importo': data['Importo in €'],
-            'Descrizione': data['Descrizione del pagamento']
-        }
-        layout.add_details_table(details)
-        
-        # Converti e aggiungi importo in lettere
-        importo_str = str(data['Importo in €'])
-        importo_numerico = float(importo_str.replace(',', '.'))
-        importo_in_lettere = number_to_words_it(importo_numerico)
-        layout.add_amount_text(importo_in_lettere)
-        
-        # Aggiungi firme
-        signatures = {
-            'Il Tesoriere': data['Il Tesoriere'],
-            'Il Presidente': data['Il Presidente'],
-            "L'Addetto Contabile": data["L'Addetto Contabile"]
-        }
-        layout.add_signatures(signatures)
+        # Crea la directory se non esiste
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
         
-        # Aggiungi piè di pagina
-        layout.add_footer(data['Luogo'], data['Data'])
+        with open(output_file, 'wb') as f:
+            writer = _HashingWriter(f)
+            with instrumentation.timer("render"):
+                skeleton.render_merged(items, writer)
+        instrumentation.count("documenti_generati", len(items))
+        instrumentation.count("byte_scritti", writer.size)
+        
+        _archive(payloads, output_file, writer.hexdigest())
+        
+        return output_file
+        
+    except Exception as e:
+        raise Exception(f"Errore nella generazione del documento unico: {str(e)}")
+
+@instrumentation.timed("generate_print_pdf")
+def generate_print_pdf(payloads, output_file):
+    """
+    Scrive in un unico PDF, una pagina per documento, i documenti da inviare
+    direttamente a lp: non viene registrato in archivio, perché i documenti
+    sono già stati generati e archiviati
+    """
+    try:
+        payloads = list(payloads)
+        amounts = [parse_amount(data['Importo in €']) for data in payloads]
+        items = list(zip(payloads, amounts_to_words(amounts)))
         
-        # Crea la directory se non esiste
         os.makedirs(os.path.dirname(output_file), exist_ok=True)
         
-        # Salva il documento
-        doc.save(output_file)
+        with open(output_file, 'wb') as f:
+            with instrumentation.timer("render"):
+                pdf_cache.get().render_merged(items, f)
         
         return output_file
         
     except Exception as e:
-        raise Exception(f"Errore nella generazione del documento: {str(e)}")
+        raise Exception(f"Errore nella preparazione del PDF di stampa: {str(e)}")
 
 def prepare_document_data(gui):
     """Prepara i dati dal form per la generazione del documento"""
@@ -180,25 +253,27 @@ def prepare_document_data(gui):
 
 def generate_document(gui):
     """Gestisce il processo di generazione del documento"""
+    from PyQt5.QtWidgets import QMessageBox, QFileDialog
+
     try:
         # Prepara i dati
         data = prepare_document_data(gui)
         
         # Genera il nome del file
-        default_name = f"{data['Tipo']}_{data['Numero']}_{data['Data'].replace('/', '-')}.docx"
+        extension = document_extension()
+        default_name = f"{data['Tipo']}_{data['Numero']}_{data['Data'].replace('/', '-')}{extension}"
         
         # Richiedi il percorso di salvataggio
         file_path, _ = QFileDialog.getSaveFileName(
             gui,
             "Salva Documento",
             os.path.join(manrev_settings.current_settings.get("last_directory", ""), default_name),
-            "Documenti Word (*.docx)"
+            "Documenti PDF (*.pdf)" if extension == ".pdf" else "Documenti Word (*.docx)"
         )
         
         if file_path:
             # Aggiorna last_directory
-            manrev_settings.current_settings["last_directory"] = os.path.dirname(file_path)
-            manrev_settings.save_settings()
+            manrev_settings.update({"last_directory": os.path.dirname(file_path)}, deferred=True)
             
             # Genera il documento
             generate_documents(data, file_path, print_after=gui.print_check.isChecked())
@@ -2,37 +2,79 @@ import json
 from PyQt5.QtWidgets import (
     QMainWindow, QLabel, QPushButton, QVBoxLayout, QWidget, QFileDialog,
     QMessageBox, QMenuBar, QMenu, QAction, QHBoxLayout, QGroupBox,
-    QLineEdit, QTextEdit, QComboBox, QDateEdit, QCheckBox, QDialog
+    QLineEdit, QTextEdit, QComboBox, QDateEdit, QCheckBox,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView,
+    QApplication, QProgressDialog
 )
-from PyQt5.QtCore import Qt, pyqtSignal, QDate
+from PyQt5.QtCore import Qt, pyqtSignal, QDate, QTimer
 from PyQt5.QtGui import QIcon
 from .settings import manrev_settings
-from .generator import generate_documents
 from .about_dialog import AboutDialog
 from utils import get_asset_path, get_data_path
-from .print_aftergen import print_manager
+from .numbering import number_allocator
+from .jobs import GenerationQueue, CANCELED
+from .print_queue import print_spooler
+from .printers import printer_registry
+from .formats import document_extension
 import os
 from datetime import datetime
 
 class ManRevGUI(QMainWindow):
     closed = pyqtSignal()
+    # Emesso anche da altri thread (scritture differite delle impostazioni)
+    settings_changed = pyqtSignal(object)
     STATE_FILENAME = "manrev_form_state.json"
+    # Righe dei lavori terminati mantenute nella tabella dei lavori
+    MAX_FINISHED_JOBS = 50
     
-    def __init__(self, app=None):
+    def __init__(self, app=None, print_services=True):
         super().__init__()
         self.app = app
+        # False per le misure del tempo di avvio: niente stampe né ricerca delle stampanti
+        self.print_services = print_services
         self.setWindowTitle("ManRev - Gestione Mandati e Reversali")
         self.setGeometry(200, 200, 800, 600)
+        # Documenti generati e stampati in background
+        self.jobs = GenerationQueue(self)
+        self.job_rows = {}
+        # Lavori terminati di cui l'interfaccia ha già gestito l'esito
+        self.finished_jobs = []
+        self._closing = False
+        self.jobs.signals.progress.connect(self.on_job_progress)
+        self.jobs.signals.finished.connect(self.on_job_finished)
+        self.jobs.signals.failed.connect(self.on_job_failed)
+        self.jobs.signals.print_failed.connect(self.on_job_print_failed)
+        self.jobs.signals.canceled.connect(self.on_job_canceled)
         self.setup_menu()
         self.setup_ui()
         self.state_path = get_data_path(self.STATE_FILENAME)
         self.load_form_state()
+        self.update_number_placeholder()
+        # I servizi in background partono alla prima iterazione del ciclo
+        # degli eventi, quando la finestra è già visibile
+        QTimer.singleShot(0, self.start_background_services)
+        self.settings_changed.connect(self.apply_settings_changes)
+        self._settings_listener = self.settings_changed.emit
+        manrev_settings.add_listener(self._settings_listener)
         
         if self.app:
             self.apply_theme()
         # Imposta l'icona dell'app)
         self.setWindowIcon(QIcon(get_asset_path('logo_manrev.png')))
 
+    def start_background_services(self):
+        """
+        Riprende i lavori di stampa rimasti in coda, cerca le stampanti e
+        precarica generatore e immagini, così il primo documento e la
+        selezione della stampante non attendono
+        """
+        from .startup import start_preload
+
+        if self.print_services:
+            print_spooler.start()
+            printer_registry.refresh_async()
+        start_preload()
+
     def setup_menu(self):
         menubar = self.menuBar()
         
@@ -44,6 +86,20 @@ class ManRevGUI(QMainWindow):
         generate_action.setShortcut('Ctrl+G')
         file_menu.addAction(generate_action)
         
+        print_queue_action = QAction('Coda di Stampa...', self)
+        print_queue_action.triggered.connect(self.show_print_queue)
+        print_queue_action.setShortcut('Ctrl+P')
+        file_menu.addAction(print_queue_action)
+        
+        search_action = QAction('Cerca nell\'archivio...', self)
+        search_action.triggered.connect(self.show_search)
+        search_action.setShortcut('Ctrl+F')
+        file_menu.addAction(search_action)
+        
+        performance_action = QAction('Statistiche Prestazioni...', self)
+        performance_action.triggered.connect(self.show_performance)
+        file_menu.addAction(performance_action)
+        
         file_menu.addSeparator()
         
         exit_action = QAction('Esci', self)
@@ -75,6 +131,7 @@ class ManRevGUI(QMainWindow):
         
         self.doc_type = QComboBox()
         self.doc_type.addItems(["Mandato di Pagamento", "Reversale di Esazione"])
+        self.doc_type.currentIndexChanged.connect(self.update_number_placeholder)
         doc_layout.addWidget(self.doc_type)
         
         doc_group.setLayout(doc_layout)
@@ -88,6 +145,7 @@ class ManRevGUI(QMainWindow):
         num_row = QHBoxLayout()
         num_row.addWidget(QLabel("Numero:"))
         self.number_input = QLineEdit()
+        self.number_input.setPlaceholderText("Automatico")
         num_row.addWidget(self.number_input)
         info_layout.addLayout(num_row)
         
@@ -174,9 +232,30 @@ class ManRevGUI(QMainWindow):
         self.generate_button = QPushButton("Genera Documento")
         self.generate_button.clicked.connect(self.generate_document)
         layout.addWidget(self.generate_button)
+        
+        # Gruppo Lavori: documenti in generazione e stampa
+        jobs_group = QGroupBox("Lavori")
+        jobs_layout = QVBoxLayout()
+        self.jobs_table = QTableWidget(0, 3)
+        self.jobs_table.setHorizontalHeaderLabels(["Documento", "Stato", "File"])
+        self.jobs_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.jobs_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.jobs_table.verticalHeader().setVisible(False)
+        self.jobs_table.horizontalHeader().setSectionResizeMode(2, QHeaderView.Stretch)
+        self.jobs_table.setMaximumHeight(130)
+        jobs_layout.addWidget(self.jobs_table)
+        
+        self.cancel_job_button = QPushButton("Annulla Lavoro Selezionato")
+        self.cancel_job_button.clicked.connect(self.cancel_selected_job)
+        jobs_layout.addWidget(self.cancel_job_button)
+        jobs_group.setLayout(jobs_layout)
+        layout.addWidget(jobs_group)
 
     def generate_document(self):
-        """Genera il documento"""
+        """Accoda il documento: generazione e stampa avvengono in background"""
+        doc_data = None
+        allocated = None
+        job_id = None
         try:
             # Crea il dizionario con i dati del documento
             doc_data = {
@@ -193,77 +272,232 @@ class ManRevGUI(QMainWindow):
                 'anno': datetime.now().strftime("%Y")
             }
             
+            # Senza numero il documento riceve il prossimo della numerazione
+            if not doc_data['Numero'].strip():
+                allocated = number_allocator.reserve(doc_data['anno'], doc_data['Tipo'], 1)
+                doc_data['Numero'] = str(allocated.start)
+            
             # Prepara il percorso del file
             output_dir = manrev_settings.current_settings.get("output_directory", "")
             if not output_dir:
                 output_dir = os.path.join(os.path.expanduser("~"), "Documents", "Abe", "ManRev")
-            os.makedirs(output_dir, exist_ok=True)
             
-            filename = f"{doc_data['Tipo']}_{doc_data['Numero']}_{datetime.now().strftime('%Y%m%d')}.docx"
+            filename = (f"{doc_data['Tipo']}_{doc_data['Numero']}_"
+                        f"{datetime.now().strftime('%Y%m%d')}{document_extension()}")
             output_file = os.path.join(output_dir, filename)
             
-            # Genera il documento
-            output_file = generate_documents(doc_data, output_file)
-            
-            # Stampa solo se il checkbox è selezionato
+            # La stampante si sceglie subito, la stampa avviene dopo la generazione
+            printer = None
             if self.print_check.isChecked():
-                if print_manager.print_document(output_file, self):
-                    QMessageBox.information(
-                        self,
-                        "Completato",
-                        "Il documento è stato generato e stampato con successo."
-                    )
-                else:
-                    QMessageBox.information(
-                        self,
-                        "Completato",
-                        "Il documento è stato generato ma non stampato."
-                    )
-            else:
-                QMessageBox.information(
-                    self,
-                    "Completato",
-                    f"Il documento è stato generato in:\n{output_file}"
-                )
+                from .print_aftergen import print_manager
+                printer = print_manager.choose_printer(self, doc_data['Tipo'])
+                if printer is None:
+                    # Selezione annullata: il documento non viene generato
+                    self.release_number(doc_data, allocated)
+                    return
+            
+            if allocated is None:
+                # Il contatore supera subito il numero inserito a mano, prima
+                # che un altro operatore possa riceverlo
+                number_allocator.observe(doc_data['anno'], doc_data['Tipo'], doc_data['Numero'])
+            
+            job_id = self.jobs.submit(doc_data, output_file, printer)
+            self.add_job_row(job_id, doc_data, allocated)
+            self.update_number_placeholder()
+            self.statusBar().showMessage(
+                f"{doc_data['Tipo']} N. {doc_data['Numero']} in generazione", 5000
+            )
             
         except Exception as e:
+            # Dopo l'accodamento il numero appartiene al lavoro
+            if doc_data is not None and job_id is None:
+                self.release_number(doc_data, allocated)
             QMessageBox.critical(
                 self,
                 "Errore",
                 f"Errore durante la generazione del documento:\n{str(e)}"
             )
 
+    def add_job_row(self, job_id, doc_data, allocated):
+        row = self.jobs_table.rowCount()
+        self.jobs_table.insertRow(row)
+        item = QTableWidgetItem(f"{doc_data['Tipo']} N. {doc_data['Numero']}")
+        self.jobs_table.setItem(row, 0, item)
+        self.jobs_table.setItem(row, 1, QTableWidgetItem("In coda"))
+        self.jobs_table.setItem(row, 2, QTableWidgetItem(""))
+        # La cella e non l'indice: le righe si spostano quando le vecchie vengono tolte
+        self.job_rows[job_id] = (item, doc_data, allocated)
+        self.jobs_table.scrollToBottom()
+
+    def set_job_status(self, job_id, status, output_file=None):
+        row = self.job_rows[job_id][0].row()
+        self.jobs_table.item(row, 1).setText(status)
+        if output_file:
+            self.jobs_table.item(row, 2).setText(output_file)
+
+    def job_ended(self, job_id):
+        """Registra un lavoro terminato e toglie i più vecchi oltre MAX_FINISHED_JOBS"""
+        self.finished_jobs.append(job_id)
+        while len(self.finished_jobs) > self.MAX_FINISHED_JOBS:
+            old_id = self.finished_jobs.pop(0)
+            item = self.job_rows.pop(old_id)[0]
+            self.jobs_table.removeRow(item.row())
+            self.jobs.forget(old_id)
+
+    def on_job_progress(self, job_id, status, percent):
+        self.set_job_status(job_id, status)
+
+    def on_job_finished(self, job_id, output_file, queued):
+        if queued:
+            status = "Generato, in coda di stampa"
+        elif self.jobs.jobs[job_id].status == CANCELED:
+            status = "Generato, stampa annullata"
+        else:
+            status = "Generato"
+        self.set_job_status(job_id, status, output_file)
+        self.job_ended(job_id)
+
+    def on_job_failed(self, job_id, error):
+        # Solo se la generazione non è riuscita: il numero non è stato usato
+        _, doc_data, allocated = self.job_rows[job_id]
+        self.release_number(doc_data, allocated)
+        self.set_job_status(job_id, "Errore")
+        self.job_ended(job_id)
+        self.statusBar().showMessage(f"Errore: {error}", 10000)
+        QMessageBox.critical(
+            self,
+            "Errore",
+            f"Errore durante la generazione del documento:\n{error}"
+        )
+
+    def on_job_print_failed(self, job_id, output_file, error):
+        # Il documento è generato e archiviato: il numero non va restituito
+        self.set_job_status(job_id, "Generato, stampa non riuscita", output_file)
+        self.job_ended(job_id)
+        self.statusBar().showMessage(f"Errore di stampa: {error}", 10000)
+        QMessageBox.warning(
+            self,
+            "Errore di stampa",
+            f"Il documento è stato generato ma non è stato possibile stamparlo:\n{error}"
+        )
+
+    def on_job_canceled(self, job_id):
+        _, doc_data, allocated = self.job_rows[job_id]
+        self.release_number(doc_data, allocated)
+        self.set_job_status(job_id, "Annullato")
+        self.job_ended(job_id)
+
+    def release_number(self, doc_data, allocated):
+        """Restituisce il numero di un documento non generato, se è ancora l'ultimo"""
+        if allocated is None:
+            return
+        try:
+            number_allocator.release(doc_data['anno'], doc_data['Tipo'], allocated)
+            self.update_number_placeholder()
+        except Exception as e:
+            print(f"Errore nella numerazione: {str(e)}")
+
+    def cancel_selected_job(self):
+        row = self.jobs_table.currentRow()
+        for job_id, (item, _, _) in self.job_rows.items():
+            if item.row() == row:
+                self.jobs.cancel(job_id)
+                break
+
+    def update_number_placeholder(self, *args):
+        """Mostra il prossimo numero che verrà assegnato se il campo resta vuoto"""
+        try:
+            next_number = number_allocator.peek(datetime.now().strftime("%Y"), self.doc_type.currentText())
+            self.number_input.setPlaceholderText(f"Automatico (N. {next_number})")
+        except Exception as e:
+            print(f"Errore nella lettura della numerazione: {str(e)}")
+
     def show_settings(self):
-        from .settings import SettingsDialog
+        from .settings_dialog import SettingsDialog
         dialog = SettingsDialog(self)
-        if dialog.exec_() == QDialog.Accepted:
-            # Aggiorna i valori predefiniti
-            self.place_input.setText(manrev_settings.current_settings["default_place"])
-            self.treasurer_input.setText(manrev_settings.current_settings["default_treasurer"])
-            self.president_input.setText(manrev_settings.current_settings["default_president"])
-            self.accountant_input.setText(manrev_settings.current_settings["default_accountant"])
-            # Aggiorna la lista dei capitoli
+        # I campi del form vengono aggiornati da apply_settings_changes
+        dialog.exec_()
+
+    def apply_settings_changes(self, changed):
+        """Aggiorna il form quando cambiano le impostazioni (anche da un'altra istanza)"""
+        # Aggiorna i valori predefiniti
+        defaults = {
+            "default_place": self.place_input,
+            "default_treasurer": self.treasurer_input,
+            "default_president": self.president_input,
+            "default_accountant": self.accountant_input
+        }
+        for key, widget in defaults.items():
+            if key in changed:
+                widget.setText(manrev_settings.current_settings[key])
+        # Aggiorna la lista dei capitoli
+        if "capitoli" in changed:
             self.chapter_input.clear()
             self.chapter_input.addItems(manrev_settings.current_settings.get("capitoli", []))
 
+    def show_print_queue(self):
+        from .print_queue_dialog import PrintQueueDialog
+        dialog = PrintQueueDialog(self)
+        dialog.exec_()
+
+    def show_search(self):
+        from .search_dialog import SearchDialog
+        dialog = SearchDialog(self)
+        dialog.exec_()
+
+    def show_performance(self):
+        from .performance_dialog import PerformanceDialog
+        dialog = PerformanceDialog(self)
+        dialog.exec_()
+
     def show_about(self):
         dialog = AboutDialog(self)
         dialog.exec_()
 
     def apply_theme(self):
         if self.app:
-            try:
-                import importlib
-                qt_material = importlib.import_module("qt_material")
-                apply_stylesheet = getattr(qt_material, "apply_stylesheet", None)
-                if apply_stylesheet:
-                    apply_stylesheet(self.app, theme="dark_teal.xml")
-            except ImportError:
-                # Il tema opzionale richiede qt-material, continua senza tema se non presente
-                pass
+            # Il tema opzionale richiede qt-material, continua senza tema se non presente;
+            # foglio di stile e icone vengono generati una volta e poi letti dalla cache
+            from .theme_cache import theme_cache
+            theme_cache.apply(self.app, "dark_teal.xml")
+
+    def wait_for_jobs(self):
+        """
+        Attende i documenti già accodati mostrando l'avanzamento, senza
+        bloccare l'interfaccia: gli esiti dei lavori (numeri rilasciati,
+        errori) vengono gestiti mentre si attende. Con Annulla i documenti
+        non ancora avviati non vengono generati.
+        """
+        total = len(self.jobs.pending())
+        progress = QProgressDialog("Completamento dei documenti in corso...", "Annulla", 0, total, self)
+        progress.setWindowTitle("Chiusura")
+        progress.setWindowModality(Qt.WindowModal)
+        progress.setMinimumDuration(0)
+        progress.setAutoReset(False)
+        canceled = False
+        while not self.jobs.wait_for_done(50):
+            if progress.wasCanceled() and not canceled:
+                canceled = True
+                self.jobs.cancel_pending()
+            progress.setValue(total - len(self.jobs.pending()))
+            QApplication.processEvents()
+        # Esiti degli ultimi lavori
+        QApplication.processEvents()
+        progress.close()
 
     def closeEvent(self, event):
+        if self._closing:
+            # Chiusura già in corso (nuova richiesta durante l'attesa dei lavori)
+            event.ignore()
+            return
+        self._closing = True
+        if self.jobs.pending():
+            self.wait_for_jobs()
         self.save_form_state()
+        manrev_settings.remove_listener(self._settings_listener)
+        # I lavori non ancora stampati restano in coda per il prossimo avvio
+        print_spooler.stop(timeout=5)
+        manrev_settings.flush()
         self.closed.emit()
         event.accept()
 
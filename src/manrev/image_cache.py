@@ -0,0 +1,140 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from paths import path_manager
+from .instrumentation import instrumentation
+
+# Estensione dei file in cache secondo il formato dei bytes elaborati
+_SIGNATURES = ((b"\x89PNG", ".png"), (b"\xff\xd8", ".jpg"), (b"GIF8", ".gif"))
+_DISK_EXTENSIONS = tuple(extension for _, extension in _SIGNATURES)
+
+def image_extension(data):
+    """Estensione corrispondente al formato dell'immagine (PNG se non riconosciuto)"""
+    for signature, extension in _SIGNATURES:
+        if data.startswith(signature):
+            return extension
+    return ".png"
+
+class ImageCache:
+    """
+    Cache delle immagini già elaborate (es. firme ridimensionate).
+
+    Le voci sono indicizzate dall'hash del contenuto del file sorgente e dal
+    tipo di elaborazione; l'hash viene ricalcolato solo quando cambiano
+    percorso, data di modifica o dimensione del file. Le immagini elaborate
+    restano in memoria (LRU) e vengono salvate nella cartella temporanea,
+    così anche gli avvii successivi non devono ridecodificarle.
+    """
+
+    def __init__(self, max_entries=32, max_disk_entries=256, max_hashes=256):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.max_hashes = max_hashes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Anche gli hash sono LRU: ogni versione di un file ne aggiunge uno
+        self._content_hashes = OrderedDict()
+        self._cache_dir = None
+
+    @property
+    def cache_dir(self):
+        # La cartella viene creata solo al primo salvataggio
+        if self._cache_dir is None:
+            self._cache_dir = os.path.join(path_manager.get_temp_dir(), "image_cache")
+            os.makedirs(self._cache_dir, exist_ok=True)
+        return self._cache_dir
+
+    def _content_hash(self, path):
+        """Hash del file, ricalcolato solo se percorso, mtime o dimensione cambiano"""
+        stat = os.stat(path)
+        stat_key = (path, stat.st_mtime_ns, stat.st_size)
+        content_hash = self._content_hashes.get(stat_key)
+        if content_hash is None:
+            with open(path, 'rb') as f:
+                content_hash = hashlib.sha256(f.read()).hexdigest()
+            self._content_hashes[stat_key] = content_hash
+            while len(self._content_hashes) > self.max_hashes:
+                self._content_hashes.popitem(last=False)
+        else:
+            self._content_hashes.move_to_end(stat_key)
+        return content_hash
+
+    def get(self, path, variant, process, persist=True):
+        """
+        Restituisce i bytes dell'immagine path elaborata con process.
+
+        variant identifica l'elaborazione (es. "firma-100px") e fa parte della
+        chiave; process riceve il percorso e restituisce i bytes elaborati.
+        """
+        with self._lock:
+            key = f"{self._content_hash(path)}-{variant}"
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                instrumentation.count("image_cache.memoria")
+                return data
+
+        data = self._load_from_disk(key) if persist else None
+        if data is None:
+            instrumentation.count("image_cache.elaborate")
+            data = process(path)
+            if persist:
+                self._save_to_disk(key, data)
+        else:
+            instrumentation.count("image_cache.disco")
+
+        with self._lock:
+            self._entries[key] = data
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+    def _disk_path(self, key, extension):
+        return os.path.join(self.cache_dir, f"{key}{extension}")
+
+    def _load_from_disk(self, key):
+        # Il formato dipende dall'elaborazione (es. foto compatte in JPEG)
+        for extension in _DISK_EXTENSIONS:
+            try:
+                with open(self._disk_path(key, extension), 'rb') as f:
+                    return f.read()
+            except OSError:
+                continue
+        return None
+
+    def _save_to_disk(self, key, data):
+        try:
+            destination = self._disk_path(key, image_extension(data))
+            temp_path = f"{destination}.{os.getpid()}.tmp"
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, destination)
+            self._prune_disk()
+        except OSError as e:
+            print(f"Errore nel salvare l'immagine in cache: {e}")
+
+    def _prune_disk(self):
+        """Rimuove le immagini meno recenti oltre il limite"""
+        entries = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir) if name.endswith(_DISK_EXTENSIONS)
+        ]
+        if len(entries) <= self.max_disk_entries:
+            return
+        entries.sort(key=lambda path: os.path.getmtime(path))
+        for path in entries[:len(entries) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        """Svuota la cache in memoria"""
+        with self._lock:
+            self._entries.clear()
+            self._content_hashes.clear()
+
+# Istanza singleton della cache immagini
+image_cache = ImageCache()
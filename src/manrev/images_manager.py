@@ -8,7 +8,6 @@ class ImagesManager:
     def __init__(self):
         self.base_dir = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
         self.images_dir = os.path.join(self.base_dir, 'data', 'images', 'manrev')
-        self.ensure_directories()
         
     def ensure_directories(self):
         """Assicura che esistano le directory necessarie"""
@@ -60,8 +59,9 @@ class ImagesManager:
         self._optimize_and_save_image(image_path, destination)
         
         # Aggiorna le impostazioni
-        manrev_settings.current_settings['firme'][f'{signature_type}_firma'] = destination
-        manrev_settings.save_settings()
+        firme = dict(manrev_settings.current_settings['firme'])
+        firme[f'{signature_type}_firma'] = destination
+        manrev_settings.update({'firme': firme})
         
         return destination
     
@@ -85,6 +85,8 @@ class ImagesManager:
     
     def _optimize_and_save_image(self, source_path, destination_path):
         """Ottimizza e salva l'immagine"""
+        # Le directory si creano al primo salvataggio, non all'import del modulo
+        self.ensure_directories()
         try:
             with Image.open(source_path) as img:
                 # Converti in RGBA se necessario
@@ -101,6 +103,67 @@ class ImagesManager:
         except Exception as e:
             raise Exception(f"Errore nel processare l'immagine: {str(e)}")
     
+    def optimize_for_print(self, image_data, printed_width_cm, dpi=300):
+        """
+        Prepara un'immagine da incorporare nei documenti in modalità compatta:
+        la riduce alla risoluzione di stampa, elimina i metadati e usa una PNG
+        a palette quando i colori lo consentono senza perdita.
+        Restituisce i bytes ottimizzati, oppure quelli originali se non più grandi.
+        """
+        try:
+            with Image.open(BytesIO(image_data)) as img:
+                source_format = img.format
+                img.load()
+
+                # Riduci alla larghezza stampata alla risoluzione indicata
+                max_width = round(printed_width_cm / 2.54 * dpi)
+                if img.width > max_width:
+                    ratio = max_width / img.width
+                    img = img.resize((max_width, max(1, round(img.height * ratio))),
+                                     Image.Resampling.LANCZOS)
+
+                output = BytesIO()
+                if source_format == 'JPEG' and img.mode in ('RGB', 'L', 'CMYK'):
+                    # Le foto restano JPEG: una PNG sarebbe molto più grande
+                    if img.mode == 'CMYK':
+                        img = img.convert('RGB')
+                    img.save(output, 'JPEG', quality=90, optimize=True)
+                else:
+                    self._to_lossless_compact_mode(img).save(output, 'PNG', optimize=True)
+
+                optimized = output.getvalue()
+                if len(optimized) >= len(image_data):
+                    return image_data
+                return optimized
+        except Exception as e:
+            raise Exception(f"Errore nell'ottimizzare l'immagine: {str(e)}")
+
+    def _to_lossless_compact_mode(self, img):
+        """Converte in scala di grigi o palette se non si perde alcun colore"""
+        if img.mode == 'P':
+            return img
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGBA')
+            # Con canale alfa completamente opaco si può scartare la trasparenza
+            if img.getextrema()[3][0] == 255:
+                img = img.convert('RGB')
+            else:
+                return img
+        if img.mode == 'L':
+            return img
+
+        colors = img.getcolors(256)
+        if colors is None:
+            return img
+        if all(r == g == b for _, (r, g, b) in colors):
+            return img.convert('L')
+
+        palette_img = Image.new('P', (1, 1))
+        palette = [channel for _, color in colors for channel in color]
+        palette_img.putpalette(palette + palette[:3] * (256 - len(colors)))
+        # Tutti i colori sono nella palette: la conversione è esatta
+        return img.quantize(palette=palette_img, dither=Image.Dither.NONE)
+
     def get_all_signatures(self):
         """Restituisce tutte le firme configurate"""
         signatures = {}
@@ -134,18 +197,19 @@ class ImagesManager:
         try:
             for directory in ['firme', 'timbri', 'loghi']:
                 dir_path = os.path.join(self.images_dir, directory)
+                if not os.path.isdir(dir_path):
+                    continue
                 for file in os.listdir(dir_path):
                     file_path = os.path.join(dir_path, file)
                     if os.path.isfile(file_path):
                         os.remove(file_path)
             
             # Reset delle impostazioni delle firme
-            manrev_settings.current_settings['firme'] = {
+            manrev_settings.update({'firme': {
                 'tesoriere_firma': '',
                 'presidente_firma': '',
                 'addetto_firma': ''
-            }
-            manrev_settings.save_settings()
+            }})
             
             return True
         except Exception:
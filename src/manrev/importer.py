@@ -0,0 +1,250 @@
+import hashlib
+import io
+import os
+import re
+import time
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from paths import path_manager
+from .archive import archive_index
+from .skeleton import DOCUMENT_PART
+
+W_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# File letti da ogni processo per volta e registrati in una sola transazione:
+# un'importazione interrotta riprende dall'ultimo gruppo registrato
+FILES_PER_TASK = 32
+PENDING_PER_WORKER = 4
+# Sotto questa soglia l'avvio dei processi costa più della lettura
+PARALLEL_THRESHOLD = 64
+
+_TITLE_RE = re.compile(r"^(?P<tipo>.+?) N\. (?P<numero>.*)/(?P<anno>\d{4})$")
+_FOOTER_RE = re.compile(r"^(?P<luogo>.*), (?P<data>\d{1,2}/\d{1,2}/\d{4})$")
+AMOUNT_TEXT_PREFIX = "Importo in lettere: "
+
+# Etichette della tabella dettagli -> chiave di doc_data
+DETAIL_FIELDS = {
+    "Capitolo": "Capitolo",
+    "Importo in €": "Importo in €",
+    "Descrizione": "Descrizione del pagamento"
+}
+SIGNATURE_FIELDS = ("Il Tesoriere", "Il Presidente", "L'Addetto Contabile")
+
+def _paragraph_text(paragraph):
+    """Testo di un paragrafo, con tabulazioni e a capo come nel documento"""
+    parts = []
+    for element in paragraph.iter():
+        if element.tag == W_NS + "t":
+            parts.append(element.text or "")
+        elif element.tag == W_NS + "tab":
+            parts.append("\t")
+        elif element.tag in (W_NS + "br", W_NS + "cr"):
+            if element.get(W_NS + "type", "textWrapping") == "textWrapping":
+                parts.append("\n")
+    return "".join(parts)
+
+def _table_rows(table):
+    """Testo delle celle di una tabella, riga per riga"""
+    return [
+        ["\n".join(_paragraph_text(p) for p in cell.iter(W_NS + "p"))
+         for cell in row.findall(W_NS + "tc")]
+        for row in table.findall(W_NS + "tr")
+    ]
+
+def _parse_details(data, rows):
+    for row in rows:
+        if len(row) < 2 or row[0] not in DETAIL_FIELDS:
+            continue
+        value = row[1]
+        if row[0] == "Importo in €" and value.endswith(" €"):
+            value = value[:-2]
+        data[DETAIL_FIELDS[row[0]]] = value
+
+def _parse_signatures(data, rows):
+    for cell in rows[-1] if rows else []:
+        role, _, name = cell.partition("\n")
+        if role in SIGNATURE_FIELDS:
+            data[role] = name
+
+def parse_document_xml(xml):
+    """
+    Ricava i dati dei documenti contenuti nel document.xml di un file
+    generato da ManRev. Un documento unico ne contiene più di uno.
+    """
+    body = ET.fromstring(xml).find(W_NS + "body")
+    if body is None:
+        return []
+
+    documents = []
+    data = None
+    for element in body:
+        if element.tag == W_NS + "p":
+            text = _paragraph_text(element).strip()
+            title = _TITLE_RE.match(text)
+            if title:
+                data = {
+                    "Tipo": title.group("tipo"),
+                    "Numero": title.group("numero"),
+                    "anno": title.group("anno")
+                }
+                documents.append(data)
+            elif data is None:
+                continue
+            elif text.startswith(AMOUNT_TEXT_PREFIX):
+                data["Importo in lettere"] = text[len(AMOUNT_TEXT_PREFIX):]
+            elif "Data" not in data:
+                footer = _FOOTER_RE.match(text)
+                if footer:
+                    data["Luogo"] = footer.group("luogo")
+                    data["Data"] = footer.group("data")
+        elif element.tag == W_NS + "tbl" and data is not None:
+            rows = _table_rows(element)
+            # La prima tabella è quella dei dettagli, la seconda quella delle firme
+            if "Capitolo" not in data:
+                _parse_details(data, rows)
+            else:
+                _parse_signatures(data, rows)
+    return documents
+
+def parse_docx_file(path):
+    """Restituisce (documenti, hash SHA-256 del file)"""
+    with open(path, "rb") as f:
+        content = f.read()
+    with zipfile.ZipFile(io.BytesIO(content)) as package:
+        documents = parse_document_xml(package.read(DOCUMENT_PART))
+    if not documents:
+        raise ValueError("Il file non contiene mandati o reversali")
+    return documents, hashlib.sha256(content).hexdigest()
+
+def _parse_files(paths):
+    """Legge un gruppo di file nel processo worker"""
+    results = []
+    for path in paths:
+        try:
+            documents, content_hash = parse_docx_file(path)
+            results.append((path, documents, content_hash, None))
+        except Exception as e:
+            results.append((path, [], None, str(e)))
+    return results
+
+def iter_docx_files(root):
+    """Percorre ricorsivamente root restituendo (percorso, stat) dei file .docx"""
+    try:
+        entries = list(os.scandir(root))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_docx_files(entry.path)
+            elif entry.name.lower().endswith(".docx") and not entry.name.startswith("~$"):
+                yield os.path.abspath(entry.path), entry.stat()
+        except OSError:
+            continue
+
+class ImportReport:
+    """Riepilogo di un'importazione"""
+
+    def __init__(self):
+        self.found = 0
+        self.unchanged = 0
+        self.imported = 0
+        self.documents = 0
+        self.failed = 0
+        self.failures = []
+        self.removed = 0
+        self.started_at = time.perf_counter()
+        self.elapsed = 0.0
+
+    def add(self, path, documents, error):
+        if error is None:
+            self.imported += 1
+            self.documents += len(documents)
+        else:
+            self.failed += 1
+            self.failures.append((path, error))
+        self.elapsed = time.perf_counter() - self.started_at
+
+    def summary(self):
+        return (
+            f"{self.found} file trovati, {self.unchanged} invariati, {self.imported} importati "
+            f"({self.documents} documenti), {self.failed} non riconosciuti in {self.elapsed:.2f}s"
+        )
+
+class DocumentImporter:
+    """
+    Importa nell'archivio i documenti .docx già presenti su disco.
+
+    L'importazione è incrementale: i file con percorso, data di modifica e
+    dimensione invariati non vengono riletti, e i file già letti restano
+    registrati anche se l'importazione viene interrotta.
+    """
+
+    def __init__(self, archive=archive_index):
+        self.archive = archive
+
+    def _changed_files(self, root, report):
+        scanned = self.archive.scanned_files()
+        prefix = os.path.join(os.path.abspath(root), "")
+        seen = set()
+        changed = []
+        for path, stat in iter_docx_files(root):
+            report.found += 1
+            seen.add(path)
+            if scanned.get(path) == (stat.st_mtime_ns, stat.st_size):
+                report.unchanged += 1
+            else:
+                changed.append((path, stat))
+        # File cancellati o spostati dall'ultima importazione
+        removed = [path for path in scanned if path.startswith(prefix) and path not in seen]
+        if removed:
+            self.archive.forget_scanned(removed)
+        report.removed = len(removed)
+        return changed
+
+    def _parse_parallel(self, paths, workers):
+        chunks = (paths[i:i + FILES_PER_TASK] for i in range(0, len(paths), FILES_PER_TASK))
+        if workers == 1 or len(paths) < PARALLEL_THRESHOLD:
+            for chunk in chunks:
+                yield _parse_files(chunk)
+            return
+
+        max_pending = workers * PENDING_PER_WORKER
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = set()
+            for chunk in chunks:
+                pending.add(executor.submit(_parse_files, chunk))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield future.result()
+            for future in as_completed(pending):
+                yield future.result()
+
+    def run(self, root=None, workers=None, on_result=None):
+        """
+        Importa i file .docx contenuti in root (predefinita la cartella ManRev).
+        on_result(path, documenti, errore) viene chiamata per ogni file letto.
+        """
+        root = root or path_manager.manrev_dir
+        workers = workers or os.cpu_count() or 1
+        report = ImportReport()
+
+        changed = self._changed_files(root, report)
+        stats = dict(changed)
+        for results in self._parse_parallel([path for path, _ in changed], workers):
+            # I file non riconosciuti vengono registrati per non rileggerli ogni volta
+            self.archive.record_scanned(
+                (path, stats[path], documents, content_hash, error)
+                for path, documents, content_hash, error in results
+            )
+            for path, documents, content_hash, error in results:
+                report.add(path, documents, error)
+                if on_result:
+                    on_result(path, documents, error)
+        report.elapsed = time.perf_counter() - report.started_at
+        return report
+
+# Istanza singleton dell'importazione
+document_importer = DocumentImporter()
@@ -0,0 +1,330 @@
+import atexit
+import math
+import os
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from paths import path_manager
+
+# Variabile d'ambiente che attiva la profilazione (ha precedenza sull'impostazione "profiling"):
+# uno o più tra "cprofile" e "tracemalloc", separati da virgola
+PROFILE_ENV = "MANREV_PROFILE"
+PROFILING_MODES = ("cprofile", "tracemalloc")
+
+LOG_FILENAME = "manrev_prestazioni.log"
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+# Operazioni registrate nel log anche senza profilazione: oltre questa durata o fallite
+SLOW_OPERATION_MS = 100
+
+def parse_profiling_modes(value):
+    """Modalità di profilazione attive in una stringa come "cprofile,tracemalloc" """
+    if not value:
+        return frozenset()
+    if isinstance(value, str):
+        value = value.replace(";", ",").split(",")
+    return frozenset(mode.strip().lower() for mode in value if mode.strip().lower() in PROFILING_MODES)
+
+class StageStats:
+    """Tempi aggregati di una fase: totali e ultimi campioni per i percentili"""
+
+    def __init__(self, max_samples):
+        self.count = 0
+        self.total = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.peak_memory = None
+        self.samples = deque(maxlen=max_samples)
+
+    def add(self, elapsed):
+        self.count += 1
+        self.total += elapsed
+        if elapsed < self.min:
+            self.min = elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.samples.append(elapsed)
+
+    def as_dict(self):
+        values = sorted(self.samples)
+
+        def percentile(p):
+            return values[max(1, math.ceil(p / 100 * len(values))) - 1] * 1000
+
+        result = {
+            "count": self.count,
+            "total_ms": self.total * 1000,
+            "mean_ms": self.total / self.count * 1000,
+            "min_ms": self.min * 1000,
+            "max_ms": self.max * 1000,
+            "p50_ms": percentile(50),
+            "p99_ms": percentile(99)
+        }
+        if self.peak_memory is not None:
+            result["peak_kb"] = self.peak_memory / 1024
+        return result
+
+class _Timer:
+    """Misura una fase; la fase più esterna di un thread è un'operazione completa"""
+
+    __slots__ = ("owner", "name", "started_at", "parent", "operation", "children")
+
+    def __init__(self, owner, name):
+        self.owner = owner
+        self.name = name
+
+    def __enter__(self):
+        local = self.owner._local
+        parent = self.parent = getattr(local, "current", None)
+        local.current = self
+        if parent is None:
+            self.operation = self
+            # Tempi di tutte le fasi interne, riportati nel log dell'operazione
+            self.children = {}
+            self.owner._begin_operation()
+        else:
+            self.operation = parent.operation
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.started_at
+        self.owner._local.current = self.parent
+        if self.parent is not None:
+            children = self.operation.children
+            children[self.name] = children.get(self.name, 0.0) + elapsed
+            self.owner._record(self.name, elapsed)
+        else:
+            self.owner._end_operation(self, elapsed, failed=exc_type is not None)
+        return False
+
+class Instrumentation:
+    """
+    Tempi e contatori della generazione e della stampa.
+
+    Ogni fase si misura con `with instrumentation.timer("nome"):` o con il
+    decoratore `@instrumentation.timed("nome")`. La fase più esterna di un
+    thread (es. generate_documents) è un'operazione e può essere profilata con
+    cProfile e/o tracemalloc (impostazione "profiling" o variabile d'ambiente
+    MANREV_PROFILE). Le operazioni lente, fallite o profilate vengono scritte
+    nel log a rotazione in get_logs_dir() con il tempo delle fasi interne;
+    alla chiusura il log riceve il riepilogo di tutte le fasi.
+    """
+
+    def __init__(self, max_samples=1000):
+        self.max_samples = max_samples
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages = {}
+        self._counters = {}
+        self._logger = None
+        self._log_path = None
+        self._profiler = None
+        self._profiler_lock = threading.Lock()
+        self._profiled = False
+        self._modes_source = None
+        self._modes = frozenset()
+        atexit.register(self._at_exit)
+
+    def timer(self, name):
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """Decoratore che misura ogni chiamata della funzione come fase name"""
+        def decorator(function):
+            def wrapper(*args, **kwargs):
+                with _Timer(self, name):
+                    return function(*args, **kwargs)
+            wrapper.__name__ = function.__name__
+            wrapper.__doc__ = function.__doc__
+            wrapper.__wrapped__ = function
+            return wrapper
+        return decorator
+
+    def count(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def _record(self, name, elapsed, peak_memory=None):
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                stage = self._stages[name] = StageStats(self.max_samples)
+            stage.add(elapsed)
+            if peak_memory is not None:
+                stage.peak_memory = max(stage.peak_memory or 0, peak_memory)
+
+    def stats(self):
+        """Istantanea dei tempi per fase (in ms) e dei contatori"""
+        with self._lock:
+            return {
+                "stages": {name: stage.as_dict() for name, stage in self._stages.items()},
+                "counters": dict(self._counters)
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+
+    def profiling_modes(self):
+        """Modalità di profilazione attive: variabile d'ambiente o impostazioni"""
+        value = os.environ.get(PROFILE_ENV)
+        if value is None:
+            from .settings import manrev_settings
+            value = manrev_settings.current_settings.get("profiling", "")
+        # Ricalcolate solo quando il valore cambia: la lettura avviene a ogni operazione
+        if value != self._modes_source:
+            self._modes = parse_profiling_modes(value)
+            self._modes_source = value
+        return self._modes
+
+    def _begin_operation(self):
+        timer = self._local.current
+        modes = self.profiling_modes()
+        self._local.profiling = False
+        self._local.tracing = False
+        self._local.log_all = bool(modes)
+        if "tracemalloc" in modes:
+            import tracemalloc
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self._local.tracing = True
+            self._profiled = True
+        # Un solo profilatore attivo alla volta: le operazioni concorrenti non vengono profilate
+        if "cprofile" in modes and self._profiler_lock.acquire(blocking=False):
+            try:
+                if self._profiler is None:
+                    import cProfile
+                    self._profiler = cProfile.Profile()
+                self._profiler.enable()
+                self._local.profiling = True
+                self._profiled = True
+            except Exception as e:
+                self._profiler_lock.release()
+                self.log(f"Profilazione non disponibile per {timer.name}: {str(e)}")
+
+    def _end_operation(self, timer, elapsed, failed=False):
+        if self._local.profiling:
+            self._profiler.disable()
+            self._profiler_lock.release()
+            self._local.profiling = False
+        peak_memory = None
+        if self._local.tracing:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            self._local.tracing = False
+
+        self._record(timer.name, elapsed, peak_memory)
+        if failed:
+            self.count(f"{timer.name}.errori")
+        # Scrivere ogni documento nel log costerebbe quanto generarlo
+        if not (failed or self._local.log_all or elapsed * 1000 >= SLOW_OPERATION_MS):
+            return
+
+        details = ""
+        if timer.children:
+            details = " | " + ", ".join(
+                f"{name} {child * 1000:.2f} ms" for name, child in timer.children.items()
+            )
+        memory = f" | picco memoria {peak_memory / 1024:.0f} KB" if peak_memory is not None else ""
+        outcome = " (errore)" if failed else ""
+        self.log(f"{timer.name}{outcome} {elapsed * 1000:.2f} ms{details}{memory}")
+
+    @property
+    def log_path(self):
+        if self._log_path is None:
+            self._log_path = os.path.join(path_manager.get_logs_dir(), LOG_FILENAME)
+        return self._log_path
+
+    def _get_logger(self):
+        # Il modulo logging e la cartella dei log servono solo alla prima operazione
+        if self._logger is None:
+            import logging
+            from logging.handlers import RotatingFileHandler
+
+            with self._lock:
+                if self._logger is None:
+                    logger = logging.getLogger("manrev.prestazioni")
+                    logger.setLevel(logging.INFO)
+                    logger.propagate = False
+                    handler = RotatingFileHandler(
+                        self.log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS, encoding="utf-8"
+                    )
+                    handler.setFormatter(logging.Formatter("%(asctime)s [%(process)d] %(message)s"))
+                    logger.addHandler(handler)
+                    self._logger = logger
+        return self._logger
+
+    def log(self, message):
+        """Scrive una riga nel log delle prestazioni, senza mai interrompere il chiamante"""
+        try:
+            self._get_logger().info(message)
+        except Exception as e:
+            print(f"Errore nella scrittura del log delle prestazioni: {str(e)}")
+
+    def dump_profile(self):
+        """
+        Salva nella cartella dei log il profilo cProfile raccolto (.prof e
+        riepilogo delle funzioni più costose) e le allocazioni tracemalloc
+        principali. Restituisce i percorsi dei file scritti.
+        """
+        import io
+        written = []
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        logs_dir = path_manager.get_logs_dir()
+
+        with self._profiler_lock:
+            profiler = self._profiler
+            self._profiler = None
+        if profiler is not None:
+            import pstats
+            prof_path = os.path.join(logs_dir, f"profilo_{timestamp}_{os.getpid()}.prof")
+            profiler.dump_stats(prof_path)
+            summary = io.StringIO()
+            pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(30)
+            with open(prof_path[:-len(".prof")] + ".txt", "w", encoding="utf-8") as f:
+                f.write(summary.getvalue())
+            written.append(prof_path)
+
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            memory_path = os.path.join(logs_dir, f"memoria_{timestamp}_{os.getpid()}.txt")
+            with open(memory_path, "w", encoding="utf-8") as f:
+                current, peak = tracemalloc.get_traced_memory()
+                f.write(f"Memoria tracciata: attuale {current / 1024:.0f} KB, picco {peak / 1024:.0f} KB\n\n")
+                for statistic in snapshot.statistics("lineno")[:30]:
+                    f.write(f"{statistic}\n")
+            written.append(memory_path)
+
+        for path in written:
+            self.log(f"Profilo salvato in {path}")
+        return written
+
+    def summary(self):
+        """Riepilogo testuale dei tempi per fase, una riga per fase"""
+        stats = self.stats()
+        lines = [
+            f"{name}: {stage['count']} chiamate, media {stage['mean_ms']:.2f} ms, "
+            f"p50 {stage['p50_ms']:.2f} ms, p99 {stage['p99_ms']:.2f} ms, max {stage['max_ms']:.2f} ms"
+            for name, stage in sorted(stats["stages"].items())
+        ]
+        lines += [f"{name}: {value}" for name, value in sorted(stats["counters"].items())]
+        return "\n".join(lines)
+
+    def _at_exit(self):
+        # Il riepilogo e il profilo finiscono nel log solo se c'è stato qualcosa da misurare
+        if self._stages:
+            self.log("Riepilogo:\n" + self.summary())
+        if self._profiled:
+            try:
+                self.dump_profile()
+            except Exception as e:
+                print(f"Errore nel salvataggio del profilo: {str(e)}")
+
+# Istanza singleton della strumentazione
+instrumentation = Instrumentation()
@@ -0,0 +1,156 @@
+import itertools
+import threading
+from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+# Stati di un lavoro
+QUEUED = "In coda"
+GENERATING = "Generazione"
+PRINTING = "Invio in stampa"
+DONE = "Completato"
+FAILED = "Errore"
+CANCELED = "Annullato"
+
+class JobSignals(QObject):
+    """Segnali emessi dai lavori: arrivano nel thread dell'interfaccia"""
+    # id del lavoro, stato, avanzamento (0-100)
+    progress = pyqtSignal(int, str, int)
+    # id del lavoro, file generato, inviato alla coda di stampa
+    finished = pyqtSignal(int, str, bool)
+    # id del lavoro, messaggio di errore: il documento non è stato generato
+    failed = pyqtSignal(int, str)
+    # id del lavoro, file generato, messaggio di errore: il documento esiste
+    # (e ha il suo numero), solo l'invio in stampa non è riuscito
+    print_failed = pyqtSignal(int, str, str)
+    # id del lavoro
+    canceled = pyqtSignal(int)
+
+class GenerationJob(QRunnable):
+    """
+    Genera un documento in un thread di lavoro e, se richiesto, lo accoda
+    nella coda di stampa persistente
+    """
+
+    def __init__(self, job_id, doc_data, output_file, printer, signals):
+        super().__init__()
+        self.setAutoDelete(False)
+        self.job_id = job_id
+        self.doc_data = doc_data
+        self.output_file = output_file
+        self.printer = printer
+        self.signals = signals
+        self.status = QUEUED
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """
+        Chiede l'annullamento: ha effetto prima della generazione o prima
+        dell'invio in stampa, non interrompe la generazione già avviata
+        """
+        self._cancel.set()
+
+    @property
+    def canceled(self):
+        return self._cancel.is_set()
+
+    def _set_status(self, status, percent):
+        self.status = status
+        self.signals.progress.emit(self.job_id, status, percent)
+
+    def run(self):
+        try:
+            if self.canceled:
+                self.status = CANCELED
+                self.signals.canceled.emit(self.job_id)
+                return
+            # Importati qui: python-docx e PIL non servono all'avvio dell'interfaccia
+            from .generator import generate_documents
+
+            self._set_status(GENERATING, 10)
+            output_file = generate_documents(self.doc_data, self.output_file)
+        except Exception as e:
+            self.status = FAILED
+            self.signals.failed.emit(self.job_id, str(e))
+            return
+
+        # Da qui il documento è salvato e archiviato: un errore di stampa
+        # non lo annulla e il suo numero resta assegnato
+        queued = False
+        if self.printer is not None:
+            if self.canceled:
+                # Il documento resta generato, si annulla solo la stampa
+                self.status = CANCELED
+                self.signals.finished.emit(self.job_id, output_file, False)
+                return
+            try:
+                from .print_aftergen import print_manager
+
+                self._set_status(PRINTING, 90)
+                # Con la stampa tramite PDF a lp va un PDF scritto direttamente
+                print_manager.enqueue(
+                    [print_manager.prepare_print_file(output_file, [self.doc_data])], self.printer
+                )
+                queued = True
+            except Exception as e:
+                self.status = DONE
+                self.signals.print_failed.emit(self.job_id, output_file, str(e))
+                return
+
+        self._set_status(DONE, 100)
+        self.signals.finished.emit(self.job_id, output_file, queued)
+
+class GenerationQueue(QObject):
+    """
+    Coda dei documenti da generare e stampare in background.
+
+    I lavori vengono eseguiti in ordine su un QThreadPool con un solo thread,
+    così l'interfaccia resta libera; la stampa prosegue nella coda di stampa.
+    """
+
+    def __init__(self, parent=None, max_threads=1):
+        super().__init__(parent)
+        self.signals = JobSignals()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(max_threads)
+        self.jobs = {}
+        self._ids = itertools.count(1)
+
+    def submit(self, doc_data, output_file, printer=None):
+        """Accoda un documento; printer None significa nessuna stampa. Restituisce l'id del lavoro"""
+        job_id = next(self._ids)
+        job = GenerationJob(job_id, dict(doc_data), output_file, printer, self.signals)
+        self.jobs[job_id] = job
+        self.pool.start(job)
+        return job_id
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is None:
+            return False
+        job.cancel()
+        # Un lavoro ancora in coda viene tolto subito dal pool
+        if self.pool.tryTake(job):
+            job.status = CANCELED
+            self.signals.canceled.emit(job_id)
+        return True
+
+    def cancel_pending(self):
+        """Annulla tutti i lavori non ancora terminati; restituisce quanti"""
+        pending = self.pending()
+        for job in pending:
+            self.cancel(job.job_id)
+        return len(pending)
+
+    def forget(self, job_id):
+        """Dimentica un lavoro terminato, così la coda non cresce per tutta la sessione"""
+        job = self.jobs.get(job_id)
+        if job is None or job.status in (QUEUED, GENERATING, PRINTING):
+            return False
+        del self.jobs[job_id]
+        return True
+
+    def pending(self):
+        """Lavori non ancora terminati"""
+        return [job for job in self.jobs.values() if job.status in (QUEUED, GENERATING, PRINTING)]
+
+    def wait_for_done(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
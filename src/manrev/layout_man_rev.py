@@ -5,16 +5,100 @@ from docx.oxml import OxmlElement
 from docx.oxml.ns import qn
 from .images_manager import images_manager
 from .settings import manrev_settings
+from .image_cache import image_cache
+from .instrumentation import instrumentation
 import os
 from PIL import Image
 import io
 
+def _read_sede_image(sede_path):
+    """Legge i bytes dell'immagine della sede"""
+    with open(sede_path, 'rb') as f:
+        return f.read()
+
+def _resize_signature(signature_path):
+    """Ridimensiona un'immagine di firma e la restituisce come PNG"""
+    with Image.open(signature_path) as img:
+        # Converti in RGB se necessario
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        # Ridimensiona mantenendo l'aspect ratio
+        max_width = 100  # pixel
+        ratio = max_width / img.width
+        new_size = (max_width, int(img.height * ratio))
+        img = img.resize(new_size, Image.Resampling.LANCZOS)
+
+        # Salva in un buffer
+        img_byte_arr = io.BytesIO()
+        img.save(img_byte_arr, format='PNG')
+        return img_byte_arr.getvalue()
+
+def get_signature_files():
+    """Dizionario che mappa i ruoli ai file delle firme"""
+    firme = manrev_settings.current_settings.get('firme', {})
+    return {
+        'Il Tesoriere': firme.get('tesoriere_firma', ''),
+        'Il Presidente': firme.get('presidente_firma', ''),
+        "L'Addetto Contabile": firme.get('addetto_firma', '')
+    }
+
+# Larghezza stampata delle immagini e risoluzione usata in modalità compatta
+SEDE_WIDTH_CM = 6
+SIGNATURE_WIDTH_CM = 2.54
+PRINT_DPI = 300
+
+def is_compact_output():
+    """Modalità compatta: immagini ottimizzate per la stampa"""
+    return bool(manrev_settings.current_settings.get("compact_output", False))
+
+def _compact_sede_image(sede_path):
+    return images_manager.optimize_for_print(_read_sede_image(sede_path), SEDE_WIDTH_CM, PRINT_DPI)
+
+def _compact_signature(signature_path):
+    return images_manager.optimize_for_print(
+        _resize_signature(signature_path), SIGNATURE_WIDTH_CM, PRINT_DPI
+    )
+
+@instrumentation.timed("images.sede")
+def load_sede_image(sede_path):
+    """Bytes dell'immagine della sede, letti una sola volta per versione del file"""
+    if is_compact_output():
+        return image_cache.get(sede_path, f"sede-compatta-{PRINT_DPI}dpi", _compact_sede_image)
+    return image_cache.get(sede_path, "sede", _read_sede_image, persist=False)
+
+@instrumentation.timed("images.firma")
+def load_signature_image(signature_path):
+    """PNG della firma già ridimensionata, dalla cache se disponibile"""
+    if is_compact_output():
+        return image_cache.get(signature_path, "firma-100px-compatta", _compact_signature)
+    return image_cache.get(signature_path, "firma-100px", _resize_signature)
+
+def preload_images():
+    """
+    Carica in memoria l'immagine della sede e le firme già ridimensionate,
+    così i documenti successivi non devono rileggerle né ridecodificarle
+    """
+    sede_path = manrev_settings.current_settings.get("sede_image", "")
+    if sede_path and os.path.exists(sede_path):
+        try:
+            load_sede_image(sede_path)
+        except Exception as e:
+            print(f"Errore nel caricamento dell'immagine della sede: {e}")
+
+    for role, signature_path in get_signature_files().items():
+        if signature_path and os.path.exists(signature_path):
+            try:
+                load_signature_image(signature_path)
+            except Exception as e:
+                print(f"Errore nel caricare la firma {role}: {e}")
+
 class DocumentLayout:
     def __init__(self, document):
         self.document = document
         self.sections = document.sections
         self.section = self.sections[0]
     
+    @instrumentation.timed("layout.set_margins")
     def set_margins(self):
         """Imposta i margini del documento"""
         self.section.top_margin = Cm(2)
@@ -22,6 +106,7 @@ class DocumentLayout:
         self.section.left_margin = Cm(2)
         self.section.right_margin = Cm(2)
 
+    @instrumentation.timed("layout.add_header")
     def add_header(self, title, year, number):
         """Aggiunge l'intestazione del documento"""
         # Aggiungi immagine sede se presente
@@ -30,7 +115,8 @@ class DocumentLayout:
             sede_para = self.document.add_paragraph()
             sede_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
             try:
-                sede_para.add_run().add_picture(sede_path, width=Cm(6))
+                sede_image = load_sede_image(sede_path)
+                sede_para.add_run().add_picture(io.BytesIO(sede_image), width=Cm(SEDE_WIDTH_CM))
                 sede_para.add_run("\n")
             except Exception as e:
                 print(f"Errore nel caricamento dell'immagine della sede: {e}")
@@ -42,6 +128,7 @@ class DocumentLayout:
         title_run.bold = True
         title_run.font.size = Pt(14)
 
+    @instrumentation.timed("layout.add_details_table")
     def add_details_table(self, details):
         """Aggiunge la tabella dei dettagli"""
         table = self.document.add_table(rows=len(details), cols=2)
@@ -63,6 +150,7 @@ class DocumentLayout:
             else:
                 cell.text = str(value)
 
+    @instrumentation.timed("layout.add_amount_text")
     def add_amount_text(self, amount_text):
         """Aggiunge l'importo in lettere"""
         para = self.document.add_paragraph()
@@ -71,6 +159,7 @@ class DocumentLayout:
         run.bold = True
         run.font.size = Pt(11)
 
+    @instrumentation.timed("layout.add_signatures")
     def add_signatures(self, signatures):
         """Aggiunge la sezione firme con immagini"""
         # Aggiungi spazio prima delle firme
@@ -80,12 +169,7 @@ class DocumentLayout:
         table = self.document.add_table(rows=2, cols=3)
         table.alignment = WD_ALIGN_PARAGRAPH.CENTER
         
-        # Dizionario che mappa i ruoli ai file delle firme
-        signature_files = {
-            'Il Tesoriere': manrev_settings.current_settings.get('firme', {}).get('tesoriere_firma', ''),
-            'Il Presidente': manrev_settings.current_settings.get('firme', {}).get('presidente_firma', ''),
-            "L'Addetto Contabile": manrev_settings.current_settings.get('firme', {}).get('addetto_firma', '')
-        }
+        signature_files = get_signature_files()
         
         # Prima riga: Immagini delle firme
         for idx, (role, name) in enumerate(signatures.items()):
@@ -96,25 +180,11 @@ class DocumentLayout:
             signature_path = signature_files.get(role, '')
             if signature_path and os.path.exists(signature_path):
                 try:
-                    # Ridimensiona l'immagine
-                    with Image.open(signature_path) as img:
-                        # Converti in RGB se necessario
-                        if img.mode != 'RGB':
-                            img = img.convert('RGB')
-                        # Ridimensiona mantenendo l'aspect ratio
-                        max_width = 100  # pixel
-                        ratio = max_width / img.width
-                        new_size = (max_width, int(img.height * ratio))
-                        img = img.resize(new_size, Image.Resampling.LANCZOS)
-                        
-                        # Salva in un buffer
-                        img_byte_arr = io.BytesIO()
-                        img.save(img_byte_arr, format='PNG')
-                        img_byte_arr.seek(0)
-                        
-                        # Aggiungi al documento
-                        run = paragraph.add_run()
-                        run.add_picture(img_byte_arr, width=Inches(1))
+                    signature_image = load_signature_image(signature_path)
+
+                    # Aggiungi al documento
+                    run = paragraph.add_run()
+                    run.add_picture(io.BytesIO(signature_image), width=Inches(1))
                 except Exception as e:
                     print(f"Errore nel caricare la firma {role}: {e}")
             
@@ -136,6 +206,7 @@ class DocumentLayout:
         # Aggiungi spazio dopo la tabella
         self.document.add_paragraph()
 
+    @instrumentation.timed("layout.add_footer")
     def add_footer(self, place, date):
         """Aggiunge il piè di pagina"""
         footer = self.document.add_paragraph()
@@ -0,0 +1,202 @@
+from .settings import manrev_settings
+from .archive import archive_index
+
+# Contatori dichiarati nelle impostazioni, usati come punto di partenza
+# per l'anno corrente se l'archivio non contiene numeri più alti
+SETTINGS_COUNTERS = {
+    "Mandato di Pagamento": "last_mandato",
+    "Reversale di Esazione": "last_reversale"
+}
+
+def _short_name(tipo):
+    """Forma breve del tipo usata nei registri (Mandato, Reversale)"""
+    return tipo.split()[0]
+
+def normalize_tipo(value):
+    """
+    Tipo del documento nella forma della GUI (le chiavi di SETTINGS_COUNTERS),
+    accettando anche la forma breve e maiuscole diverse: "mandato" ->
+    "Mandato di Pagamento". Ogni tipo ha una sola numerazione.
+    """
+    text = " ".join(str(value or "").split()).lower()
+    for tipo in SETTINGS_COUNTERS:
+        if text in (tipo.lower(), _short_name(tipo).lower()):
+            return tipo
+    raise ValueError(f"Tipo di documento non valido: {value} (ammessi: {', '.join(SETTINGS_COUNTERS)})")
+
+def parse_number(value):
+    """Numero del documento come intero, oppure None se non numerico"""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+class NumberAllocator:
+    """
+    Numerazione progressiva dei documenti per (anno, tipo).
+
+    Il contatore è una riga dell'archivio SQLite aggiornata in una
+    transazione BEGIN IMMEDIATE: più processi e più operatori sullo stesso
+    archivio non ricevono mai lo stesso numero, e un'interruzione non lascia
+    il contatore in uno stato intermedio.
+    """
+
+    def __init__(self, archive=archive_index):
+        self.archive = archive
+
+    def _initial_last(self, connection, anno, tipo):
+        """Ultimo numero già usato, per un (anno, tipo) senza contatore"""
+        # Documenti e contatori registrati con la forma breve del tipo
+        # appartengono alla stessa numerazione
+        row = connection.execute(
+            "SELECT MAX(CAST(numero AS INTEGER)) FROM documents "
+            "WHERE anno = ? AND tipo IN (?, ?) AND numero GLOB '[0-9]*'",
+            (anno, tipo, _short_name(tipo))
+        ).fetchone()
+        legacy = connection.execute(
+            "SELECT MAX(last) FROM numbering WHERE anno = ? AND tipo = ?", (anno, _short_name(tipo))
+        ).fetchone()
+        last = max(row[0] or 0, legacy[0] or 0)
+        settings = manrev_settings.current_settings
+        if anno == settings.get("year") and tipo in SETTINGS_COUNTERS:
+            last = max(last, settings.get(SETTINGS_COUNTERS[tipo], 0) or 0)
+        return last
+
+    def _update(self, anno, tipo, change):
+        """
+        Esegue change(last) -> nuovo last in una transazione esclusiva e
+        restituisce (vecchio last, nuovo last)
+        """
+        anno = int(anno)
+        tipo = normalize_tipo(tipo)
+        connection = self.archive.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT last FROM numbering WHERE anno = ? AND tipo = ?", (anno, tipo)
+            ).fetchone()
+            last = row[0] if row else self._initial_last(connection, anno, tipo)
+            new_last = change(last)
+            if new_last != last or row is None:
+                connection.execute(
+                    "INSERT OR REPLACE INTO numbering (anno, tipo, last) VALUES (?, ?, ?)",
+                    (anno, tipo, new_last)
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return last, new_last
+
+    def next_number(self, anno, tipo):
+        """Assegna il prossimo numero"""
+        return self.reserve(anno, tipo, 1).start
+
+    def reserve(self, anno, tipo, count):
+        """Riserva un blocco di count numeri consecutivi e lo restituisce come range"""
+        if count < 1:
+            raise ValueError("Il numero di documenti da riservare deve essere positivo")
+        last, new_last = self._update(anno, tipo, lambda last: last + count)
+        return range(last + 1, new_last + 1)
+
+    def release(self, anno, tipo, numbers):
+        """
+        Restituisce i numeri non usati di un blocco riservato. Ha effetto
+        solo se nel frattempo nessuno ha riservato numeri successivi,
+        altrimenti restano come buchi nella numerazione.
+        """
+        if not numbers:
+            return False
+        _, new_last = self._update(
+            anno, tipo, lambda last: numbers.start - 1 if last == numbers[-1] else last
+        )
+        return new_last == numbers.start - 1
+
+    def observe(self, anno, tipo, numero):
+        """Fa avanzare il contatore oltre un numero inserito a mano"""
+        number = parse_number(numero)
+        if number is not None:
+            self._update(anno, tipo, lambda last: max(last, number))
+
+    def peek(self, anno, tipo):
+        """Prossimo numero che verrebbe assegnato, senza assegnarlo"""
+        anno = int(anno)
+        tipo = normalize_tipo(tipo)
+        connection = self.archive.connection
+        row = connection.execute(
+            "SELECT last FROM numbering WHERE anno = ? AND tipo = ?", (anno, tipo)
+        ).fetchone()
+        return (row[0] if row else self._initial_last(connection, anno, tipo)) + 1
+
+    def find_gaps(self, anno, tipo):
+        """Numeri assegnati fino all'ultimo per cui non c'è un documento in archivio"""
+        anno = int(anno)
+        tipo = normalize_tipo(tipo)
+        connection = self.archive.connection
+        row = connection.execute(
+            "SELECT last FROM numbering WHERE anno = ? AND tipo = ?", (anno, tipo)
+        ).fetchone()
+        used = set()
+        for (numero,) in connection.execute(
+            "SELECT numero FROM documents WHERE anno = ? AND tipo IN (?, ?)", (anno, tipo, _short_name(tipo))
+        ):
+            number = parse_number(numero)
+            if number is not None:
+                used.add(number)
+        last = max([row[0] if row else 0] + list(used))
+        return [number for number in range(1, last + 1) if number not in used]
+
+class NumberSequence:
+    """
+    Assegna numeri a un lotto di documenti riservandoli a blocchi, così
+    ogni documento non richiede una transazione. Alla chiusura i numeri
+    riservati e non usati vengono restituiti.
+    """
+
+    def __init__(self, allocator=None, block_size=100):
+        self.allocator = allocator or number_allocator
+        self.block_size = block_size
+        self._blocks = {}
+        self._observed = {}
+
+    def next_number(self, anno, tipo):
+        key = (int(anno), normalize_tipo(tipo))
+        # I numeri inseriti a mano nel lotto non vengono assegnati ad altri documenti
+        observed = self._observed.get(key, ())
+        while True:
+            block = self._blocks.get(key)
+            if not block:
+                block = self.allocator.reserve(anno, tipo, self.block_size)
+            number = block[0]
+            self._blocks[key] = block[1:]
+            if number not in observed:
+                return number
+
+    def observe(self, anno, tipo, numero):
+        """
+        Annota un numero inserito a mano: il contatore lo supera subito, così
+        non viene assegnato né da questo lotto né da altri operatori
+        """
+        number = parse_number(numero)
+        if number is not None:
+            key = (int(anno), normalize_tipo(tipo))
+            self._observed.setdefault(key, set()).add(number)
+            self.allocator.observe(anno, tipo, number)
+
+    def close(self):
+        for (anno, tipo), block in self._blocks.items():
+            self.allocator.release(anno, tipo, block)
+        # Il rilascio può riportare il contatore sotto un numero inserito a mano
+        for (anno, tipo), numbers in self._observed.items():
+            self.allocator.observe(anno, tipo, max(numbers))
+        self._blocks = {}
+        self._observed = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+# Istanza singleton della numerazione
+number_allocator = NumberAllocator()
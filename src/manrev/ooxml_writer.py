@@ -0,0 +1,333 @@
+import hashlib
+import io
+import os
+from datetime import datetime, timezone
+from PIL import Image
+from .settings import manrev_settings
+from .instrumentation import instrumentation
+from .layout_man_rev import get_signature_files, load_sede_image, load_signature_image, SEDE_WIDTH_CM
+from .skeleton import SkeletonCache, DOCUMENT_PART, run_text_xml, merge_bodies
+from .zip_writer import ZipEntry, write_zip
+
+# Geometria della pagina in twip: Letter con margini di 2 cm, come DocumentLayout
+PAGE_WIDTH = 12240
+PAGE_HEIGHT = 15840
+PAGE_MARGIN = 1134
+BODY_WIDTH_EMU = 7772400 - 2 * 720000
+
+# Larghezza delle immagini in EMU
+SEDE_WIDTH_EMU = int(SEDE_WIDTH_CM * 360000)
+SIGNATURE_WIDTH_EMU = 914400
+
+SIGNATURE_ROLES = ['Il Tesoriere', 'Il Presidente', "L'Addetto Contabile"]
+
+_XML_HEADER = "<?xml version='1.0' encoding='UTF-8' standalone='yes'?>\n"
+
+_CONTENT_TYPES = _XML_HEADER + (
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Default Extension="png" ContentType="image/png"/>'
+    '<Default Extension="jpeg" ContentType="image/jpeg"/>'
+    '<Default Extension="jpg" ContentType="image/jpeg"/>'
+    '<Default Extension="gif" ContentType="image/gif"/>'
+    '<Override PartName="/word/document.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.document.main+xml"/>'
+    '<Override PartName="/word/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.styles+xml"/>'
+    '<Override PartName="/word/settings.xml" ContentType="application/vnd.openxmlformats-officedocument.wordprocessingml.settings+xml"/>'
+    '<Override PartName="/docProps/core.xml" ContentType="application/vnd.openxmlformats-package.core-properties+xml"/>'
+    '<Override PartName="/docProps/app.xml" ContentType="application/vnd.openxmlformats-officedocument.extended-properties+xml"/>'
+    '</Types>'
+)
+
+_PACKAGE_RELS = _XML_HEADER + (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="word/document.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/package/2006/relationships/metadata/core-properties" Target="docProps/core.xml"/>'
+    '<Relationship Id="rId3" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/extended-properties" Target="docProps/app.xml"/>'
+    '</Relationships>'
+)
+
+_CORE_PROPERTIES = _XML_HEADER + (
+    '<cp:coreProperties xmlns:cp="http://schemas.openxmlformats.org/package/2006/metadata/core-properties" '
+    'xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:dcterms="http://purl.org/dc/terms/" '
+    'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance">'
+    '<dc:creator>ManRev</dc:creator><cp:revision>1</cp:revision>'
+    '<dcterms:created xsi:type="dcterms:W3CDTF">{created}</dcterms:created>'
+    '<dcterms:modified xsi:type="dcterms:W3CDTF">{created}</dcterms:modified>'
+    '</cp:coreProperties>'
+)
+
+_APP_PROPERTIES = _XML_HEADER + (
+    '<Properties xmlns="http://schemas.openxmlformats.org/officeDocument/2006/extended-properties">'
+    '<Application>ManRev</Application></Properties>'
+)
+
+# Stili del modello predefinito di python-docx usati dal layout
+_STYLES = _XML_HEADER + (
+    '<w:styles xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:docDefaults><w:rPrDefault><w:rPr>'
+    '<w:rFonts w:ascii="Cambria" w:eastAsia="Cambria" w:hAnsi="Cambria" w:cs="Times New Roman"/>'
+    '<w:sz w:val="22"/><w:szCs w:val="22"/><w:lang w:val="en-US" w:eastAsia="en-US" w:bidi="ar-SA"/>'
+    '</w:rPr></w:rPrDefault>'
+    '<w:pPrDefault><w:pPr><w:spacing w:after="200" w:line="276" w:lineRule="auto"/></w:pPr></w:pPrDefault>'
+    '</w:docDefaults>'
+    '<w:style w:type="paragraph" w:default="1" w:styleId="Normal"><w:name w:val="Normal"/><w:qFormat/></w:style>'
+    '<w:style w:type="character" w:default="1" w:styleId="DefaultParagraphFont">'
+    '<w:name w:val="Default Paragraph Font"/><w:uiPriority w:val="1"/><w:semiHidden/><w:unhideWhenUsed/></w:style>'
+    '<w:style w:type="table" w:default="1" w:styleId="TableNormal"><w:name w:val="Normal Table"/>'
+    '<w:uiPriority w:val="99"/><w:semiHidden/><w:unhideWhenUsed/><w:tblPr><w:tblInd w:w="0" w:type="dxa"/>'
+    '<w:tblCellMar><w:top w:w="0" w:type="dxa"/><w:left w:w="108" w:type="dxa"/>'
+    '<w:bottom w:w="0" w:type="dxa"/><w:right w:w="108" w:type="dxa"/></w:tblCellMar></w:tblPr></w:style>'
+    '<w:style w:type="numbering" w:default="1" w:styleId="NoList"><w:name w:val="No List"/>'
+    '<w:uiPriority w:val="99"/><w:semiHidden/><w:unhideWhenUsed/></w:style>'
+    '<w:style w:type="table" w:styleId="TableGrid"><w:name w:val="Table Grid"/><w:basedOn w:val="TableNormal"/>'
+    '<w:uiPriority w:val="59"/><w:pPr><w:spacing w:after="0" w:line="240" w:lineRule="auto"/></w:pPr>'
+    '<w:tblPr><w:tblInd w:w="0" w:type="dxa"/><w:tblBorders>'
+    '<w:top w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:left w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:bottom w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:right w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:insideH w:val="single" w:sz="4" w:space="0" w:color="auto"/>'
+    '<w:insideV w:val="single" w:sz="4" w:space="0" w:color="auto"/></w:tblBorders>'
+    '<w:tblCellMar><w:top w:w="0" w:type="dxa"/><w:left w:w="108" w:type="dxa"/>'
+    '<w:bottom w:w="0" w:type="dxa"/><w:right w:w="108" w:type="dxa"/></w:tblCellMar></w:tblPr></w:style>'
+    '</w:styles>'
+)
+
+_SETTINGS = _XML_HEADER + (
+    '<w:settings xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+    '<w:defaultTabStop w:val="720"/><w:characterSpacingControl w:val="doNotCompress"/>'
+    '<w:compat><w:useFELayout/>'
+    '<w:compatSetting w:name="compatibilityMode" w:uri="http://schemas.microsoft.com/office/word" w:val="14"/>'
+    '<w:compatSetting w:name="overrideTableStyleFontSizeAndJustification" w:uri="http://schemas.microsoft.com/office/word" w:val="1"/>'
+    '<w:compatSetting w:name="enableOpenTypeFeatures" w:uri="http://schemas.microsoft.com/office/word" w:val="1"/>'
+    '<w:compatSetting w:name="doNotFlipMirrorIndents" w:uri="http://schemas.microsoft.com/office/word" w:val="1"/>'
+    '</w:compat><w:decimalSymbol w:val="."/><w:listSeparator w:val=","/></w:settings>'
+)
+
+_DOCUMENT_RELS = _XML_HEADER + (
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '<Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/settings" Target="settings.xml"/>'
+    '{images}</Relationships>'
+)
+
+_IMAGE_REL = (
+    '<Relationship Id="{rid}" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/image" '
+    'Target="media/{name}"/>'
+)
+
+_DOCUMENT_START = _XML_HEADER + (
+    '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" '
+    'xmlns:wp="http://schemas.openxmlformats.org/drawingml/2006/wordprocessingDrawing" '
+    'xmlns:a="http://schemas.openxmlformats.org/drawingml/2006/main" '
+    'xmlns:pic="http://schemas.openxmlformats.org/drawingml/2006/picture"><w:body>'
+)
+
+_SECTION = (
+    f'<w:sectPr><w:pgSz w:w="{PAGE_WIDTH}" w:h="{PAGE_HEIGHT}"/>'
+    f'<w:pgMar w:top="{PAGE_MARGIN}" w:right="{PAGE_MARGIN}" w:bottom="{PAGE_MARGIN}" '
+    f'w:left="{PAGE_MARGIN}" w:header="720" w:footer="720" w:gutter="0"/>'
+    '<w:cols w:space="720"/><w:docGrid w:linePitch="360"/></w:sectPr>'
+)
+
+_DOCUMENT_END = _SECTION + '</w:body></w:document>'
+
+_PICTURE = (
+    '<w:r><w:drawing><wp:inline><wp:extent cx="{cx}" cy="{cy}"/>'
+    '<wp:docPr id="{id}" name="Picture {id}"/>'
+    '<wp:cNvGraphicFramePr><a:graphicFrameLocks noChangeAspect="1"/></wp:cNvGraphicFramePr>'
+    '<a:graphic><a:graphicData uri="http://schemas.openxmlformats.org/drawingml/2006/picture">'
+    '<pic:pic><pic:nvPicPr><pic:cNvPr id="0" name="{name}"/><pic:cNvPicPr/></pic:nvPicPr>'
+    '<pic:blipFill><a:blip r:embed="{rid}"/><a:stretch><a:fillRect/></a:stretch></pic:blipFill>'
+    '<pic:spPr><a:xfrm><a:off x="0" y="0"/><a:ext cx="{cx}" cy="{cy}"/></a:xfrm>'
+    '<a:prstGeom prst="rect"/></pic:spPr></pic:pic></a:graphicData></a:graphic>'
+    '</wp:inline></w:drawing></w:r>'
+)
+
+_IMAGE_EXTENSIONS = {'PNG': 'png', 'JPEG': 'jpg', 'GIF': 'gif'}
+
+def _twips(emu):
+    return int(emu / 635)
+
+def _run(text, bold=False, size=None):
+    """Run di testo con le stesse proprietà usate da DocumentLayout"""
+    properties = ""
+    if bold or size:
+        properties = "<w:rPr>" + ("<w:b/>" if bold else "")
+        if size:
+            properties += f'<w:sz w:val="{size * 2}"/>'
+        properties += "</w:rPr>"
+    return f'<w:r>{properties}<w:t xml:space="preserve">{run_text_xml(text)}</w:t></w:r>'
+
+def _paragraph(content="", align=None):
+    if align is None and not content:
+        return "<w:p/>"
+    properties = f'<w:pPr><w:jc w:val="{align}"/></w:pPr>' if align else ""
+    return f"<w:p>{properties}{content}</w:p>"
+
+def _cell(content, width, vertical_center=False):
+    properties = f'<w:tcW w:type="dxa" w:w="{width}"/>'
+    if vertical_center:
+        properties += '<w:vAlign w:val="center"/>'
+    return f"<w:tc><w:tcPr>{properties}</w:tcPr>{content}</w:tc>"
+
+def _table(rows, columns, style=None, align=None):
+    width = _twips(BODY_WIDTH_EMU / columns)
+    properties = f'<w:tblStyle w:val="{style}"/>' if style else ""
+    properties += '<w:tblW w:type="auto" w:w="0"/>'
+    if align:
+        properties += f'<w:jc w:val="{align}"/>'
+    properties += ('<w:tblLook w:firstColumn="1" w:firstRow="1" w:lastColumn="0" '
+                   'w:lastRow="0" w:noHBand="0" w:noVBand="1" w:val="04A0"/>')
+    grid = "".join(f'<w:gridCol w:w="{width}"/>' for _ in range(columns))
+    body = "".join("<w:tr>" + "".join(row) + "</w:tr>" for row in rows)
+    return f"<w:tbl><w:tblPr>{properties}</w:tblPr><w:tblGrid>{grid}</w:tblGrid>{body}</w:tbl>"
+
+def _native_size(image_data):
+    """Dimensioni native in EMU e formato, calcolate come python-docx"""
+    with Image.open(io.BytesIO(image_data)) as img:
+        px_width, px_height = img.size
+        image_format = img.format
+        dpi = img.info.get("dpi", (72, 72))
+    horz_dpi = int(round(dpi[0])) or 72
+    vert_dpi = int(round(dpi[1])) or 72
+    return (int(px_width / horz_dpi * 914400), int(px_height / vert_dpi * 914400), image_format)
+
+class OoxmlPackage:
+    """
+    Parti fisse del pacchetto .docx per una revisione delle impostazioni:
+    stili, impostazioni e immagini vengono preparati e compressi una volta,
+    il document.xml viene scritto direttamente da template di stringhe.
+    """
+
+    def __init__(self, revision=None):
+        self.revision = revision
+        self.year = manrev_settings.current_settings.get('year')
+        self._media = {}
+        self._media_entries = []
+        self._picture_count = 0
+
+        # Intestazione con l'immagine della sede
+        self.sede_xml = ""
+        sede_path = manrev_settings.current_settings.get("sede_image", "")
+        if sede_path and os.path.exists(sede_path):
+            try:
+                picture = self._picture(load_sede_image(sede_path), SEDE_WIDTH_EMU)
+                self.sede_xml = _paragraph(picture + "<w:r><w:br/></w:r>", "center")
+            except Exception as e:
+                print(f"Errore nel caricamento dell'immagine della sede: {e}")
+
+        # Prima riga della tabella firme: le immagini
+        signature_files = get_signature_files()
+        self.signature_cells = []
+        for role in SIGNATURE_ROLES:
+            picture = ""
+            signature_path = signature_files.get(role, '')
+            if signature_path and os.path.exists(signature_path):
+                try:
+                    picture = self._picture(load_signature_image(signature_path), SIGNATURE_WIDTH_EMU)
+                except Exception as e:
+                    print(f"Errore nel caricare la firma {role}: {e}")
+            self.signature_cells.append(
+                _cell(_paragraph(picture, "center"), _twips(BODY_WIDTH_EMU / 3), True)
+            )
+
+        image_rels = "".join(
+            _IMAGE_REL.format(rid=rid, name=name) for rid, name in self._media.values()
+        )
+        created = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+        self.entries_before = [
+            ZipEntry("[Content_Types].xml", _CONTENT_TYPES.encode("utf-8")),
+            ZipEntry("_rels/.rels", _PACKAGE_RELS.encode("utf-8")),
+        ]
+        self.entries_after = [
+            ZipEntry("word/_rels/document.xml.rels",
+                     _DOCUMENT_RELS.format(images=image_rels).encode("utf-8")),
+            ZipEntry("word/styles.xml", _STYLES.encode("utf-8")),
+            ZipEntry("word/settings.xml", _SETTINGS.encode("utf-8")),
+            ZipEntry("docProps/core.xml", _CORE_PROPERTIES.format(created=created).encode("utf-8")),
+            ZipEntry("docProps/app.xml", _APP_PROPERTIES.encode("utf-8")),
+        ] + self._media_entries
+
+    def _picture(self, image_data, width):
+        """Drawing inline dell'immagine; le immagini uguali condividono la stessa parte"""
+        digest = hashlib.sha1(image_data).hexdigest()
+        native_cx, native_cy, image_format = _native_size(image_data)
+        if digest not in self._media:
+            name = f"image{len(self._media) + 1}.{_IMAGE_EXTENSIONS.get(image_format, 'png')}"
+            self._media[digest] = (f"rId{len(self._media) + 3}", name)
+            self._media_entries.append(ZipEntry(f"word/media/{name}", image_data))
+        rid, name = self._media[digest]
+
+        self._picture_count += 1
+        height = int(round(native_cy * width / native_cx))
+        return _PICTURE.format(cx=width, cy=height, id=self._picture_count, name=name, rid=rid)
+
+    def render_body(self, data, importo_in_lettere):
+        """Restituisce il contenuto del <w:body> per un documento"""
+        parts = [self.sede_xml]
+
+        # Titolo e numero
+        parts.append(_paragraph(
+            _run(f"{data['Tipo']} N. {data['Numero']}/{self.year}", bold=True, size=14), "center"
+        ))
+
+        # Tabella dei dettagli
+        width = _twips(BODY_WIDTH_EMU / 2)
+        details = [
+            ('Capitolo', data['Capitolo']),
+            ('Importo in €', f"{data['Importo in €']} €"),
+            ('Descrizione', data['Descrizione del pagamento'])
+        ]
+        parts.append(_table([
+            [_cell(_paragraph(_run(key, bold=True)), width), _cell(_paragraph(_run(str(value))), width)]
+            for key, value in details
+        ], 2, style="TableGrid"))
+
+        # Importo in lettere
+        parts.append(_paragraph(
+            _run(f"Importo in lettere: {importo_in_lettere}", bold=True, size=11), "both"
+        ))
+
+        # Firme
+        parts.append(_paragraph())
+        names = [
+            _cell(_paragraph(_run(f"{role}\n{data[role]}"), "center"), _twips(BODY_WIDTH_EMU / 3), True)
+            for role in SIGNATURE_ROLES
+        ]
+        parts.append(_table([self.signature_cells, names], 3, align="center"))
+        parts.append(_paragraph())
+
+        # Piè di pagina
+        parts.append(_paragraph(_run(f"\n{data['Luogo']}, {data['Data']}"), "left"))
+        return "".join(parts)
+
+    def _write(self, stream, body):
+        document = ZipEntry(DOCUMENT_PART, (_DOCUMENT_START + body + _DOCUMENT_END).encode("utf-8"))
+        with instrumentation.timer("render.zip"):
+            write_zip(stream, self.entries_before + [document] + self.entries_after)
+
+    def render(self, data, importo_in_lettere, stream):
+        """Scrive il pacchetto .docx completo su stream"""
+        with instrumentation.timer("render.body"):
+            body = self.render_body(data, importo_in_lettere)
+        self._write(stream, body)
+
+    def render_merged(self, items, stream):
+        """
+        Scrive su stream un unico .docx con un documento per pagina, che
+        condividono stili e immagini. items è un iterabile di coppie
+        (doc_data, importo_in_lettere)
+        """
+        self._write(stream, merge_bodies(
+            self.render_body(data, importo_in_lettere) for data, importo_in_lettere in items
+        ))
+
+def build_package():
+    """Prepara le parti fisse del pacchetto per la revisione corrente"""
+    return OoxmlPackage(manrev_settings.revision)
+
+# Istanza singleton della cache del backend OOXML
+ooxml_cache = SkeletonCache(build_package)
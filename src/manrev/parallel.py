@@ -0,0 +1,81 @@
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, as_completed, wait
+from .settings import manrev_settings
+from .layout_man_rev import preload_images
+from .generator import RENDER_BACKENDS, _backend_name, generate_documents, render_document_bytes
+
+# Documenti in attesa per ogni processo: tiene occupati i worker
+# senza accodare in memoria l'intero lotto
+PENDING_PER_WORKER = 4
+
+def _init_worker(settings):
+    """Stato caldo del processo: impostazioni, immagini e parte fissa del backend caricati una sola volta"""
+    # Le impostazioni sono quelle del processo principale, comprese
+    # eventuali modifiche non salvate (es. opzioni da riga di comando)
+    manrev_settings.current_settings = settings
+    preload_images()
+    cache = RENDER_BACKENDS[_backend_name()]
+    cache.invalidate()
+    cache.get()
+
+def _init_service_worker(settings):
+    """Worker dei servizi di lunga durata: l'arresto con Ctrl+C lo gestisce il processo principale"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _init_worker(settings)
+
+def _render(key, data, output_file):
+    """Genera un documento nel processo worker"""
+    try:
+        return key, generate_documents(data, output_file), None
+    except Exception as e:
+        return key, None, str(e)
+
+def _render_bytes(key, data, output_file=None):
+    """Genera un documento nel processo worker e ne restituisce il contenuto"""
+    try:
+        return key, render_document_bytes(data, output_file), None
+    except Exception as e:
+        return key, None, str(e)
+
+def default_workers():
+    """Numero di processi predefinito: uno per core"""
+    return os.cpu_count() or 1
+
+def render_parallel(tasks, workers=None):
+    """
+    Genera i documenti distribuendoli su un pool di processi.
+
+    tasks è un iterabile di tuple (chiave, doc_data, output_file) e viene
+    consumato man mano. Per ogni documento restituisce, nell'ordine di
+    completamento, la tupla (chiave, output_file, errore).
+    """
+    workers = workers or default_workers()
+    max_pending = workers * PENDING_PER_WORKER
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(manrev_settings.current_settings,)) as executor:
+        pending = set()
+        for key, data, output_file in tasks:
+            pending.add(executor.submit(_render, key, data, output_file))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        for future in as_completed(pending):
+            yield future.result()
+
+def generate_documents_parallel(payloads, output_files, workers=None):
+    """
+    Genera una lista di documenti in parallelo.
+
+    Restituisce una lista di tuple (output_file, errore) nello stesso ordine
+    dei payload.
+    """
+    tasks = ((index, data, output_file)
+             for index, (data, output_file) in enumerate(zip(payloads, output_files)))
+    results = [None] * len(output_files)
+    for index, output_file, error in render_parallel(tasks, workers):
+        results[index] = (output_file, error)
+    return results
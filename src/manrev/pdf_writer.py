@@ -0,0 +1,432 @@
+import hashlib
+import io
+import os
+import zlib
+from datetime import datetime
+from PIL import Image
+from .settings import manrev_settings
+from .instrumentation import instrumentation
+from .layout_man_rev import get_signature_files, load_sede_image, load_signature_image, SEDE_WIDTH_CM
+from .skeleton import SkeletonCache
+
+# Geometria della pagina in punti: Letter con margini di 2 cm, come DocumentLayout
+POINTS_PER_CM = 72 / 2.54
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+PAGE_MARGIN = 2 * POINTS_PER_CM
+BODY_WIDTH = PAGE_WIDTH - 2 * PAGE_MARGIN
+
+SEDE_WIDTH = SEDE_WIDTH_CM * POINTS_PER_CM
+SIGNATURE_WIDTH = 72
+
+# Spaziatura del modello di Word: corpo 11 pt, interlinea 1,15 e 10 pt dopo
+# ogni paragrafo; nelle celle della tabella dei dettagli interlinea singola
+FONT_SIZE = 11
+LINE_HEIGHT = 1.15
+PARAGRAPH_SPACING = 1.15
+SPACE_AFTER = 10
+CELL_PADDING = 5.4
+BORDER_WIDTH = 0.5
+
+SIGNATURE_ROLES = ['Il Tesoriere', 'Il Presidente', "L'Addetto Contabile"]
+
+# Font standard PDF: ogni lettore e ogni filtro di stampa li contiene,
+# quindi non serve incorporarli. Larghezze in millesimi di em dei codici
+# WinAnsi (cp1252) da 32 a 255, dai file AFM di Adobe
+_REGULAR_WIDTHS = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584, 350,
+    556, 350, 222, 556, 333, 1000, 556, 556, 333, 1000, 667, 333, 1000, 350, 611, 350,
+    350, 222, 222, 333, 333, 350, 556, 1000, 333, 1000, 500, 333, 944, 350, 500, 667,
+    278, 333, 556, 556, 556, 556, 260, 556, 333, 737, 370, 556, 584, 333, 737, 333,
+    400, 584, 333, 333, 333, 556, 537, 278, 333, 333, 365, 556, 834, 834, 834, 611,
+    667, 667, 667, 667, 667, 667, 1000, 722, 667, 667, 667, 667, 278, 278, 278, 278,
+    722, 722, 778, 778, 778, 778, 778, 584, 778, 722, 722, 722, 722, 667, 667, 611,
+    556, 556, 556, 556, 556, 556, 889, 500, 556, 556, 556, 556, 278, 278, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 584, 611, 556, 556, 556, 556, 500, 556, 500
+)
+_BOLD_WIDTHS = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584, 350,
+    556, 350, 278, 556, 500, 1000, 556, 556, 333, 1000, 667, 333, 1000, 350, 611, 350,
+    350, 278, 278, 500, 500, 350, 556, 1000, 333, 1000, 556, 333, 944, 350, 500, 667,
+    278, 333, 556, 556, 556, 556, 280, 556, 333, 737, 370, 556, 584, 333, 737, 333,
+    400, 584, 333, 333, 333, 611, 556, 278, 333, 333, 365, 556, 834, 834, 834, 611,
+    722, 722, 722, 722, 722, 722, 1000, 722, 667, 667, 667, 667, 278, 278, 278, 278,
+    722, 722, 778, 778, 778, 778, 778, 584, 778, 722, 722, 722, 722, 667, 667, 611,
+    556, 556, 556, 556, 556, 556, 889, 556, 556, 556, 556, 556, 278, 278, 278, 278,
+    611, 611, 611, 611, 611, 611, 611, 584, 611, 611, 611, 611, 611, 556, 611, 556
+)
+# Larghezza dei caratteri che WinAnsi non contiene (stampati come ?)
+_MISSING_WIDTH = {False: 556, True: 611}
+
+def _build_widths(widths):
+    """Larghezze indicizzate per carattere Unicode invece che per codice WinAnsi"""
+    table = {}
+    for code, width in enumerate(widths, start=32):
+        char = bytes([code]).decode("cp1252", "ignore")
+        if char:
+            table[char] = width
+    return table
+
+# Font: (nome della risorsa, larghezze)
+_FONTS = {
+    False: ("F1", _build_widths(_REGULAR_WIDTHS)),
+    True: ("F2", _build_widths(_BOLD_WIDTHS))
+}
+
+def char_width(char, bold=False):
+    """Larghezza di un carattere in millesimi di em"""
+    return _FONTS[bold][1].get(char, _MISSING_WIDTH[bold])
+
+def text_width(text, bold=False, size=FONT_SIZE):
+    widths = _FONTS[bold][1]
+    missing = _MISSING_WIDTH[bold]
+    return sum(widths.get(char, missing) for char in text) * size / 1000
+
+def wrap_text(text, width, bold=False, size=FONT_SIZE):
+    """
+    Divide il testo in righe larghe al massimo width punti, rispettando gli
+    a capo. Restituisce coppie (riga, ultima riga del capoverso): l'ultima
+    riga non viene giustificata
+    """
+    lines = []
+    for paragraph in str(text).replace("\r\n", "\n").replace("\r", "\n").split("\n"):
+        paragraph = paragraph.replace("\t", " ")
+        current = ""
+        for word in paragraph.split(" "):
+            candidate = f"{current} {word}" if current else word
+            if not current or text_width(candidate, bold, size) <= width:
+                current = candidate
+                continue
+            lines.append((current, False))
+            current = word
+            # Parole più lunghe della riga: spezzate carattere per carattere
+            while text_width(current, bold, size) > width and len(current) > 1:
+                cut = len(current) - 1
+                while cut > 1 and text_width(current[:cut], bold, size) > width:
+                    cut -= 1
+                lines.append((current[:cut], False))
+                current = current[cut:]
+        lines.append((current, True))
+    return lines
+
+def _pdf_string(text):
+    """Stringa PDF in WinAnsiEncoding (cp1252, che comprende €); i caratteri mancanti diventano ?"""
+    text = "".join(char if char >= " " else " " for char in text)
+    encoded = text.encode("cp1252", "replace").decode("latin-1")
+    return "(" + encoded.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ")"
+
+def _number(value):
+    return f"{value:.2f}".rstrip("0").rstrip(".")
+
+def _image_xobject(image_data):
+    """
+    Immagine come XObject PDF: i JPEG vengono copiati così come sono, gli
+    altri formati decompressi e ricompressi con Flate (trasparenza in una
+    SMask). Restituisce (altezza/larghezza, dizionario, stream, smask)
+    con smask None o (dizionario, stream)
+    """
+    with Image.open(io.BytesIO(image_data)) as img:
+        px_width, px_height = img.size
+        dpi = img.info.get("dpi", (72, 72))
+        # Proporzioni calcolate come python-docx, tenendo conto dei DPI
+        horz_dpi = int(round(dpi[0])) or 72
+        vert_dpi = int(round(dpi[1])) or 72
+        aspect = (px_height / vert_dpi) / (px_width / horz_dpi)
+
+        if img.format == "JPEG" and img.mode in ("RGB", "L"):
+            colorspace = "/DeviceRGB" if img.mode == "RGB" else "/DeviceGray"
+            return aspect, (
+                f"/Type /XObject /Subtype /Image /Width {px_width} /Height {px_height} "
+                f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /DCTDecode"
+            ), image_data, None
+
+        smask = None
+        if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+            img = img.convert("RGBA")
+            alpha = img.getchannel("A")
+            if alpha.getextrema() != (255, 255):
+                smask = (
+                    f"/Type /XObject /Subtype /Image /Width {px_width} /Height {px_height} "
+                    "/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode",
+                    zlib.compress(alpha.tobytes())
+                )
+        if img.mode in ("L", "1"):
+            img = img.convert("L")
+            colorspace = "/DeviceGray"
+        else:
+            img = img.convert("RGB")
+            colorspace = "/DeviceRGB"
+        return aspect, (
+            f"/Type /XObject /Subtype /Image /Width {px_width} /Height {px_height} "
+            f"/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /FlateDecode"
+        ), zlib.compress(img.tobytes()), smask
+
+def _stream_object(dictionary, data):
+    return f"<< {dictionary} /Length {len(data)} >>\nstream\n".encode("latin-1") + data + b"\nendstream"
+
+class _Pages:
+    """Pagine in costruzione: operatori di disegno e posizione verticale corrente"""
+
+    def __init__(self):
+        self.pages = []
+        self.new_page()
+
+    def new_page(self):
+        self.ops = []
+        self.pages.append(self.ops)
+        self.y = PAGE_HEIGHT - PAGE_MARGIN
+
+    def reserve(self, height):
+        """Passa a una nuova pagina se height non entra in quella corrente (se non è vuota)"""
+        if self.y - height < PAGE_MARGIN and self.y < PAGE_HEIGHT - PAGE_MARGIN:
+            self.new_page()
+
+    def text(self, x, baseline, text, bold=False, size=FONT_SIZE, word_spacing=0):
+        font = _FONTS[bold][0]
+        spacing = f"{_number(word_spacing)} Tw " if word_spacing else ""
+        reset = " 0 Tw" if word_spacing else ""
+        self.ops.append(
+            f"BT /{font} {_number(size)} Tf {spacing}{_number(x)} {_number(baseline)} Td "
+            f"{_pdf_string(text)} Tj{reset} ET"
+        )
+
+    def image(self, name, x, y, width, height):
+        self.ops.append(f"q {_number(width)} 0 0 {_number(height)} {_number(x)} {_number(y)} cm /{name} Do Q")
+
+    def rectangle(self, x, y, width, height):
+        self.ops.append(f"{_number(x)} {_number(y)} {_number(width)} {_number(height)} re S")
+
+    def lines(self, lines, left, width, top, bold=False, size=FONT_SIZE, align="left", spacing=1.0):
+        """Disegna righe già divise a partire da top; restituisce l'altezza occupata"""
+        line_height = size * LINE_HEIGHT * spacing
+        # Linea di base: lo spazio sotto è quello dei discendenti
+        descent = size * 0.25
+        y = top
+        for line, last in lines:
+            y -= line_height
+            self.line(line, last, left, width, y + descent, bold, size, align)
+        return top - y
+
+    def line(self, line, last, left, width, baseline, bold, size, align):
+        if not line:
+            return
+        free = width - text_width(line, bold, size)
+        word_spacing = 0
+        if align == "center":
+            left += free / 2
+        elif align == "right":
+            left += free
+        elif align == "both" and not last and line.count(" "):
+            word_spacing = free / line.count(" ")
+        self.text(left, baseline, line, bold, size, word_spacing)
+
+    def paragraph(self, text, bold=False, size=FONT_SIZE, align="left"):
+        """Paragrafo a tutta larghezza, che può proseguire sulla pagina successiva"""
+        line_height = size * LINE_HEIGHT * PARAGRAPH_SPACING
+        for line, last in wrap_text(text, BODY_WIDTH, bold, size):
+            self.reserve(line_height)
+            self.lines([(line, last)], PAGE_MARGIN, BODY_WIDTH, self.y, bold, size, align, PARAGRAPH_SPACING)
+            self.y -= line_height
+        self.y -= SPACE_AFTER
+
+class PdfPackage:
+    """
+    Parti fisse del PDF per una revisione delle impostazioni: font e
+    immagini vengono preparati e compressi una volta e incorporati una sola
+    volta in ogni file, anche quando contiene molti documenti; le pagine
+    vengono disegnate direttamente con gli operatori PDF, senza Word né
+    LibreOffice.
+    """
+
+    def __init__(self, revision=None):
+        self.revision = revision
+        self.year = manrev_settings.current_settings.get('year')
+        # Oggetti fissi numerati da 3: 1 è il catalogo, 2 l'albero delle pagine
+        self._objects = [
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>",
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>"
+        ]
+        self._images = {}
+
+        # Intestazione con l'immagine della sede
+        self.sede = None
+        sede_path = manrev_settings.current_settings.get("sede_image", "")
+        if sede_path and os.path.exists(sede_path):
+            try:
+                self.sede = self._image(load_sede_image(sede_path), SEDE_WIDTH)
+            except Exception as e:
+                print(f"Errore nel caricamento dell'immagine della sede: {e}")
+
+        # Prima riga della tabella firme: le immagini
+        signature_files = get_signature_files()
+        self.signatures = []
+        for role in SIGNATURE_ROLES:
+            signature = None
+            signature_path = signature_files.get(role, '')
+            if signature_path and os.path.exists(signature_path):
+                try:
+                    signature = self._image(load_signature_image(signature_path), SIGNATURE_WIDTH)
+                except Exception as e:
+                    print(f"Errore nel caricare la firma {role}: {e}")
+            self.signatures.append(signature)
+
+        images = " ".join(f"/{name} {number} 0 R" for name, number, aspect in self._images.values())
+        self.pages_attributes = (
+            f"/MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> /XObject << {images} >> >>"
+        )
+
+    def _image(self, image_data, width):
+        """(nome, larghezza, altezza) dell'immagine; le immagini uguali condividono lo stesso oggetto"""
+        digest = hashlib.sha1(image_data).hexdigest()
+        if digest not in self._images:
+            aspect, dictionary, data, smask = _image_xobject(image_data)
+            if smask is not None:
+                self._objects.append(_stream_object(*smask))
+                dictionary += f" /SMask {len(self._objects) + 2} 0 R"
+            self._objects.append(_stream_object(dictionary, data))
+            self._images[digest] = (f"Im{len(self._images) + 1}", len(self._objects) + 2, aspect)
+        name, number, aspect = self._images[digest]
+        return name, width, width * aspect
+
+    def layout(self, data, importo_in_lettere, pages):
+        """Disegna un documento sulle pagine, a partire dalla posizione corrente"""
+        # Intestazione con l'immagine della sede, seguita da un a capo
+        if self.sede is not None:
+            name, width, height = self.sede
+            pages.reserve(height)
+            pages.image(name, (PAGE_WIDTH - width) / 2, pages.y - height, width, height)
+            pages.y -= height + FONT_SIZE * LINE_HEIGHT * PARAGRAPH_SPACING + SPACE_AFTER
+
+        # Titolo e numero
+        pages.paragraph(f"{data['Tipo']} N. {data['Numero']}/{self.year}", bold=True, size=14, align="center")
+
+        # Tabella dei dettagli, con bordi e interlinea singola
+        column = BODY_WIDTH / 2
+        cell_width = column - 2 * CELL_PADDING
+        details = [
+            ('Capitolo', data['Capitolo']),
+            ('Importo in €', f"{data['Importo in €']} €"),
+            ('Descrizione', data['Descrizione del pagamento'])
+        ]
+        pages.ops.append(f"{_number(BORDER_WIDTH)} w")
+        for key, value in details:
+            key_lines = wrap_text(key, cell_width, bold=True)
+            value_lines = wrap_text(str(value), cell_width)
+            height = max(len(key_lines), len(value_lines)) * FONT_SIZE * LINE_HEIGHT
+            pages.reserve(height)
+            top = pages.y
+            pages.lines(key_lines, PAGE_MARGIN + CELL_PADDING, cell_width, top, bold=True)
+            pages.lines(value_lines, PAGE_MARGIN + column + CELL_PADDING, cell_width, top)
+            pages.rectangle(PAGE_MARGIN, top - height, column, height)
+            pages.rectangle(PAGE_MARGIN + column, top - height, column, height)
+            pages.y -= height
+        pages.y -= SPACE_AFTER
+
+        # Importo in lettere
+        pages.paragraph(f"Importo in lettere: {importo_in_lettere}", bold=True, size=11, align="both")
+
+        # Firme: immagini e nomi centrati in tre colonne, senza bordi
+        pages.paragraph("")
+        column = BODY_WIDTH / 3
+        image_height = max([signature[2] for signature in self.signatures if signature] or [0])
+        if image_height:
+            pages.reserve(image_height + SPACE_AFTER)
+            for index, signature in enumerate(self.signatures):
+                if signature is None:
+                    continue
+                name, width, height = signature
+                left = PAGE_MARGIN + index * column + (column - width) / 2
+                # Centrata verticalmente nella riga
+                pages.image(name, left, pages.y - (image_height + height) / 2, width, height)
+            pages.y -= image_height + SPACE_AFTER
+
+        names = [wrap_text(f"{role}\n{data[role]}", column - 2 * CELL_PADDING) for role in SIGNATURE_ROLES]
+        line_height = FONT_SIZE * LINE_HEIGHT * PARAGRAPH_SPACING
+        height = max(len(lines) for lines in names) * line_height
+        pages.reserve(height)
+        for index, lines in enumerate(names):
+            top = pages.y - (height - len(lines) * line_height) / 2
+            pages.lines(lines, PAGE_MARGIN + index * column + CELL_PADDING, column - 2 * CELL_PADDING,
+                        top, align="center", spacing=PARAGRAPH_SPACING)
+        pages.y -= height + SPACE_AFTER
+        pages.paragraph("")
+
+        # Piè di pagina
+        pages.paragraph(f"\n{data['Luogo']}, {data['Data']}")
+
+    def _write(self, stream, pages):
+        """Scrive il file PDF: intestazione, oggetti fissi, pagine, tabella xref"""
+        with instrumentation.timer("render.pdf"):
+            first_page = len(self._objects) + 3
+            page_numbers = [first_page + 2 * index for index in range(len(pages))]
+            kids = " ".join(f"{number} 0 R" for number in page_numbers)
+            objects = [
+                b"<< /Type /Catalog /Pages 2 0 R >>",
+                f"<< /Type /Pages /Kids [{kids}] /Count {len(pages)} {self.pages_attributes} >>".encode("latin-1")
+            ] + self._objects
+            for number, ops in zip(page_numbers, pages):
+                objects.append(f"<< /Type /Page /Parent 2 0 R /Contents {number + 1} 0 R >>".encode("latin-1"))
+                content = zlib.compress("\n".join(ops).encode("latin-1"))
+                objects.append(_stream_object("/Filter /FlateDecode", content))
+            created = datetime.now().strftime("%Y%m%d%H%M%S")
+            objects.append(f"<< /Producer (ManRev) /CreationDate (D:{created}) >>".encode("latin-1"))
+
+            offsets = []
+            position = 0
+            chunks = [b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"]
+            position += len(chunks[0])
+            for number, body in enumerate(objects, start=1):
+                offsets.append(position)
+                chunk = b"%d 0 obj\n%s\nendobj\n" % (number, body)
+                chunks.append(chunk)
+                position += len(chunk)
+
+            xref = [f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"]
+            xref += [f"{offset:010d} 00000 n \n" for offset in offsets]
+            xref.append(
+                f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R /Info {len(objects)} 0 R >>\n"
+                f"startxref\n{position}\n%%EOF\n"
+            )
+            chunks.append("".join(xref).encode("latin-1"))
+            stream.write(b"".join(chunks))
+
+    def render(self, data, importo_in_lettere, stream):
+        """Scrive il PDF completo su stream"""
+        pages = _Pages()
+        with instrumentation.timer("render.body"):
+            self.layout(data, importo_in_lettere, pages)
+        self._write(stream, pages.pages)
+
+    def render_merged(self, items, stream):
+        """
+        Scrive su stream un unico PDF con ogni documento su una nuova
+        pagina: font e immagini sono incorporati una volta per tutto il
+        file. items è un iterabile di coppie (doc_data, importo_in_lettere)
+        """
+        pages = _Pages()
+        index = None
+        for index, (data, importo_in_lettere) in enumerate(items):
+            if index:
+                pages.new_page()
+            self.layout(data, importo_in_lettere, pages)
+        if index is None:
+            raise ValueError("Nessun documento da unire")
+        self._write(stream, pages.pages)
+
+def build_package():
+    """Prepara font e immagini per la revisione corrente"""
+    return PdfPackage(manrev_settings.revision)
+
+# Istanza singleton della cache del backend PDF
+pdf_cache = SkeletonCache(build_package)
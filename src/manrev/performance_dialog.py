@@ -0,0 +1,98 @@
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QMessageBox,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView
+)
+from PyQt5.QtCore import Qt, QTimer
+from .instrumentation import instrumentation
+
+class PerformanceDialog(QDialog):
+    """Tempi aggregati per fase di generazione e stampa, aggiornati durante il lavoro"""
+
+    COLUMNS = ["Fase", "Chiamate", "Totale ms", "Media ms", "p50 ms", "p99 ms", "Max ms"]
+    REFRESH_MS = 2000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Statistiche Prestazioni")
+        self.setMinimumSize(750, 450)
+        self.setup_ui()
+        self.refresh()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(self.REFRESH_MS)
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        self.stages_table = QTableWidget(0, len(self.COLUMNS))
+        self.stages_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.stages_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.stages_table.verticalHeader().setVisible(False)
+        self.stages_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        layout.addWidget(self.stages_table)
+
+        self.counters_label = QLabel()
+        self.counters_label.setWordWrap(True)
+        layout.addWidget(self.counters_label)
+
+        self.log_label = QLabel()
+        self.log_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+        layout.addWidget(self.log_label)
+
+        # Pulsanti
+        buttons_layout = QHBoxLayout()
+        reset_btn = QPushButton("Azzera")
+        reset_btn.clicked.connect(self.reset)
+        profile_btn = QPushButton("Salva Profilo")
+        profile_btn.clicked.connect(self.save_profile)
+        close_btn = QPushButton("Chiudi")
+        close_btn.clicked.connect(self.accept)
+
+        buttons_layout.addWidget(reset_btn)
+        buttons_layout.addWidget(profile_btn)
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(close_btn)
+        layout.addLayout(buttons_layout)
+
+        self.setLayout(layout)
+
+    def refresh(self):
+        stats = instrumentation.stats()
+        stages = sorted(stats["stages"].items())
+        self.stages_table.setRowCount(len(stages))
+        for row, (name, stage) in enumerate(stages):
+            values = [
+                name, str(stage["count"]), f"{stage['total_ms']:.1f}", f"{stage['mean_ms']:.2f}",
+                f"{stage['p50_ms']:.2f}", f"{stage['p99_ms']:.2f}", f"{stage['max_ms']:.2f}"
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if column:
+                    item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+                self.stages_table.setItem(row, column, item)
+
+        counters = ", ".join(f"{name}: {value}" for name, value in sorted(stats["counters"].items()))
+        self.counters_label.setText(counters or "Nessun documento generato in questa sessione")
+
+        modes = ", ".join(sorted(instrumentation.profiling_modes())) or "disattivata"
+        self.log_label.setText(f"Profilazione: {modes} - Log: {instrumentation.log_path}")
+
+    def reset(self):
+        instrumentation.reset()
+        self.refresh()
+
+    def save_profile(self):
+        try:
+            written = instrumentation.dump_profile()
+        except Exception as e:
+            QMessageBox.critical(self, "Errore", f"Errore nel salvataggio del profilo: {str(e)}")
+            return
+        if written:
+            QMessageBox.information(self, "Profilo salvato", "\n".join(written))
+        else:
+            QMessageBox.information(
+                self,
+                "Profilo",
+                "Nessun profilo raccolto: attivare la profilazione nelle Impostazioni "
+                "o con la variabile d'ambiente MANREV_PROFILE."
+            )
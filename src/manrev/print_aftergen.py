@@ -1,21 +1,36 @@
 import os
-import platform
-import subprocess
+from PyQt5.QtCore import pyqtSignal
 from PyQt5.QtWidgets import QMessageBox, QDialog, QVBoxLayout, QComboBox, QPushButton, QLabel, QHBoxLayout
+from .settings import manrev_settings
+from .print_queue import DEFAULT_PRINTER, print_file, print_files, print_spooler, print_temp_dir
+from .printers import printer_registry
 
 class PrinterDialog(QDialog):
-    def __init__(self, parent=None):
+    # Emesso dal thread della ricerca delle stampanti
+    printers_found = pyqtSignal(object)
+
+    def __init__(self, parent=None, doc_type=None):
         super().__init__(parent)
+        self.doc_type = doc_type
         self.setWindowTitle("Seleziona Stampante")
         self.setFixedSize(300, 150)
         self.setup_ui()
+        self.finished.connect(self._stop_listening)
         
     def setup_ui(self):
         layout = QVBoxLayout()
         
-        # Lista stampanti
+        # Lista stampanti dalla cache del registro, senza interrogare il
+        # sistema: se la ricerca non è ancora completata la lista parte
+        # dall'ultima stampante usata e si aggiorna quando arriva l'elenco
         self.printer_combo = QComboBox()
-        self.printer_combo.addItems(self.get_printers())
+        self.printers_found.connect(self.set_printers)
+        self._printers_listener = self.printers_found.emit
+        printer_registry.add_listener(self._printers_listener)
+        printers = self.get_printers()
+        if printers is None:
+            printers = [printer_registry.last_printer(self.doc_type) or DEFAULT_PRINTER]
+        self.set_printers(printers)
         
         layout.addWidget(QLabel("Seleziona stampante:"))
         layout.addWidget(self.printer_combo)
@@ -34,50 +49,88 @@ class PrinterDialog(QDialog):
         self.setLayout(layout)
     
     def get_printers(self):
-        if platform.system() == "Windows":
-            import win32print
-            printers = []
-            for printer in win32print.EnumPrinters(2):
-                printers.append(printer[2])
-            return printers
-        elif platform.system() == "Darwin":  # macOS
-            try:
-                output = subprocess.check_output(['lpstat', '-p'], universal_newlines=True)
-                printers = []
-                for line in output.split('\n'):
-                    if line.startswith('printer'):
-                        printers.append(line.split(' ')[1])
-                return printers or ["Stampante Predefinita"]
-            except:
-                return ["Stampante Predefinita"]
-        return ["Stampante Predefinita"]
+        return printer_registry.printers()
+
+    def set_printers(self, printers):
+        """Riempie la lista mantenendo la stampante scelta, o proponendo l'ultima usata"""
+        current = self.printer_combo.currentText() or printer_registry.last_printer(self.doc_type)
+        self.printer_combo.clear()
+        self.printer_combo.addItems(printers)
+        if current:
+            idx = self.printer_combo.findText(current)
+            if idx != -1:
+                self.printer_combo.setCurrentIndex(idx)
+
+    def _stop_listening(self):
+        printer_registry.remove_listener(self._printers_listener)
     
     def selected_printer(self):
         return self.printer_combo.currentText()
 
 class PrintManager:
-    def __init__(self):
-        self.word_app = None
+    def choose_printer(self, parent=None, doc_type=None):
+        """
+        Mostra la selezione della stampante, proponendo l'ultima usata per
+        il tipo di documento; None se annullata
+        """
+        printer_dialog = PrinterDialog(parent, doc_type)
+        if printer_dialog.exec_() != QDialog.Accepted:
+            return None
+        printer = printer_dialog.selected_printer()
+        printer_registry.remember(printer, doc_type)
+        return printer
+        
+    def print_file(self, file_path, printer):
+        """
+        Stampa un documento sulla stampante indicata, senza interfaccia:
+        può essere chiamata da un thread di lavoro. Solleva un'eccezione in
+        caso di errore (compreso il messaggio di lp).
+        """
+        return print_file(file_path, printer)
+        
+    def print_files(self, file_paths, printer):
+        """
+        Stampa più file sulla stessa stampante senza interfaccia: i .docx
+        passano tutti dalla stessa sessione di Word. Restituisce per ogni
+        file None o l'eccezione.
+        """
+        return print_files(list(file_paths), printer)
         
-    def print_document(self, file_path, parent=None):
+    def prints_pdf(self):
+        """Stampa tramite PDF scritto direttamente (impostazione print_pdf), senza Word"""
+        return bool(manrev_settings.current_settings.get("print_pdf", True))
+        
+    def prepare_print_file(self, file_path, payloads):
+        """
+        File da accodare per stampare documenti già generati: con la stampa
+        tramite PDF un PDF dei payloads nella cartella dei file di stampa,
+        che lp stampa senza conversioni e che la coda elimina dopo la
+        stampa; altrimenti il file generato stesso
+        """
+        if file_path.lower().endswith(".pdf") or not self.prints_pdf():
+            return file_path
+        from .generator import generate_print_pdf
+
+        file_name = os.path.splitext(os.path.basename(file_path))[0] + ".pdf"
+        return generate_print_pdf(payloads, os.path.join(print_temp_dir(), file_name))
+        
+    def enqueue(self, file_paths, printer=None):
+        """Accoda i file nella coda di stampa persistente, senza attendere la stampa"""
+        print_spooler.start()
+        return print_spooler.submit_many(file_paths, printer)
+        
+    def print_document(self, file_path, parent=None, doc_type=None):
         """Stampa un documento Word"""
         try:
             if not os.path.exists(file_path):
                 raise FileNotFoundError(f"File non trovato: {file_path}")
             
             # Mostra dialog selezione stampante
-            printer_dialog = PrinterDialog(parent)
-            if printer_dialog.exec_() != QDialog.Accepted:
+            selected_printer = self.choose_printer(parent, doc_type)
+            if selected_printer is None:
                 return False
-                
-            selected_printer = printer_dialog.selected_printer()
             
-            if platform.system() == "Windows":
-                return self._print_windows(file_path, selected_printer)
-            elif platform.system() == "Darwin":
-                return self._print_macos(file_path, selected_printer)
-            else:
-                raise NotImplementedError("Sistema operativo non supportato")
+            return self.print_file(file_path, selected_printer)
                 
         except Exception as e:
             QMessageBox.critical(
@@ -86,41 +139,6 @@ class PrintManager:
                 f"Errore durante la stampa: {str(e)}"
             )
             return False
-            
-        finally:
-            if self.word_app:
-                try:
-                    self.word_app.Quit()
-                except:
-                    pass
-                self.word_app = None
-                
-    def _print_windows(self, file_path, printer):
-        """Gestisce la stampa su Windows"""
-        import win32com.client
-        
-        self.word_app = win32com.client.Dispatch("Word.Application")
-        self.word_app.Visible = False
-        
-        doc = self.word_app.Documents.Open(os.path.abspath(file_path))
-        self.word_app.ActivePrinter = printer
-        doc.PrintOut(Background=False)
-        doc.Close()
-        
-        return True
-        
-    def _print_macos(self, file_path, printer):
-        """Gestisce la stampa su macOS"""
-        try:
-            if printer != "Stampante Predefinita":
-                cmd = ['lp', '-d', printer, file_path]
-            else:
-                cmd = ['lp', file_path]
-                
-            subprocess.run(cmd, check=True)
-            return True
-        except:
-            return False
 
 # Istanza singleton del gestore stampe
 print_manager = PrintManager()
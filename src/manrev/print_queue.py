@@ -0,0 +1,508 @@
+import os
+import platform
+import shlex
+import subprocess
+import threading
+import time
+from datetime import datetime
+from .archive import archive_index
+from .instrumentation import instrumentation
+
+# Stati di un lavoro di stampa
+QUEUED = "queued"
+PRINTING = "printing"
+DONE = "done"
+FAILED = "failed"
+CANCELED = "canceled"
+
+STATUS_LABELS = {
+    QUEUED: "In coda",
+    PRINTING: "In stampa",
+    DONE: "Stampato",
+    FAILED: "Errore",
+    CANCELED: "Annullato"
+}
+
+DEFAULT_PRINTER = "Stampante Predefinita"
+
+# Tentativi per ogni lavoro, con attesa crescente tra uno e l'altro
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 2.0
+BACKOFF_MAX = 300.0
+# Un lavoro "in stampa" da più di tanti secondi appartiene a un processo
+# terminato e viene rimesso in coda
+STALE_AFTER = 600
+# Lavori per la stessa stampante presi in carico e stampati insieme
+PRINT_BATCH_SIZE = 20
+
+def print_temp_dir():
+    """
+    Cartella dei file preparati solo per la stampa (PDF per lp): la coda li
+    elimina dopo la stampa, gli altri file accodati non vengono mai toccati
+    """
+    from paths import path_manager
+
+    temp_dir = os.path.join(path_manager.get_temp_dir(), "stampa")
+    os.makedirs(temp_dir, exist_ok=True)
+    return temp_dir
+
+def is_print_temp_file(file_path):
+    return os.path.dirname(os.path.abspath(file_path)) == print_temp_dir()
+
+def lp_command():
+    """Comando di stampa; MANREV_LP_COMMAND lo sostituisce (es. con un lp finto nei test)"""
+    return shlex.split(os.environ.get("MANREV_LP_COMMAND", "lp"))
+
+def print_with_lp(file_path, printer=None):
+    """
+    Invia il file (o una lista di file, con una sola richiesta) a lp;
+    solleva un'eccezione con il messaggio di lp in caso di errore
+    """
+    cmd = lp_command()
+    if printer and printer != DEFAULT_PRINTER:
+        cmd += ['-d', printer]
+    if isinstance(file_path, (list, tuple)):
+        cmd.extend(file_path)
+    else:
+        cmd.append(file_path)
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        message = (result.stderr or result.stdout).strip()
+        raise RuntimeError(f"lp ha restituito {result.returncode}: {message}")
+    return True
+
+def print_with_word(file_path, printer):
+    """Stampa il file con Word Automation, tramite la sessione di Word già aperta"""
+    from .word_session import word_pool
+    return word_pool.print_file(file_path, printer)
+
+def uses_word(file_path):
+    """
+    I .docx si stampano con Word su Windows (salvo MANREV_LP_COMMAND) e
+    ovunque con MANREV_WORD_BACKEND (es. "fake" per le prove)
+    """
+    if file_path.lower().endswith(".pdf"):
+        return False
+    if os.environ.get("MANREV_WORD_BACKEND"):
+        return True
+    return platform.system() == "Windows" and "MANREV_LP_COMMAND" not in os.environ
+
+def print_with_shell(file_path, printer):
+    """Stampa un PDF con l'applicazione associata ai PDF (Windows), senza Word"""
+    import win32api
+
+    if printer and printer != DEFAULT_PRINTER:
+        result = win32api.ShellExecute(0, "printto", os.path.abspath(file_path), f'"{printer}"', ".", 0)
+    else:
+        result = win32api.ShellExecute(0, "print", os.path.abspath(file_path), None, ".", 0)
+    # ShellExecute restituisce un valore minore o uguale a 32 in caso di errore
+    if result <= 32:
+        raise RuntimeError(f"Nessuna applicazione per stampare il PDF (codice {result})")
+    return True
+
+@instrumentation.timed("print")
+def print_file(file_path, printer=None):
+    """
+    Stampa un documento con il sistema di stampa della piattaforma: i PDF
+    vanno direttamente a lp (o all'applicazione dei PDF su Windows), i .docx
+    a Word su Windows
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File non trovato: {file_path}")
+    if uses_word(file_path):
+        return print_with_word(file_path, printer)
+    if platform.system() == "Windows" and "MANREV_LP_COMMAND" not in os.environ:
+        return print_with_shell(file_path, printer)
+    return print_with_lp(file_path, printer)
+
+def print_files(file_paths, printer=None):
+    """
+    Stampa più file sulla stessa stampante e restituisce per ogni file None
+    o l'eccezione. I file per Word vanno insieme a una sola sessione di Word,
+    che imposta la stampante una volta per tutto il lotto
+    """
+    errors = [None] * len(file_paths)
+    word_indexes = [index for index, file_path in enumerate(file_paths) if uses_word(file_path)]
+    if word_indexes:
+        from .word_session import word_pool
+        try:
+            with instrumentation.timer("print.word"):
+                word_errors = word_pool.print_files([file_paths[index] for index in word_indexes], printer)
+        except Exception as e:
+            word_errors = [e] * len(word_indexes)
+        for index, error in zip(word_indexes, word_errors):
+            errors[index] = error
+
+    other_indexes = [index for index in range(len(file_paths)) if index not in word_indexes]
+    if len(other_indexes) > 1 and not (platform.system() == "Windows" and "MANREV_LP_COMMAND" not in os.environ):
+        # Un solo lp per tutti i file; se fallisce si ripete file per file per sapere quali
+        lp_paths = [file_paths[index] for index in other_indexes]
+        if all(os.path.exists(file_path) for file_path in lp_paths):
+            try:
+                with instrumentation.timer("print.lp"):
+                    print_with_lp(lp_paths, printer)
+                other_indexes = []
+            except Exception:
+                pass
+
+    for index in other_indexes:
+        try:
+            print_file(file_paths[index], printer)
+        except Exception as e:
+            errors[index] = e
+    return errors
+
+def backoff_delay(attempts):
+    """Attesa prima del tentativo successivo al numero attempts"""
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+class PrintQueue:
+    """
+    Coda di stampa persistente nell'archivio SQLite: i lavori sopravvivono
+    alla chiusura dell'applicazione e più istanze possono servirla insieme
+    """
+
+    def __init__(self, archive=archive_index):
+        self.archive = archive
+
+    def submit(self, file_path, printer=None):
+        """Accoda un file da stampare e restituisce l'id del lavoro"""
+        return self.submit_many([file_path], printer)[0]
+
+    def submit_many(self, file_paths, printer=None):
+        now = time.time()
+        created_at = datetime.now().isoformat(timespec="seconds")
+        ids = []
+        with self.archive.connection as connection:
+            for file_path in file_paths:
+                cursor = connection.execute(
+                    "INSERT INTO print_jobs (file_path, printer, status, next_attempt_at, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (os.path.abspath(file_path), printer, QUEUED, now, created_at, now)
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def claim(self):
+        """Prende in carico il prossimo lavoro da stampare, o None"""
+        jobs = self.claim_batch(1)
+        return jobs[0] if jobs else None
+
+    def claim_batch(self, limit):
+        """
+        Prende in carico il prossimo lavoro da stampare e fino a limit - 1
+        altri lavori pronti per la stessa stampante, da stampare insieme.
+        Restituisce una lista, vuota se non ci sono lavori pronti.
+        """
+        now = time.time()
+        connection = self.archive.connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            rows = []
+            first = connection.execute(
+                "SELECT * FROM print_jobs WHERE status = ? AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at, id LIMIT 1",
+                (QUEUED, now)
+            ).fetchone()
+            if first is not None:
+                rows = [first]
+                if limit > 1:
+                    rows += connection.execute(
+                        "SELECT * FROM print_jobs WHERE status = ? AND next_attempt_at <= ? "
+                        "AND printer IS ? AND id != ? ORDER BY next_attempt_at, id LIMIT ?",
+                        (QUEUED, now, first["printer"], first["id"], limit - 1)
+                    ).fetchall()
+                connection.executemany(
+                    "UPDATE print_jobs SET status = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    [(PRINTING, now, row["id"]) for row in rows]
+                )
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        jobs = []
+        for row in rows:
+            job = dict(row)
+            job["attempts"] += 1
+            jobs.append(job)
+        return jobs
+
+    def _set(self, job_id, status, error=None, next_attempt_at=None, only_from=None):
+        query = "UPDATE print_jobs SET status = ?, error = ?, updated_at = ?"
+        params = [status, error, time.time()]
+        if next_attempt_at is not None:
+            query += ", next_attempt_at = ?"
+            params.append(next_attempt_at)
+        query += " WHERE id = ?"
+        params.append(job_id)
+        if only_from:
+            query += f" AND status IN ({', '.join('?' for _ in only_from)})"
+            params.extend(only_from)
+        with self.archive.connection as connection:
+            return connection.execute(query, params).rowcount > 0
+
+    def complete(self, job_id):
+        self._set(job_id, DONE, only_from=[PRINTING])
+
+    def fail(self, job, error, retry=True):
+        """Registra un tentativo fallito: il lavoro torna in coda finché restano tentativi"""
+        if not retry or job["attempts"] >= MAX_ATTEMPTS:
+            self._set(job["id"], FAILED, error, only_from=[PRINTING])
+        else:
+            retry_at = time.time() + backoff_delay(job["attempts"])
+            self._set(job["id"], QUEUED, error, retry_at, only_from=[PRINTING])
+
+    def cancel(self, job_id):
+        """
+        Annulla un lavoro non ancora inviato alla stampante. Il file
+        preparato per la stampa resta fino alla pulizia all'avvio della
+        coda, così il lavoro si può ancora riprovare.
+        """
+        return self._set(job_id, CANCELED, only_from=[QUEUED, FAILED])
+
+    def retry(self, job_id):
+        """Rimette subito in coda un lavoro fallito o annullato"""
+        with self.archive.connection as connection:
+            return connection.execute(
+                "UPDATE print_jobs SET status = ?, attempts = 0, error = NULL, next_attempt_at = ?, "
+                "updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                (QUEUED, time.time(), time.time(), job_id, FAILED, CANCELED)
+            ).rowcount > 0
+
+    def recover_stale(self):
+        """Rimette in coda i lavori rimasti "in stampa" da un processo terminato"""
+        with self.archive.connection as connection:
+            return connection.execute(
+                "UPDATE print_jobs SET status = ?, next_attempt_at = ? WHERE status = ? AND updated_at < ?",
+                (QUEUED, time.time(), PRINTING, time.time() - STALE_AFTER)
+            ).rowcount
+
+    def _referenced_files(self, file_paths=None):
+        """File ancora necessari: di lavori in coda, in stampa o falliti (che si possono riprovare)"""
+        query = "SELECT DISTINCT file_path FROM print_jobs WHERE status IN (?, ?, ?)"
+        params = [QUEUED, PRINTING, FAILED]
+        if file_paths is not None:
+            query += f" AND file_path IN ({', '.join('?' for _ in file_paths)})"
+            params.extend(file_paths)
+        return {row[0] for row in self.archive.connection.execute(query, params)}
+
+    def discard_print_file(self, file_path):
+        """Elimina il file preparato per la stampa se nessun altro lavoro lo usa"""
+        if not is_print_temp_file(file_path) or self._referenced_files([file_path]):
+            return False
+        try:
+            os.remove(file_path)
+            return True
+        except OSError:
+            return False
+
+    def sweep_print_files(self, min_age=STALE_AFTER):
+        """
+        Elimina i file di stampa rimasti nella cartella temporanea (lavori
+        stampati, annullati o mai accodati). I file più recenti di min_age
+        secondi restano: un'altra istanza potrebbe non averli ancora accodati.
+        """
+        temp_dir = print_temp_dir()
+        referenced = self._referenced_files()
+        now = time.time()
+        removed = 0
+        for entry in os.scandir(temp_dir):
+            try:
+                if os.path.abspath(entry.path) in referenced or now - entry.stat().st_mtime < min_age:
+                    continue
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+    def clear_finished(self):
+        """Elimina dalla coda i lavori stampati e annullati"""
+        with self.archive.connection as connection:
+            return connection.execute(
+                "DELETE FROM print_jobs WHERE status IN (?, ?)", (DONE, CANCELED)
+            ).rowcount
+
+    def get(self, job_id):
+        row = self.archive.connection.execute(
+            "SELECT * FROM print_jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def jobs(self, limit=500):
+        """Lavori più recenti per primi"""
+        rows = self.archive.connection.execute(
+            "SELECT * FROM print_jobs ORDER BY id DESC LIMIT ?", (limit,)
+        )
+        return [dict(row) for row in rows]
+
+    def counts(self, job_ids=None):
+        """Numero di lavori per stato, di tutta la coda o dei soli job_ids"""
+        if job_ids is None:
+            rows = self.archive.connection.execute(
+                "SELECT status, COUNT(*) FROM print_jobs GROUP BY status"
+            )
+            return {status: count for status, count in rows}
+        job_ids = list(job_ids)
+        counts = {}
+        # A gruppi, entro il limite di parametri di SQLite
+        for start in range(0, len(job_ids), 500):
+            chunk = job_ids[start:start + 500]
+            rows = self.archive.connection.execute(
+                f"SELECT status, COUNT(*) FROM print_jobs WHERE id IN ({', '.join('?' for _ in chunk)}) "
+                "GROUP BY status",
+                chunk
+            )
+            for status, count in rows:
+                counts[status] = counts.get(status, 0) + count
+        return counts
+
+    def seconds_to_next(self):
+        """Secondi al prossimo lavoro in coda (0 se già pronto), None se la coda è vuota"""
+        row = self.archive.connection.execute(
+            "SELECT MIN(next_attempt_at) FROM print_jobs WHERE status = ?", (QUEUED,)
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+class PrintSpooler:
+    """
+    Thread di lavoro che svuotano la coda di stampa in background.
+    Il numero di thread limita le stampe contemporanee. Con
+    print_batch_function ogni thread prende in carico fino a batch_size
+    lavori per la stessa stampante e li stampa con una sola chiamata.
+    """
+
+    def __init__(self, queue=None, print_function=print_file, workers=2, poll_interval=1.0,
+                 print_batch_function=None, batch_size=1):
+        self.queue = queue or print_queue
+        self.print_function = print_function
+        self.print_batch_function = print_batch_function
+        self.batch_size = batch_size if print_batch_function else 1
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._active = 0
+
+    @property
+    def running(self):
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        """Avvia i thread di stampa (se non già avviati)"""
+        if self.running:
+            return
+        try:
+            self.queue.recover_stale()
+            self.queue.sweep_print_files()
+        except Exception as e:
+            print(f"Errore nel ripristino della coda di stampa: {str(e)}")
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._run, name=f"manrev-stampa-{i + 1}", daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout=None):
+        """Ferma i thread dopo il lavoro in corso; i lavori in coda restano su disco"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def wake(self):
+        """Segnala che sono stati accodati nuovi lavori"""
+        self._wake.set()
+
+    def submit(self, file_path, printer=None):
+        job_id = self.queue.submit(file_path, printer)
+        self.wake()
+        return job_id
+
+    def submit_many(self, file_paths, printer=None):
+        ids = self.queue.submit_many(file_paths, printer)
+        self.wake()
+        return ids
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                jobs = self.queue.claim_batch(self.batch_size)
+            except Exception as e:
+                print(f"Errore nella lettura della coda di stampa: {str(e)}")
+                jobs = []
+            if not jobs:
+                self._wait()
+                continue
+
+            with self._lock:
+                self._active += 1
+            try:
+                if len(jobs) == 1:
+                    errors = [None]
+                    try:
+                        self.print_function(jobs[0]["file_path"], jobs[0]["printer"])
+                    except Exception as e:
+                        errors = [e]
+                else:
+                    try:
+                        errors = self.print_batch_function(
+                            [job["file_path"] for job in jobs], jobs[0]["printer"]
+                        )
+                    except Exception as e:
+                        errors = [e] * len(jobs)
+                for job, error in zip(jobs, errors):
+                    self._finish(job, error)
+            finally:
+                with self._lock:
+                    self._active -= 1
+
+    def _finish(self, job, error):
+        try:
+            if error is None:
+                self.queue.complete(job["id"])
+                self.queue.discard_print_file(job["file_path"])
+            elif isinstance(error, FileNotFoundError):
+                # Riprovare non serve: il file non c'è più
+                self.queue.fail(job, str(error), retry=False)
+            else:
+                self.queue.fail(job, str(error))
+        except Exception as e:
+            print(f"Errore nell'aggiornamento della coda di stampa: {str(e)}")
+
+    def _wait(self):
+        try:
+            delay = self.queue.seconds_to_next()
+        except Exception:
+            delay = None
+        timeout = self.poll_interval if delay is None else min(max(delay, 0.01), self.poll_interval)
+        self._wake.wait(timeout)
+        self._wake.clear()
+
+    def run_until_done(self, job_ids, timeout=None):
+        """
+        Avvia i thread e attende che i lavori job_ids non siano più in coda
+        o in stampa (per l'uso da riga di comando). I lavori accodati da
+        altre istanze non allungano l'attesa. Restituisce i conteggi per
+        stato dei soli job_ids.
+        """
+        self.start()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while deadline is None or time.monotonic() < deadline:
+            counts = self.queue.counts(job_ids)
+            if not counts.get(QUEUED) and not counts.get(PRINTING):
+                break
+            time.sleep(0.05)
+        self.stop()
+        return self.queue.counts(job_ids)
+
+# Istanze singleton della coda e del gestore di stampa
+print_queue = PrintQueue()
+print_spooler = PrintSpooler(print_queue, print_batch_function=print_files, batch_size=PRINT_BATCH_SIZE)
@@ -0,0 +1,119 @@
+import os
+from datetime import datetime
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView
+)
+from PyQt5.QtCore import QTimer
+from .print_queue import print_queue, print_spooler, STATUS_LABELS, QUEUED, DONE, FAILED
+
+class PrintQueueDialog(QDialog):
+    """Stato della coda di stampa, aggiornato mentre i lavori procedono"""
+
+    COLUMNS = ["N.", "Documento", "Stampante", "Stato", "Tentativi", "Dettagli"]
+    REFRESH_MS = 1000
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Coda di Stampa")
+        self.setMinimumSize(800, 400)
+        self.jobs = []
+        self.setup_ui()
+        self.refresh()
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(self.REFRESH_MS)
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        self.jobs_table = QTableWidget(0, len(self.COLUMNS))
+        self.jobs_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.jobs_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.jobs_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.jobs_table.verticalHeader().setVisible(False)
+        self.jobs_table.horizontalHeader().setSectionResizeMode(
+            len(self.COLUMNS) - 1, QHeaderView.Stretch
+        )
+        layout.addWidget(self.jobs_table)
+
+        self.summary_label = QLabel()
+        layout.addWidget(self.summary_label)
+
+        # Pulsanti
+        buttons_layout = QHBoxLayout()
+        retry_btn = QPushButton("Riprova")
+        retry_btn.clicked.connect(self.retry_selected)
+        cancel_btn = QPushButton("Annulla")
+        cancel_btn.clicked.connect(self.cancel_selected)
+        clear_btn = QPushButton("Rimuovi Completati")
+        clear_btn.clicked.connect(self.clear_finished)
+        close_btn = QPushButton("Chiudi")
+        close_btn.clicked.connect(self.accept)
+
+        buttons_layout.addWidget(retry_btn)
+        buttons_layout.addWidget(cancel_btn)
+        buttons_layout.addWidget(clear_btn)
+        buttons_layout.addStretch()
+        buttons_layout.addWidget(close_btn)
+        layout.addLayout(buttons_layout)
+
+        self.setLayout(layout)
+
+    def _details(self, job):
+        if job["status"] == QUEUED and job["error"]:
+            retry_at = datetime.fromtimestamp(job["next_attempt_at"]).strftime("%H:%M:%S")
+            return f"Nuovo tentativo alle {retry_at}: {job['error']}"
+        if job["status"] == FAILED:
+            return job["error"] or ""
+        return job["file_path"]
+
+    def refresh(self):
+        try:
+            self.jobs = print_queue.jobs()
+            counts = print_queue.counts()
+        except Exception as e:
+            self.summary_label.setText(f"Errore nella lettura della coda: {str(e)}")
+            return
+
+        selected_row = self.jobs_table.currentRow()
+        self.jobs_table.setRowCount(len(self.jobs))
+        for row, job in enumerate(self.jobs):
+            values = [
+                job["id"], os.path.basename(job["file_path"]), job["printer"] or "",
+                STATUS_LABELS.get(job["status"], job["status"]), job["attempts"], self._details(job)
+            ]
+            for column, value in enumerate(values):
+                self.jobs_table.setItem(row, column, QTableWidgetItem(str(value)))
+        if 0 <= selected_row < len(self.jobs):
+            self.jobs_table.selectRow(selected_row)
+
+        summary = ", ".join(
+            f"{STATUS_LABELS[status]}: {counts[status]}" for status in STATUS_LABELS if counts.get(status)
+        )
+        if not print_spooler.running:
+            summary += " - stampa in pausa"
+        self.summary_label.setText(summary or "Nessun lavoro di stampa")
+
+    def selected_job(self):
+        row = self.jobs_table.currentRow()
+        if 0 <= row < len(self.jobs):
+            return self.jobs[row]
+        return None
+
+    def retry_selected(self):
+        job = self.selected_job()
+        if job and print_queue.retry(job["id"]):
+            print_spooler.start()
+            print_spooler.wake()
+        self.refresh()
+
+    def cancel_selected(self):
+        job = self.selected_job()
+        if job and job["status"] != DONE:
+            print_queue.cancel(job["id"])
+        self.refresh()
+
+    def clear_finished(self):
+        print_queue.clear_finished()
+        self.refresh()
@@ -0,0 +1,121 @@
+import platform
+import subprocess
+import threading
+import time
+from .settings import manrev_settings
+from .print_queue import DEFAULT_PRINTER
+
+# Validità dell'elenco delle stampanti, in secondi
+PRINTERS_TTL = 300
+
+def discover_printers():
+    """Elenco delle stampanti installate (interroga il sistema, può essere lento)"""
+    if platform.system() == "Windows":
+        import win32print
+        printers = []
+        for printer in win32print.EnumPrinters(2):
+            printers.append(printer[2])
+        return printers or [DEFAULT_PRINTER]
+    try:
+        output = subprocess.check_output(['lpstat', '-p'], universal_newlines=True, timeout=10)
+        printers = []
+        for line in output.split('\n'):
+            if line.startswith('printer'):
+                printers.append(line.split(' ')[1])
+        return printers or [DEFAULT_PRINTER]
+    except Exception:
+        return [DEFAULT_PRINTER]
+
+class PrinterRegistry:
+    """
+    Stampanti disponibili e ultima stampante usata per tipo di documento.
+
+    L'elenco viene cercato una volta, tenuto in memoria per PRINTERS_TTL
+    secondi e poi aggiornato in background, così la scelta della stampante
+    non attende mai lpstat o win32print.
+    """
+
+    def __init__(self, discover=discover_printers, ttl=PRINTERS_TTL):
+        self._discover = discover
+        self.ttl = ttl
+        self._printers = None
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self._refreshing = None
+        self._listeners = []
+
+    def _refresh(self):
+        try:
+            printers = self._discover()
+        except Exception as e:
+            print(f"Errore nella ricerca delle stampanti: {str(e)}")
+            printers = None
+        with self._lock:
+            if printers:
+                self._printers = list(printers)
+            elif self._printers is None:
+                self._printers = [DEFAULT_PRINTER]
+            self._expires_at = time.monotonic() + self.ttl
+            self._refreshing = None
+            printers = list(self._printers)
+        for callback in list(self._listeners):
+            try:
+                callback(printers)
+            except Exception as e:
+                print(f"Errore nella notifica delle stampanti: {str(e)}")
+
+    def add_listener(self, callback):
+        """
+        Registra callback(stampanti), chiamata al termine di ogni ricerca
+        dal thread della ricerca, non da quello principale
+        """
+        self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def refresh_async(self):
+        """Avvia l'aggiornamento dell'elenco in background (se non già in corso)"""
+        with self._lock:
+            if self._refreshing is None:
+                self._refreshing = threading.Thread(
+                    target=self._refresh, name="manrev-stampanti", daemon=True
+                )
+                self._refreshing.start()
+            return self._refreshing
+
+    def printers(self):
+        """
+        Elenco delle stampanti, sempre senza attendere: dalla cache, aggiornata
+        in background se scaduta. Prima che la prima ricerca sia completata
+        restituisce None; il nuovo elenco arriva ai listener.
+        """
+        with self._lock:
+            printers = self._printers
+            expired = time.monotonic() >= self._expires_at
+        if printers is None or expired:
+            self.refresh_async()
+        return list(printers) if printers is not None else None
+
+    def invalidate(self):
+        """Forza una nuova ricerca al prossimo utilizzo"""
+        with self._lock:
+            self._expires_at = 0.0
+
+    def last_printer(self, doc_type=None):
+        """Ultima stampante scelta per il tipo di documento (o in generale), None se mai scelta"""
+        last_printers = manrev_settings.current_settings.get("last_printers", {})
+        return last_printers.get(doc_type or "") or last_printers.get("") or None
+
+    def remember(self, printer, doc_type=None):
+        """Memorizza la stampante scelta, senza scrivere subito le impostazioni"""
+        last_printers = dict(manrev_settings.current_settings.get("last_printers", {}))
+        last_printers[""] = printer
+        if doc_type:
+            last_printers[doc_type] = printer
+        if last_printers != manrev_settings.current_settings.get("last_printers"):
+            manrev_settings.update({"last_printers": last_printers}, deferred=True)
+
+# Istanza singleton del registro stampanti
+printer_registry = PrinterRegistry()
@@ -0,0 +1,134 @@
+import os
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QComboBox,
+    QTableWidget, QTableWidgetItem, QHeaderView, QAbstractItemView, QMessageBox
+)
+from PyQt5.QtCore import QTimer, QUrl
+from PyQt5.QtGui import QDesktopServices
+from .archive import archive_index
+
+class SearchDialog(QDialog):
+    """Ricerca nei documenti generati, per testo, anno, capitolo e importo"""
+
+    COLUMNS = ["Anno", "Tipo", "Numero", "Capitolo", "Importo €", "Data", "Descrizione"]
+    # Attesa dopo l'ultimo tasto premuto prima di eseguire la ricerca
+    SEARCH_DELAY_MS = 200
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Cerca nell'archivio")
+        self.setMinimumSize(900, 500)
+        self.results = []
+        self.search_timer = QTimer(self)
+        self.search_timer.setSingleShot(True)
+        self.search_timer.setInterval(self.SEARCH_DELAY_MS)
+        self.search_timer.timeout.connect(self.run_search)
+        self.setup_ui()
+        self.run_search()
+
+    def setup_ui(self):
+        layout = QVBoxLayout()
+
+        # Testo da cercare
+        text_row = QHBoxLayout()
+        text_row.addWidget(QLabel("Cerca:"))
+        self.text_input = QLineEdit()
+        self.text_input.setPlaceholderText("Parole contenute nella descrizione (es. cancell)")
+        self.text_input.textChanged.connect(self.schedule_search)
+        text_row.addWidget(self.text_input)
+        layout.addLayout(text_row)
+
+        # Filtri
+        filters_row = QHBoxLayout()
+        filters_row.addWidget(QLabel("Anno:"))
+        self.year_combo = QComboBox()
+        self.year_combo.addItem("Tutti", None)
+        filters_row.addWidget(self.year_combo)
+
+        filters_row.addWidget(QLabel("Capitolo:"))
+        self.chapter_combo = QComboBox()
+        self.chapter_combo.addItem("Tutti", None)
+        filters_row.addWidget(self.chapter_combo)
+
+        filters_row.addWidget(QLabel("Importo da €:"))
+        self.min_amount_input = QLineEdit()
+        self.min_amount_input.setMaximumWidth(100)
+        filters_row.addWidget(self.min_amount_input)
+        filters_row.addWidget(QLabel("a €:"))
+        self.max_amount_input = QLineEdit()
+        self.max_amount_input.setMaximumWidth(100)
+        filters_row.addWidget(self.max_amount_input)
+        layout.addLayout(filters_row)
+
+        try:
+            for year in archive_index.years():
+                self.year_combo.addItem(str(year), year)
+            for chapter in archive_index.chapters():
+                self.chapter_combo.addItem(chapter, chapter)
+        except Exception as e:
+            print(f"Errore nella lettura dell'archivio: {str(e)}")
+
+        self.year_combo.currentIndexChanged.connect(self.schedule_search)
+        self.chapter_combo.currentIndexChanged.connect(self.schedule_search)
+        self.min_amount_input.textChanged.connect(self.schedule_search)
+        self.max_amount_input.textChanged.connect(self.schedule_search)
+
+        # Risultati
+        self.results_table = QTableWidget(0, len(self.COLUMNS))
+        self.results_table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.results_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.results_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.results_table.verticalHeader().setVisible(False)
+        self.results_table.horizontalHeader().setSectionResizeMode(
+            len(self.COLUMNS) - 1, QHeaderView.Stretch
+        )
+        self.results_table.cellDoubleClicked.connect(self.open_result)
+        layout.addWidget(self.results_table)
+
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+
+        self.setLayout(layout)
+
+    def schedule_search(self, *args):
+        self.search_timer.start()
+
+    def run_search(self):
+        min_amount = self.min_amount_input.text().strip() or None
+        max_amount = self.max_amount_input.text().strip() or None
+        try:
+            self.results = archive_index.search(
+                self.text_input.text(),
+                anno=self.year_combo.currentData(),
+                capitolo=self.chapter_combo.currentData(),
+                min_amount=min_amount,
+                max_amount=max_amount
+            )
+        except Exception as e:
+            self.results = []
+            self.status_label.setText(f"Errore nella ricerca: {str(e)}")
+        else:
+            self.status_label.setText(
+                f"{len(self.results)} documenti trovati - doppio clic per aprire il file"
+            )
+        self.show_results()
+
+    def show_results(self):
+        self.results_table.setRowCount(len(self.results))
+        for row, result in enumerate(self.results):
+            values = [
+                result["anno"], result["tipo"], result["numero"], result["capitolo"],
+                result["importo"], result["data"], result["snippet"]
+            ]
+            for column, value in enumerate(values):
+                item = QTableWidgetItem("" if value is None else str(value))
+                item.setToolTip(result["output_path"])
+                self.results_table.setItem(row, column, item)
+        self.results_table.resizeColumnsToContents()
+
+    def open_result(self, row, column):
+        output_path = self.results[row]["output_path"]
+        if not os.path.exists(output_path):
+            QMessageBox.warning(self, "Attenzione", f"File non trovato:\n{output_path}")
+            return
+        QDesktopServices.openUrl(QUrl.fromLocalFile(output_path))
@@ -0,0 +1,185 @@
+import io
+import itertools
+import re
+import threading
+import zipfile
+from .settings import manrev_settings
+from .instrumentation import instrumentation
+from .zip_writer import ZipEntry, write_zip
+
+# Parte OOXML che contiene il corpo del documento
+DOCUMENT_PART = "word/document.xml"
+
+# Campi variabili del documento: segnaposto -> chiave di doc_data
+FIELDS = {
+    "TIPO": "Tipo",
+    "NUMERO": "Numero",
+    "CAPITOLO": "Capitolo",
+    "IMPORTO": "Importo in €",
+    "DESCRIZIONE": "Descrizione del pagamento",
+    "LUOGO": "Luogo",
+    "DATA": "Data",
+    "TESORIERE": "Il Tesoriere",
+    "PRESIDENTE": "Il Presidente",
+    "ADDETTO": "L'Addetto Contabile"
+}
+AMOUNT_TEXT_FIELD = "IMPORTO_LETTERE"
+
+PLACEHOLDER = "{{MANREV:%s}}"
+_PLACEHOLDER_RE = re.compile(r"\{\{MANREV:([A-Z_]+)\}\}")
+_PLACEHOLDER_RUN_RE = re.compile(r"<w:t>(?=[^<]*\{\{MANREV:)")
+_INVALID_XML_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_PICTURE_ID_RE = re.compile(r'<wp:docPr id="\d+" name="Picture \d+"')
+
+def escape(value):
+    """
+    Come xml.sax.saxutils.escape, che però importa urllib e rallenta
+    il caricamento del generatore
+    """
+    return value.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+def run_text_xml(value):
+    """
+    Converte un valore nel contenuto di un <w:t>, con le stesse regole di
+    python-docx: tabulazioni in <w:tab/>, a capo in <w:br/>
+    """
+    value = str(value)
+    if _INVALID_XML_RE.search(value):
+        raise ValueError(f"Il testo contiene caratteri non validi: {value!r}")
+    value = escape(value)
+    value = value.replace("\t", '</w:t><w:tab/><w:t xml:space="preserve">')
+    value = value.replace("\r", '</w:t><w:br/><w:t xml:space="preserve">')
+    value = value.replace("\n", '</w:t><w:br/><w:t xml:space="preserve">')
+    return value
+
+def _page_break_before(body):
+    """Fa iniziare il corpo di un documento su una nuova pagina"""
+    if body.startswith("<w:p/>"):
+        return "<w:p><w:pPr><w:pageBreakBefore/></w:pPr></w:p>" + body[len("<w:p/>"):]
+    if body.startswith("<w:p><w:pPr>"):
+        return "<w:p><w:pPr><w:pageBreakBefore/>" + body[len("<w:p><w:pPr>"):]
+    if body.startswith("<w:p>"):
+        return "<w:p><w:pPr><w:pageBreakBefore/></w:pPr>" + body[len("<w:p>"):]
+    return '<w:p><w:r><w:br w:type="page"/></w:r></w:p>' + body
+
+def merge_bodies(bodies):
+    """
+    Unisce i corpi di più documenti in uno solo: ogni documento inizia su
+    una nuova pagina e le immagini vengono rinumerate per restare univoche
+    """
+    counter = itertools.count(1)
+
+    def renumber(match):
+        picture_id = next(counter)
+        return f'<wp:docPr id="{picture_id}" name="Picture {picture_id}"'
+
+    merged = []
+    for index, body in enumerate(bodies):
+        if index:
+            body = _page_break_before(body)
+        merged.append(_PICTURE_ID_RE.sub(renumber, body))
+    if not merged:
+        raise ValueError("Nessun documento da unire")
+    return "".join(merged)
+
+class DocumentSkeleton:
+    """Documento già serializzato in cui vanno inseriti solo i campi variabili"""
+
+    def __init__(self, docx_bytes, revision=None):
+        self.revision = revision
+        self.parts = []
+        with zipfile.ZipFile(io.BytesIO(docx_bytes)) as package:
+            for info in package.infolist():
+                if info.filename == DOCUMENT_PART:
+                    # Il corpo viene rigenerato per ogni documento
+                    self.parts.append((DOCUMENT_PART, None))
+                    template = package.read(info).decode("utf-8")
+                else:
+                    # Le parti fisse vengono compresse una volta sola
+                    self.parts.append((info.filename, ZipEntry(info.filename, package.read(info))))
+
+        template = _PLACEHOLDER_RUN_RE.sub('<w:t xml:space="preserve">', template)
+        body_start = template.index("<w:body>") + len("<w:body>")
+        body_end = template.rindex("<w:sectPr")
+        self.document_start = template[:body_start]
+        self.document_end = template[body_end:]
+        # Elementi alterni: testo fisso, nome del campo, testo fisso, ...
+        self.chunks = _PLACEHOLDER_RE.split(template[body_start:body_end])
+
+    def render_body(self, data, importo_in_lettere):
+        """Restituisce il contenuto del <w:body> con i valori inseriti"""
+        values = {field: data.get(key, "") for field, key in FIELDS.items()}
+        values[AMOUNT_TEXT_FIELD] = importo_in_lettere
+        chunks = list(self.chunks)
+        for i in range(1, len(chunks), 2):
+            chunks[i] = run_text_xml(values.get(chunks[i], ""))
+        return "".join(chunks)
+
+    def _write(self, stream, body):
+        document = (self.document_start + body + self.document_end).encode("utf-8")
+        with instrumentation.timer("render.zip"):
+            write_zip(stream, [
+                ZipEntry(name, document) if entry is None else entry
+                for name, entry in self.parts
+            ])
+
+    def render(self, data, importo_in_lettere, stream):
+        """Scrive il pacchetto .docx completo su stream"""
+        with instrumentation.timer("render.body"):
+            body = self.render_body(data, importo_in_lettere)
+        self._write(stream, body)
+
+    def render_merged(self, items, stream):
+        """
+        Scrive su stream un unico .docx con un documento per pagina.
+        items è un iterabile di coppie (doc_data, importo_in_lettere)
+        """
+        self._write(stream, merge_bodies(
+            self.render_body(data, importo_in_lettere) for data, importo_in_lettere in items
+        ))
+
+def build_skeleton():
+    """Costruisce lo scheletro con il layout standard e i segnaposto al posto dei dati"""
+    from .generator import build_document
+
+    data = {key: PLACEHOLDER % field for field, key in FIELDS.items()}
+    data["anno"] = str(manrev_settings.current_settings.get("year"))
+    doc = build_document(data, PLACEHOLDER % AMOUNT_TEXT_FIELD)
+
+    buffer = io.BytesIO()
+    with instrumentation.timer("skeleton.docx_save"):
+        doc.save(buffer)
+    return DocumentSkeleton(buffer.getvalue(), manrev_settings.revision)
+
+class SkeletonCache:
+    """
+    Scheletro del documento, ricostruito quando cambia la revisione delle
+    impostazioni. build è la funzione che lo costruisce e deve restituire
+    un oggetto con l'attributo revision e i metodi render(data,
+    importo_in_lettere, stream) e render_merged(items, stream).
+    """
+
+    def __init__(self, build=build_skeleton):
+        self._build = build
+        self._lock = threading.Lock()
+        self._skeleton = None
+
+    def get(self):
+        skeleton = self._skeleton
+        if skeleton is None or skeleton.revision != manrev_settings.revision:
+            with self._lock:
+                skeleton = self._skeleton
+                if skeleton is None or skeleton.revision != manrev_settings.revision:
+                    with instrumentation.timer("skeleton.build"):
+                        skeleton = self._build()
+                    instrumentation.count("skeleton.ricostruzioni")
+                    self._skeleton = skeleton
+        return skeleton
+
+    def invalidate(self):
+        """Forza la ricostruzione al prossimo utilizzo"""
+        with self._lock:
+            self._skeleton = None
+
+# Istanza singleton della cache degli scheletri
+skeleton_cache = SkeletonCache()
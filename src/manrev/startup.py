@@ -0,0 +1,38 @@
+import threading
+import time
+
+_preload_thread = None
+_preload_lock = threading.Lock()
+
+def preload():
+    """
+    Carica i moduli pesanti (python-docx, lxml, PIL, stampa) e prepara
+    immagini e parte fissa del documento, così la prima generazione non
+    paga il costo dell'avvio. Restituisce il tempo impiegato in secondi.
+    """
+    started_at = time.perf_counter()
+    try:
+        from .generator import get_renderer
+        from .layout_man_rev import preload_images
+        from . import print_aftergen  # noqa: F401
+
+        preload_images()
+        get_renderer()
+    except Exception as e:
+        # Il precaricamento è solo un'ottimizzazione: gli errori si ripresentano
+        # e vengono mostrati alla prima generazione
+        print(f"Errore nel precaricamento: {str(e)}")
+    return time.perf_counter() - started_at
+
+def start_preload():
+    """Avvia il precaricamento in un thread in background (una sola volta)"""
+    global _preload_thread
+    with _preload_lock:
+        if _preload_thread is None:
+            _preload_thread = threading.Thread(target=preload, name="manrev-precaricamento", daemon=True)
+            _preload_thread.start()
+        return _preload_thread
+
+def elapsed_ms(started_at):
+    """Millisecondi trascorsi da un istante di time.perf_counter()"""
+    return (time.perf_counter() - started_at) * 1000
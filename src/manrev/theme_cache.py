@@ -0,0 +1,185 @@
+import glob
+import importlib.util
+import json
+import os
+import shutil
+from paths import path_manager
+
+# Tema dell'interfaccia
+DEFAULT_THEME = "dark_teal.xml"
+# Da incrementare quando cambia il contenuto della cache
+CACHE_FORMAT = 1
+
+def qt_material_location():
+    """Cartella del pacchetto qt_material senza importarlo, None se non installato"""
+    try:
+        spec = importlib.util.find_spec("qt_material")
+    except (ImportError, ValueError):
+        return None
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return list(spec.submodule_search_locations)[0]
+
+def qt_material_version(package_dir):
+    """
+    Versione di qt-material letta dal nome della cartella dist-info accanto
+    al pacchetto: importlib.metadata costa decine di millisecondi all'avvio
+    """
+    site_dir = os.path.dirname(package_dir)
+    for pattern in ("qt_material-*.dist-info", "qt_material-*.egg-info", "qt-material-*.egg-info"):
+        for info_dir in glob.glob(os.path.join(glob.escape(site_dir), pattern)):
+            name = os.path.basename(info_dir).rsplit(".", 1)[0]
+            return name.split("-", 1)[1].split("-")[0]
+    try:
+        from importlib.metadata import version
+        return version("qt-material")
+    except Exception:
+        # Nessun metadato (es. eseguibile PyInstaller): vale la data del template
+        template = os.path.join(package_dir, "material.qss.template")
+        try:
+            return f"mtime{os.stat(template).st_mtime_ns}"
+        except OSError:
+            return None
+
+class ThemeCache:
+    """
+    Cache su disco del tema qt-material.
+
+    qt_material.apply_stylesheet compila a ogni avvio il template Jinja del
+    foglio di stile e riscrive le icone SVG nella home. Qui foglio di stile e
+    icone vengono generati una sola volta per tema e versione di qt-material;
+    gli avvii successivi leggono il QSS già pronto senza importare qt_material.
+    Una cache incompleta o di un'altra versione viene rigenerata.
+    """
+
+    def __init__(self, cache_root=None):
+        self._cache_root = cache_root
+
+    @property
+    def cache_root(self):
+        if self._cache_root is None:
+            self._cache_root = os.path.join(path_manager.get_temp_dir(), "theme_cache")
+        return self._cache_root
+
+    def cache_dir(self, theme, version):
+        theme_name = os.path.splitext(os.path.basename(theme))[0]
+        return os.path.join(self.cache_root, f"{theme_name}-{version}-v{CACHE_FORMAT}")
+
+    def apply(self, app, theme=DEFAULT_THEME):
+        """
+        Applica il tema all'applicazione; restituisce False se qt-material
+        non è installato (l'interfaccia resta senza tema)
+        """
+        package_dir = qt_material_location()
+        if package_dir is None:
+            return False
+        version = qt_material_version(package_dir)
+        if version is None:
+            return self._apply_uncached(app, theme)
+
+        cache_dir = self.cache_dir(theme, version)
+        cached = self._load(cache_dir)
+        if cached is None:
+            try:
+                self._build(cache_dir, theme, package_dir)
+                cached = self._load(cache_dir)
+            except Exception as e:
+                print(f"Errore nella preparazione del tema: {str(e)}")
+            if cached is None:
+                return self._apply_uncached(app, theme)
+
+        manifest, stylesheet = cached
+        self._apply_cached(app, cache_dir, manifest, stylesheet)
+        return True
+
+    def _load(self, cache_dir):
+        """Manifesto e foglio di stile dalla cache, None se mancanti o non validi"""
+        try:
+            with open(os.path.join(cache_dir, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("format") != CACHE_FORMAT:
+                return None
+            # Il foglio di stile è l'unico file letto per intero all'avvio
+            with open(os.path.join(cache_dir, "stylesheet.qss"), "r", encoding="utf-8") as f:
+                stylesheet = f.read()
+        except (OSError, ValueError):
+            return None
+        if not stylesheet or not os.path.isdir(os.path.join(cache_dir, "icons", "primary")):
+            return None
+        return manifest, stylesheet
+
+    def _build(self, cache_dir, theme, package_dir):
+        """Genera foglio di stile e icone in una cartella temporanea e la rende definitiva"""
+        import qt_material
+
+        os.makedirs(self.cache_root, exist_ok=True)
+        build_dir = f"{cache_dir}.{os.getpid()}.tmp"
+        shutil.rmtree(build_dir, ignore_errors=True)
+        try:
+            icons_dir = os.path.join(build_dir, "icons")
+            # Con un percorso assoluto qt_material scrive le icone lì invece che in ~/.qt_material
+            stylesheet = qt_material.build_stylesheet(theme=theme, parent=icons_dir)
+            if not stylesheet:
+                raise ValueError(f"Tema non trovato: {theme}")
+            colors = qt_material.get_theme(theme) or {}
+
+            fonts_dir = os.path.join(package_dir, "fonts", "roboto")
+            manifest = {
+                "format": CACHE_FORMAT,
+                "theme": theme,
+                "primary_color": colors.get("primaryColor"),
+                "fonts": sorted(glob.glob(os.path.join(glob.escape(fonts_dir), "*.ttf")))
+            }
+            with open(os.path.join(build_dir, "stylesheet.qss"), "w", encoding="utf-8") as f:
+                f.write(stylesheet)
+            # Il manifesto per ultimo: segna la cache come completa
+            with open(os.path.join(build_dir, "manifest.json"), "w", encoding="utf-8") as f:
+                json.dump(manifest, f, indent=2)
+
+            # Una cache non valida con lo stesso nome viene sostituita
+            shutil.rmtree(cache_dir, ignore_errors=True)
+            try:
+                os.replace(build_dir, cache_dir)
+            except OSError:
+                # Un'altra istanza l'ha appena creata: si usa la sua
+                pass
+        finally:
+            shutil.rmtree(build_dir, ignore_errors=True)
+
+    def _apply_cached(self, app, cache_dir, manifest, stylesheet):
+        from PyQt5.QtCore import QDir
+        from PyQt5.QtGui import QColor, QFontDatabase, QPalette
+
+        app.setStyle("Fusion")
+        for font_path in manifest.get("fonts", []):
+            QFontDatabase.addApplicationFont(font_path)
+
+        primary_color = manifest.get("primary_color")
+        if primary_color:
+            # Come qt_material: testo segnaposto nel colore primario semitrasparente
+            palette = app.palette()
+            color = QColor(primary_color)
+            color.setAlpha(92)
+            palette.setColor(QPalette.Text, color)
+            app.setPalette(palette)
+
+        # Il foglio di stile fa riferimento alle icone come icon:/primary/...
+        QDir.setSearchPaths("icon", [os.path.join(cache_dir, "icons")])
+        app.setStyleSheet(stylesheet)
+
+    def _apply_uncached(self, app, theme):
+        """Ripiego: il tema generato da qt_material a ogni avvio"""
+        try:
+            import qt_material
+            qt_material.apply_stylesheet(app, theme=theme)
+            return True
+        except Exception as e:
+            print(f"Errore nell'applicazione del tema: {str(e)}")
+            return False
+
+    def clear(self):
+        """Elimina i temi in cache (vengono rigenerati al prossimo avvio)"""
+        shutil.rmtree(self.cache_root, ignore_errors=True)
+
+# Istanza singleton della cache del tema
+theme_cache = ThemeCache()
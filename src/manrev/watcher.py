@@ -0,0 +1,489 @@
+import hashlib
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from paths import path_manager
+from .settings import manrev_settings
+from .instrumentation import instrumentation
+from .numbering import NumberSequence
+from .batch import (
+    LEDGER_READERS, BatchReport, BatchRowResult, iter_ledger, prepare_row_data,
+    build_output_filename, get_default_output_dir
+)
+from .parallel import PENDING_PER_WORKER, _init_service_worker, _render, default_workers
+
+# Secondi senza modifiche dopo i quali un file della cartella di ingresso
+# è considerato scritto completamente
+SETTLE_SECONDS = 1.0
+# Intervallo di controllo della cartella quando inotify non è disponibile
+POLL_INTERVAL = 1.0
+# Con inotify la cartella viene comunque riletta ogni tanto, nel caso
+# qualche evento sia andato perso (coda degli eventi piena)
+RESCAN_INTERVAL = 30.0
+
+# Sottocartelle della cartella di ingresso
+PROCESSING_DIR = "in_corso"
+DONE_DIR = "elaborati"
+FAILED_DIR = "errori"
+NUMBERS_DIR = "numeri"
+
+# Eventi inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+_EVENT_HEADER = struct.Struct("iIII")
+
+class Inotify:
+    """Notifiche del kernel sui file di una cartella (solo Linux), tramite ctypes"""
+
+    def __init__(self, directory):
+        import ctypes
+        import ctypes.util
+
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 non riuscita")
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            error = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(error, f"inotify_add_watch non riuscita per {directory}")
+        # Evento di coda piena: i nomi persi vanno recuperati rileggendo la cartella
+        self.overflow = False
+
+    def fileno(self):
+        return self.fd
+
+    def read(self):
+        """Nomi dei file modificati dall'ultima lettura"""
+        names = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return names
+            offset = 0
+            while offset < len(data):
+                _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                if mask & IN_Q_OVERFLOW:
+                    self.overflow = True
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if name:
+                    names.add(os.fsdecode(name))
+
+    def close(self):
+        os.close(self.fd)
+
+class AssignedNumbers:
+    """
+    Numeri assegnati alle righe senza Numero di un file della cartella di
+    ingresso, salvati in numeri/<nome>.numeri. Se il file viene elaborato di
+    nuovo (ripresa dopo un'interruzione o nuovo invio da errori/) le stesse
+    righe ricevono gli stessi numeri invece di consumarne altri: i documenti
+    già generati vengono sovrascritti, non duplicati con un numero diverso.
+    Le righe sono riconosciute dal contenuto, non dalla posizione nel file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.numbers = {}
+        self._seen = {}
+        self._file = None
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    key, _, numero = line.rstrip("\n").partition("\t")
+                    if numero:
+                        self.numbers[key] = numero
+        except FileNotFoundError:
+            pass
+
+    def key(self, row):
+        """Chiave della riga: contenuto (senza Numero) e quante righe uguali la precedono"""
+        content = {field: value for field, value in row.items() if field != "Numero"}
+        digest = hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        occurrence = self._seen.get(digest, 0)
+        self._seen[digest] = occurrence + 1
+        return f"{digest}:{occurrence}"
+
+    def record(self, key, numero):
+        if self.numbers.get(key) == numero:
+            return
+        self.numbers[key] = numero
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        self._file.write(f"{key}\t{numero}\n")
+        # Scritto prima che la riga vada in generazione
+        self._file.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def discard(self):
+        """Il file è stato elaborato senza errori: i numeri non servono più"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+class InboxFile:
+    """File della cartella di ingresso in elaborazione: righe inviate, completate ed esito"""
+
+    def __init__(self, name, path, assigned):
+        self.name = name
+        self.path = path
+        self.report = BatchReport()
+        self.numbers = NumberSequence()
+        self.assigned = assigned
+        self.tasks = None
+        self.submitted = 0
+        self.completed = 0
+        self.exhausted = False
+        # Errore che riguarda l'intero file (es. JSON non valido)
+        self.error = None
+
+    @property
+    def finished(self):
+        return self.exhausted and self.completed == self.submitted
+
+    @property
+    def failed(self):
+        return self.error is not None or self.report.failed > 0
+
+    def close_numbers(self):
+        # I numeri riservati e non usati tornano alla numerazione appena il file è letto tutto
+        if self.numbers is not None:
+            self.numbers.close()
+            self.numbers = None
+        self.assigned.close()
+
+class InboxWatcher:
+    """
+    Demone senza interfaccia che genera i documenti dei file depositati in
+    una cartella di ingresso.
+
+    Ogni file (CSV, JSON o XLSX, nel formato del registro batch) viene preso
+    quando non cambia da settle secondi, spostato in in_corso/ e le sue righe
+    sono generate nella cartella dell'anno di ogni documento sotto
+    output_dir. Al termine il file finisce in elaborati/ oppure, se almeno
+    una riga non è stata generata, in errori/ insieme a <nome>.errori.txt.
+    I numeri assegnati alle righe restano in numeri/<nome>.numeri finché il
+    file non è elaborato senza errori (vedi AssignedNumbers).
+    La generazione usa un pool di processi di lunga durata, con al massimo
+    PENDING_PER_WORKER documenti in attesa per processo: un afflusso di file
+    viene smaltito alla velocità di tutti i core senza accodarli in memoria.
+    Le modifiche alla cartella arrivano da inotify su Linux; altrove, o con
+    use_inotify=False, la cartella viene controllata ogni poll_interval secondi.
+    """
+
+    def __init__(self, inbox_dir, output_dir=None, workers=None, settle=SETTLE_SECONDS,
+                 poll_interval=POLL_INTERVAL, use_inotify=True, on_result=None, on_file=None):
+        self.inbox_dir = os.path.abspath(inbox_dir)
+        self.output_dir = output_dir or get_default_output_dir()
+        self.workers = workers or default_workers()
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        # on_result(nome_file, BatchRowResult) per ogni riga,
+        # on_file(InboxFile, destinazione) per ogni file completato
+        self.on_result = on_result
+        self.on_file = on_file
+        self.processing_dir = os.path.join(self.inbox_dir, PROCESSING_DIR)
+        self.done_dir = os.path.join(self.inbox_dir, DONE_DIR)
+        self.failed_dir = os.path.join(self.inbox_dir, FAILED_DIR)
+        self.numbers_dir = os.path.join(self.inbox_dir, NUMBERS_DIR)
+        # Nome -> (dimensione, mtime_ns, istante dell'ultima modifica osservata)
+        self._candidates = {}
+        self._active = deque()
+        self._pending = {}
+        self._executor = None
+        self._stopping = False
+        self._wake_read = None
+        self._wake_write = None
+
+    def stop(self):
+        """Smette di prendere nuovi file; quelli in corso vengono completati"""
+        self._stopping = True
+        self._wake()
+
+    def _wake(self):
+        if self._wake_write is not None:
+            try:
+                os.write(self._wake_write, b"\0")
+            except (BlockingIOError, OSError):
+                pass
+
+    @staticmethod
+    def accepts(name):
+        """File da elaborare: registri, esclusi nascosti e file temporanei degli editor"""
+        if name.startswith((".", "~")) or name.endswith((".tmp", ".part", ".crdownload")):
+            return False
+        return os.path.splitext(name)[1].lower() in LEDGER_READERS
+
+    def _recover(self):
+        """Riporta nella cartella di ingresso i file rimasti in_corso dopo un'interruzione"""
+        for name in os.listdir(self.processing_dir):
+            path = os.path.join(self.processing_dir, name)
+            if os.path.isfile(path):
+                target = self._move(path, self.inbox_dir)
+                if os.path.basename(target) != name:
+                    # I numeri seguono il file anche se è stato rinominato
+                    numbers_path = self._numbers_path(name)
+                    if os.path.exists(numbers_path):
+                        os.replace(numbers_path, self._numbers_path(os.path.basename(target)))
+                print(f"File ripreso dopo un'interruzione: {name}")
+
+    def _numbers_path(self, name):
+        return os.path.join(self.numbers_dir, name + ".numeri")
+
+    def _move(self, path, directory):
+        """Sposta un file in directory; se il nome esiste già aggiunge data e ora"""
+        name = os.path.basename(path)
+        target = os.path.join(directory, name)
+        if os.path.exists(target):
+            stem, ext = os.path.splitext(name)
+            target = os.path.join(directory, f"{stem}_{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}{ext}")
+        os.replace(path, target)
+        return target
+
+    def _observe(self, names, now):
+        """Aggiorna dimensione e data di modifica dei file indicati"""
+        for name in names:
+            if not self.accepts(name):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.inbox_dir, name))
+            except FileNotFoundError:
+                self._candidates.pop(name, None)
+                continue
+            signature = (stat.st_size, stat.st_mtime_ns)
+            previous = self._candidates.get(name)
+            if previous is None or previous[:2] != signature:
+                self._candidates[name] = signature + (now,)
+
+    def _scan(self, now):
+        names = [entry.name for entry in os.scandir(self.inbox_dir) if entry.is_file()]
+        # I file scomparsi (spostati o cancellati da altri) non sono più candidati
+        for name in set(self._candidates) - set(names):
+            del self._candidates[name]
+        self._observe(names, now)
+
+    def _next_ready(self, now):
+        """Il file pronto più vecchio, spostato in in_corso/; None se nessuno è pronto"""
+        ready = [
+            (signature[1], name) for name, signature in self._candidates.items()
+            if signature[0] > 0 and now - signature[2] >= self.settle
+        ]
+        for _, name in sorted(ready):
+            del self._candidates[name]
+            source = os.path.join(self.inbox_dir, name)
+            try:
+                path = self._move(source, self.processing_dir)
+            except FileNotFoundError:
+                continue
+            inbox_file = InboxFile(name, path, AssignedNumbers(self._numbers_path(name)))
+            inbox_file.tasks = self._iter_tasks(inbox_file)
+            return inbox_file
+        return None
+
+    def _next_timeout(self, now, rescan_at):
+        """Attesa fino al prossimo file pronto o al prossimo controllo della cartella"""
+        timeout = max(0.0, rescan_at - now)
+        for signature in self._candidates.values():
+            # Un file vuoto non diventa mai pronto: se viene scritto arriva una
+            # notifica (o il prossimo controllo), altrimenti il ciclo girerebbe a vuoto
+            if signature[0] > 0:
+                timeout = min(timeout, max(0.0, signature[2] + self.settle - now))
+        return timeout
+
+    def _iter_tasks(self, inbox_file):
+        """Righe del file trasformate in doc_data, con il percorso nella cartella dell'anno"""
+        for row_number, row in iter_ledger(inbox_file.path):
+            try:
+                key = inbox_file.assigned.key(row)
+                if not row.get("Numero") and key in inbox_file.assigned.numbers:
+                    row = dict(row, Numero=inbox_file.assigned.numbers[key])
+                data = prepare_row_data(row, inbox_file.numbers)
+                if not row.get("Numero"):
+                    inbox_file.assigned.record(key, data["Numero"])
+                year_dir = path_manager.get_year_dir(self.output_dir, data["anno"])
+                output_file = os.path.join(year_dir, build_output_filename(data))
+            except Exception as e:
+                self._record(inbox_file, BatchRowResult(row_number, error=str(e)))
+                continue
+            yield row_number, data, output_file
+
+    def _record(self, inbox_file, result):
+        inbox_file.report.add(result)
+        if self.on_result:
+            self.on_result(inbox_file.name, result)
+
+    def _start_pool(self):
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_service_worker,
+                                             initargs=(manrev_settings.current_settings,))
+
+    def _send(self, row_number, data, output_file):
+        try:
+            return self._executor.submit(_render, row_number, data, output_file)
+        except BrokenProcessPool:
+            # Un worker è terminato in modo anomalo: il pool viene ricreato
+            print("Errore nel pool di processi: riavvio dei worker")
+            self._executor.shutdown(wait=False)
+            self._start_pool()
+            return self._executor.submit(_render, row_number, data, output_file)
+
+    def _submit(self, now):
+        """Invia righe al pool finché c'è posto, prendendo nuovi file quando servono"""
+        max_pending = self.workers * PENDING_PER_WORKER
+        while len(self._pending) < max_pending:
+            inbox_file = next((item for item in self._active if not item.exhausted), None)
+            if inbox_file is None:
+                if self._stopping:
+                    return
+                inbox_file = self._next_ready(now)
+                if inbox_file is None:
+                    return
+                self._active.append(inbox_file)
+            try:
+                row_number, data, output_file = next(inbox_file.tasks)
+            except StopIteration:
+                inbox_file.exhausted = True
+                inbox_file.close_numbers()
+                continue
+            except Exception as e:
+                # File illeggibile: nessuna riga viene generata
+                inbox_file.error = str(e)
+                inbox_file.exhausted = True
+                inbox_file.close_numbers()
+                continue
+            future = self._send(row_number, data, output_file)
+            self._pending[future] = inbox_file
+            inbox_file.submitted += 1
+            future.add_done_callback(lambda _: self._wake())
+
+    def _collect(self):
+        """Registra i documenti generati e chiude i file completati"""
+        for future in [future for future in self._pending if future.done()]:
+            inbox_file = self._pending.pop(future)
+            try:
+                row_number, output_file, error = future.result()
+            except Exception as e:
+                # Processo worker terminato in modo anomalo
+                row_number, output_file, error = None, None, str(e)
+            inbox_file.completed += 1
+            self._record(inbox_file, BatchRowResult(row_number, output_file, error))
+
+        while self._active and self._active[0].finished:
+            self._finish(self._active.popleft())
+
+    def _finish(self, inbox_file):
+        if inbox_file.failed:
+            destination = self._move(inbox_file.path, self.failed_dir)
+            with open(destination + ".errori.txt", "w", encoding="utf-8") as f:
+                if inbox_file.error:
+                    f.write(f"{inbox_file.error}\n")
+                for failure in inbox_file.report.failures:
+                    f.write(f"riga {failure.row_number}: {failure.error}\n")
+            instrumentation.count("watcher.file_errati")
+        else:
+            destination = self._move(inbox_file.path, self.done_dir)
+            inbox_file.assigned.discard()
+            instrumentation.count("watcher.file_elaborati")
+        instrumentation.count("watcher.documenti", inbox_file.report.succeeded)
+        if self.on_file:
+            self.on_file(inbox_file, destination)
+
+    def _open_notifier(self):
+        if not self.use_inotify or not sys.platform.startswith("linux"):
+            return None
+        try:
+            return Inotify(self.inbox_dir)
+        except Exception as e:
+            print(f"Errore nell'avvio di inotify, la cartella verrà controllata periodicamente: {str(e)}")
+            return None
+
+    def _install_signal_handlers(self):
+        """SIGINT e SIGTERM fermano il demone dopo i file in corso; un secondo segnale lo interrompe"""
+        previous = {}
+
+        def handle(signum, frame):
+            for number, handler in previous.items():
+                signal.signal(number, handler)
+            print("Arresto in corso: completamento dei file già iniziati...")
+            self.stop()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                previous[signum] = signal.signal(signum, handle)
+            except ValueError:
+                # Non siamo nel thread principale: l'arresto passa solo da stop()
+                return {}
+        return previous
+
+    def run(self):
+        """Elabora i file della cartella di ingresso finché non viene chiamato stop()"""
+        for directory in (self.inbox_dir, self.processing_dir, self.done_dir, self.failed_dir, self.numbers_dir):
+            os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+        self._wake_read, self._wake_write = os.pipe()
+        os.set_blocking(self._wake_read, False)
+        os.set_blocking(self._wake_write, False)
+        notifier = self._open_notifier()
+        previous_handlers = self._install_signal_handlers()
+        interval = RESCAN_INTERVAL if notifier is not None else self.poll_interval
+        sources = [self._wake_read] + ([notifier] if notifier is not None else [])
+
+        self._start_pool()
+        try:
+            now = time.monotonic()
+            self._scan(now)
+            rescan_at = now + interval
+            while not (self._stopping and not self._active):
+                now = time.monotonic()
+                if now >= rescan_at or (notifier is not None and notifier.overflow):
+                    self._scan(now)
+                    rescan_at = now + interval
+                    if notifier is not None:
+                        notifier.overflow = False
+                self._collect()
+                self._submit(now)
+
+                ready, _, _ = select.select(sources, [], [], self._next_timeout(now, rescan_at))
+                if self._wake_read in ready:
+                    try:
+                        while os.read(self._wake_read, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                if notifier is not None and notifier in ready:
+                    self._observe(notifier.read(), time.monotonic())
+        finally:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+            if notifier is not None:
+                notifier.close()
+            for inbox_file in self._active:
+                inbox_file.close_numbers()
+            os.close(self._wake_read)
+            os.close(self._wake_write)
+            self._wake_read = self._wake_write = None
@@ -0,0 +1,372 @@
+import atexit
+import os
+import queue
+import random
+import threading
+import time
+from .instrumentation import instrumentation
+
+# Variabile d'ambiente che sceglie il backend: "fake" usa Word simulato
+# (anche su Linux), altrimenti Word vero tramite pywin32
+WORD_BACKEND_ENV = "MANREV_WORD_BACKEND"
+
+# Secondi senza stampe dopo i quali Word viene chiuso
+IDLE_TIMEOUT = 300
+# Documenti dopo i quali Word viene riavviato, per contenere la memoria che accumula
+MAX_DOCUMENTS_PER_SESSION = 500
+# Attesa massima di un lotto di stampe prima di considerare Word bloccato
+PRINT_TIMEOUT = 600
+
+class ComWordBackend:
+    """Word vero tramite Word Automation (pywin32, solo Windows)"""
+
+    def initialize_thread(self):
+        import pythoncom
+        pythoncom.CoInitialize()
+
+    def uninitialize_thread(self):
+        import pythoncom
+        pythoncom.CoUninitialize()
+
+    def start(self):
+        import win32com.client
+
+        # DispatchEx avvia un'istanza dedicata, che non si mescola con il Word dell'utente
+        app = win32com.client.DispatchEx("Word.Application")
+        app.Visible = False
+        app.DisplayAlerts = 0
+        return app
+
+    def is_alive(self, app):
+        try:
+            app.Documents.Count
+            return True
+        except Exception:
+            return False
+
+    def set_printer(self, app, printer):
+        app.ActivePrinter = printer
+
+    def print_file(self, app, file_path):
+        doc = app.Documents.Open(os.path.abspath(file_path), ReadOnly=True, AddToRecentFiles=False)
+        try:
+            doc.PrintOut(Background=False)
+        finally:
+            doc.Close(SaveChanges=0)
+
+    def quit(self, app):
+        app.Quit(SaveChanges=0)
+
+class _FakeWordApp:
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.alive = True
+        self.printer = None
+
+class FakeWordBackend:
+    """
+    Word simulato, per provare sessione e pool su Linux: avvio e stampa
+    attendono i secondi indicati, le stampe vengono registrate in printed
+    (e in log_path), crash() fa terminare le istanze aperte. Come con COM,
+    un'istanza usata da un thread diverso da quello che l'ha creata solleva
+    un errore.
+    """
+
+    def __init__(self, start_delay=0.0, print_delay=0.0, fail_rate=0.0, log_path=None):
+        self.start_delay = start_delay
+        self.print_delay = print_delay
+        self.fail_rate = fail_rate
+        self.log_path = log_path
+        self.starts = 0
+        self.quits = 0
+        self.printed = []
+        self._apps = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Configurazione dalle variabili FAKE_WORD_START_DELAY, FAKE_WORD_PRINT_DELAY, FAKE_WORD_FAIL_RATE, FAKE_WORD_LOG"""
+        return cls(
+            float(os.environ.get("FAKE_WORD_START_DELAY", "0")),
+            float(os.environ.get("FAKE_WORD_PRINT_DELAY", "0")),
+            float(os.environ.get("FAKE_WORD_FAIL_RATE", "0")),
+            os.environ.get("FAKE_WORD_LOG")
+        )
+
+    def initialize_thread(self):
+        pass
+
+    def uninitialize_thread(self):
+        pass
+
+    def _check(self, app):
+        if app.thread_id != threading.get_ident():
+            raise RuntimeError("Oggetto COM usato da un thread diverso da quello che l'ha creato")
+        if not app.alive:
+            raise RuntimeError("Il server RPC non è disponibile")
+
+    def start(self):
+        time.sleep(self.start_delay)
+        app = _FakeWordApp(threading.get_ident())
+        with self._lock:
+            self.starts += 1
+            self._apps.append(app)
+        return app
+
+    def is_alive(self, app):
+        return app.alive
+
+    def set_printer(self, app, printer):
+        self._check(app)
+        app.printer = printer
+
+    def print_file(self, app, file_path):
+        self._check(app)
+        time.sleep(self.print_delay)
+        if random.random() < self.fail_rate:
+            raise RuntimeError(f"Word non riesce a stampare {file_path}")
+        with self._lock:
+            self.printed.append((app.printer, file_path))
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as log:
+                    log.write(f"{app.printer or ''}\t{file_path}\n")
+
+    def quit(self, app):
+        self._check(app)
+        app.alive = False
+        with self._lock:
+            self.quits += 1
+
+    def crash(self):
+        """Simula la chiusura inattesa di tutte le istanze di Word"""
+        with self._lock:
+            for app in self._apps:
+                app.alive = False
+
+def get_backend():
+    """Backend indicato da MANREV_WORD_BACKEND"""
+    if os.environ.get(WORD_BACKEND_ENV, "").lower() == "fake":
+        return FakeWordBackend.from_env()
+    return ComWordBackend()
+
+class PrintTask:
+    """Lotto di file da stampare sulla stessa stampante con la stessa istanza di Word"""
+
+    def __init__(self, file_paths, printer):
+        self.file_paths = list(file_paths)
+        self.printer = printer
+        # Per ogni file None se stampato, altrimenti l'eccezione
+        self.errors = [None] * len(self.file_paths)
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        if not self.done.wait(timeout):
+            raise TimeoutError(f"Word non ha completato la stampa entro {timeout} secondi")
+        return self.errors
+
+class WordSession:
+    """
+    Istanza di Word di lunga durata con un thread dedicato: COM richiede che
+    Word sia usato dal thread che l'ha avviato, quindi tutte le stampe della
+    sessione passano da una coda. Prima di ogni documento Word viene
+    controllato e riavviato se non risponde; resta aperto fino a
+    idle_timeout secondi senza stampe.
+    """
+
+    def __init__(self, backend, idle_timeout=IDLE_TIMEOUT, max_documents=MAX_DOCUMENTS_PER_SESSION, name="manrev-word"):
+        self.backend = backend
+        self.idle_timeout = idle_timeout
+        self.max_documents = max_documents
+        self.name = name
+        self.app = None
+        self.starts = 0
+        self.restarts = 0
+        self.printed = 0
+        self.busy = False
+        self._documents = 0
+        self._printer = None
+        self._tasks = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        """Lotti in attesa o in corso"""
+        return self._tasks.qsize() + (1 if self.busy else 0)
+
+    def submit(self, file_paths, printer=None):
+        """Accoda un lotto e restituisce il PrintTask da attendere"""
+        task = PrintTask(file_paths, printer)
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+            self._tasks.put(task)
+        return task
+
+    def close(self, timeout=None):
+        """Chiude Word e ferma il thread dopo i lotti già accodati"""
+        with self._lock:
+            thread = self._thread
+            if thread is None:
+                return
+            self._tasks.put(None)
+        thread.join(timeout)
+
+    def _run(self):
+        self.backend.initialize_thread()
+        try:
+            while True:
+                try:
+                    task = self._tasks.get(timeout=self.idle_timeout if self.app is not None else None)
+                except queue.Empty:
+                    # Nessuna stampa da idle_timeout secondi: Word viene chiuso
+                    self._quit()
+                    continue
+                if task is None:
+                    break
+                self.busy = True
+                try:
+                    self._process(task)
+                finally:
+                    self.busy = False
+                    task.done.set()
+        finally:
+            self._quit()
+            self.backend.uninitialize_thread()
+
+    def _quit(self):
+        app, self.app = self.app, None
+        self._printer = None
+        self._documents = 0
+        if app is not None:
+            try:
+                self.backend.quit(app)
+            except Exception as e:
+                print(f"Errore nella chiusura di Word: {str(e)}")
+
+    def _healthy_app(self):
+        """Istanza di Word pronta: riavviata se non risponde o se ha stampato troppi documenti"""
+        if self.app is not None:
+            if not self.backend.is_alive(self.app):
+                self.restarts += 1
+                instrumentation.count("word.riavvii")
+                self.app = None
+                self._printer = None
+                self._documents = 0
+            elif self._documents >= self.max_documents:
+                self._quit()
+        if self.app is None:
+            with instrumentation.timer("word.avvio"):
+                self.app = self.backend.start()
+            self.starts += 1
+            instrumentation.count("word.avvii")
+        return self.app
+
+    def _print(self, file_path, printer):
+        app = self._healthy_app()
+        if printer and printer != self._printer:
+            self.backend.set_printer(app, printer)
+            self._printer = printer
+        self.backend.print_file(app, file_path)
+        self._documents += 1
+        self.printed += 1
+
+    def _process(self, task):
+        for index, file_path in enumerate(task.file_paths):
+            if not os.path.exists(file_path):
+                task.errors[index] = FileNotFoundError(f"File non trovato: {file_path}")
+                continue
+            try:
+                self._print(file_path, task.printer)
+            except Exception as e:
+                # Se Word non risponde più il file viene ristampato con una nuova istanza,
+                # altrimenti l'errore riguarda il documento e non si riprova
+                if self.app is not None and self.backend.is_alive(self.app):
+                    task.errors[index] = e
+                    continue
+                try:
+                    self._print(file_path, task.printer)
+                except Exception as retry_error:
+                    task.errors[index] = retry_error
+
+class WordSessionPool:
+    """
+    Sessioni di Word condivise dalle stampe: ogni lotto va alla sessione
+    meno occupata e Word viene avviato una volta sola invece che per ogni
+    documento. size è il numero massimo di istanze di Word aperte insieme.
+    """
+
+    def __init__(self, size=1, backend=None, idle_timeout=IDLE_TIMEOUT, print_timeout=PRINT_TIMEOUT):
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.print_timeout = print_timeout
+        self._backend = backend
+        self._sessions = []
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    @property
+    def backend(self):
+        # Scelto al primo uso: MANREV_WORD_BACKEND può essere impostata dopo l'import
+        if self._backend is None:
+            self._backend = get_backend()
+        return self._backend
+
+    def _session(self):
+        with self._lock:
+            if len(self._sessions) < self.size and all(session.pending for session in self._sessions):
+                self._sessions.append(WordSession(
+                    self.backend, self.idle_timeout, name=f"manrev-word-{len(self._sessions) + 1}"
+                ))
+            return min(self._sessions, key=lambda session: session.pending)
+
+    def submit(self, file_paths, printer=None):
+        """Accoda un lotto di file sulla stessa stampante; restituisce il PrintTask"""
+        return self._session().submit(file_paths, printer)
+
+    def print_files(self, file_paths, printer=None):
+        """
+        Stampa più file con una sola sessione di Word e attende la fine;
+        restituisce per ogni file None o l'eccezione
+        """
+        session = self._session()
+        task = session.submit(file_paths, printer)
+        try:
+            return task.wait(self.print_timeout)
+        except TimeoutError:
+            # Word bloccato: la sessione viene abbandonata e le prossime stampe ne usano una nuova
+            self._discard(session)
+            raise
+
+    def print_file(self, file_path, printer=None):
+        """Stampa un file; solleva l'eccezione in caso di errore"""
+        error = self.print_files([file_path], printer)[0]
+        if error is not None:
+            raise error
+        return True
+
+    def _discard(self, session):
+        with self._lock:
+            if session in self._sessions:
+                self._sessions.remove(session)
+        instrumentation.count("word.sessioni_bloccate")
+
+    def stats(self):
+        """Avvii, riavvii e documenti stampati per sessione"""
+        with self._lock:
+            return [
+                {"name": session.name, "running": session.app is not None, "starts": session.starts,
+                 "restarts": session.restarts, "printed": session.printed, "pending": session.pending}
+                for session in self._sessions
+            ]
+
+    def close(self, timeout=10):
+        """Chiude tutte le istanze di Word (anche all'uscita dell'applicazione)"""
+        with self._lock:
+            sessions, self._sessions = self._sessions, []
+        for session in sessions:
+            session.close(timeout)
+
+# Istanza singleton del pool di sessioni di Word
+word_pool = WordSessionPool()
@@ -0,0 +1,86 @@
+import struct
+import time
+import zlib
+
+# Le immagini sono già compresse: ricomprimerle costa solo tempo
+STORED_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif")
+
+_LOCAL_HEADER = struct.Struct("<IHHHHHIIIHH")
+_CENTRAL_HEADER = struct.Struct("<IHHHHHHIIIHHHHHII")
+_END_RECORD = struct.Struct("<IHHHHIIH")
+
+def _dos_datetime(timestamp=None):
+    t = time.localtime(timestamp)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    return dos_time, dos_date
+
+class ZipEntry:
+    """
+    Parte di un pacchetto OOXML già compressa: le parti fisse di un documento
+    vengono compresse una sola volta e poi copiate così come sono in ogni file
+    """
+
+    __slots__ = ("name", "crc", "size", "method", "payload", "dos_time", "dos_date")
+
+    def __init__(self, name, data, compress=None):
+        if compress is None:
+            compress = not name.lower().endswith(STORED_EXTENSIONS)
+        self.name = name.encode("utf-8")
+        self.crc = zlib.crc32(data)
+        self.size = len(data)
+        if compress:
+            compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+            self.payload = compressor.compress(data) + compressor.flush()
+            self.method = 8
+        else:
+            self.payload = bytes(data)
+            self.method = 0
+        self.dos_time, self.dos_date = _dos_datetime()
+
+class ZipStreamWriter:
+    """
+    Archivio zip scritto una voce alla volta: ogni voce va subito sullo
+    stream, la directory centrale alla chiusura. Lo stream viene scritto in
+    sequenza, senza seek, quindi può essere anche un socket o una pipe.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.offset = 0
+        self._central = []
+
+    def add(self, entry):
+        header = _LOCAL_HEADER.pack(
+            0x04034b50, 20, 0, entry.method, entry.dos_time, entry.dos_date,
+            entry.crc, len(entry.payload), entry.size, len(entry.name), 0
+        )
+        self.stream.write(header)
+        self.stream.write(entry.name)
+        self.stream.write(entry.payload)
+        self._central.append(_CENTRAL_HEADER.pack(
+            0x02014b50, 20, 20, 0, entry.method, entry.dos_time, entry.dos_date,
+            entry.crc, len(entry.payload), entry.size, len(entry.name),
+            0, 0, 0, 0, 0, self.offset
+        ) + entry.name)
+        self.offset += len(header) + len(entry.name) + len(entry.payload)
+
+    def close(self):
+        """Scrive la directory centrale e restituisce il numero di bytes dell'archivio"""
+        central_directory = b"".join(self._central)
+        self.stream.write(central_directory)
+        self.stream.write(_END_RECORD.pack(
+            0x06054b50, 0, 0, len(self._central), len(self._central),
+            len(central_directory), self.offset, 0
+        ))
+        return self.offset + len(central_directory) + _END_RECORD.size
+
+def write_zip(stream, entries):
+    """
+    Scrive su stream un archivio zip con le voci indicate.
+    Restituisce il numero di bytes scritti.
+    """
+    writer = ZipStreamWriter(stream)
+    for entry in entries:
+        writer.add(entry)
+    return writer.close()
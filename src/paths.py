@@ -36,9 +36,9 @@ class PathManager:
                 os.path.expanduser("~"),
                 ".config/abe"
             )
-            
-        # Crea le directory se non esistono
-        self.ensure_directories()
+
+        # Le directory non vengono create qui, all'avvio: chi scrive un file
+        # crea la propria directory quando serve (vedi ensure_directories)
     
     def ensure_directories(self):
         """Crea tutte le directory necessarie"""
@@ -0,0 +1,26 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# I test non devono toccare documenti, archivio e cartelle dell'utente:
+# la home punta a una directory temporanea prima di importare i moduli
+os.environ["HOME"] = tempfile.mkdtemp(prefix="manrev-test-")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+@pytest.fixture
+def archive(tmp_path):
+    """Archivio SQLite vuoto in una directory temporanea"""
+    from manrev.archive import ArchiveIndex
+    return ArchiveIndex(str(tmp_path / "archivio.db"))
+
+@pytest.fixture
+def allocator(archive):
+    from manrev.numbering import NumberAllocator
+    return NumberAllocator(archive)
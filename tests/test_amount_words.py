@@ -0,0 +1,110 @@
+import random
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+import pytest
+
+from manrev.amount_words import MAX_AMOUNT_IN_WORDS, amounts_to_words, number_to_words_it
+
+# Implementazione di riferimento, volutamente diretta: ricorsiva, senza
+# tabelle precalcolate né cache, con accenti applicati sul testo finito
+UNITS = [
+    "", "uno", "due", "tre", "quattro", "cinque", "sei", "sette", "otto", "nove", "dieci",
+    "undici", "dodici", "tredici", "quattordici", "quindici", "sedici", "diciassette",
+    "diciotto", "diciannove"
+]
+TENS = ["", "", "venti", "trenta", "quaranta", "cinquanta", "sessanta", "settanta", "ottanta", "novanta"]
+
+def _truncated(words):
+    return words[:-1] if words.endswith("uno") else words
+
+def _reference_words(n):
+    if n < 20:
+        return UNITS[n]
+    if n < 100:
+        tens, unit = divmod(n, 10)
+        prefix = TENS[tens][:-1] if unit in (1, 8) else TENS[tens]
+        return prefix + UNITS[unit]
+    if n < 1000:
+        hundreds, rest = divmod(n, 100)
+        prefix = "cento" if hundreds == 1 else UNITS[hundreds] + "cento"
+        if rest // 10 == 8:
+            prefix = prefix[:-1]
+        return prefix + _reference_words(rest)
+    if n < 10 ** 6:
+        thousands, rest = divmod(n, 1000)
+        prefix = "mille" if thousands == 1 else _truncated(_reference_words(thousands)) + "mila"
+        return prefix + _reference_words(rest)
+    for value, singular, plural in ((10 ** 9, "un miliardo", "miliardi"), (10 ** 6, "un milione", "milioni")):
+        if n >= value:
+            count, rest = divmod(n, value)
+            prefix = singular if count == 1 else f"{_truncated(_reference_words(count))} {plural}"
+            return f"{prefix} {_reference_words(rest)}".strip()
+
+def reference_integer(n):
+    # tre finale di un composto, anche davanti a mila: ventitré, ventitrémila
+    return re.sub(r"(?<=\w)tre(?=mila|\b)", "tré", _reference_words(n))
+
+def reference_amount(amount):
+    amount = abs(amount).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+    int_part = int(amount)
+    cents = int((amount - int_part) * 100)
+    if int_part == 0 and cents == 0:
+        return "zero euro"
+    words = []
+    if int_part == 1:
+        words.append("un euro")
+    elif int_part > MAX_AMOUNT_IN_WORDS:
+        words.append(f"{int_part} euro")
+    elif int_part:
+        currency = "di euro" if int_part % 10 ** 6 == 0 else "euro"
+        words.append(f"{reference_integer(int_part)} {currency}")
+    if cents:
+        if words:
+            words.append("e")
+        words.append(f"{'zero ' if cents < 10 else ''}{cents} centesimi")
+    return " ".join(words)
+
+def random_amounts(seed, count):
+    rng = random.Random(seed)
+    amounts = []
+    for _ in range(count):
+        digits = rng.randint(0, 13)
+        integer = rng.randint(0, 10 ** digits)
+        # Anche importi tondi, per milioni e miliardi senza resto
+        if rng.random() < 0.2:
+            integer -= integer % 10 ** rng.randint(3, 9)
+        cents = rng.choice([0, rng.randint(0, 99), rng.randint(0, 999)])
+        scale = rng.choice([2, 3]) if cents > 99 else 2
+        amount = Decimal(integer) + Decimal(cents).scaleb(-scale)
+        amounts.append(-amount if rng.random() < 0.05 else amount)
+    return amounts
+
+@pytest.mark.parametrize("seed", range(5))
+def test_number_to_words_matches_reference(seed):
+    for amount in random_amounts(seed, 2000):
+        assert number_to_words_it(amount) == reference_amount(amount), amount
+
+@pytest.mark.parametrize("seed", range(5))
+def test_amounts_to_words_matches_reference(seed):
+    amounts = random_amounts(100 + seed, 500)
+    # Importi ripetuti, come in un registro
+    amounts += random.Random(seed).sample(amounts, 200)
+    assert amounts_to_words(amounts) == [reference_amount(amount) for amount in amounts]
+
+def test_text_amounts_match_decimal_amounts():
+    for amount in random_amounts(42, 500):
+        amount = amount.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+        text = f"{amount:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+        assert number_to_words_it(text) == reference_amount(amount), text
+
+@pytest.mark.parametrize("amount, words", [
+    (23000, "ventitrémila euro"),
+    (33000000, "trentatré milioni di euro"),
+    (3000, "tremila euro"),
+    (123123123, "centoventitré milioni centoventitrémilacentoventitré euro"),
+    (21000000, "ventun milioni di euro"),
+    (1.03, "un euro e zero 3 centesimi"),
+])
+def test_accents_and_truncation(amount, words):
+    assert number_to_words_it(amount) == words
@@ -0,0 +1,37 @@
+import pytest
+
+from manrev.archive import amount_to_cents
+
+def _doc(numero, importo):
+    return {
+        "Tipo": "Mandato",
+        "Numero": numero,
+        "Capitolo": "1",
+        "Importo in €": importo,
+        "Descrizione del pagamento": "prova",
+        "Data": "01/03/2025"
+    }
+
+@pytest.mark.parametrize("amount, cents", [
+    ("1.234,56", 123456),
+    ("1,234.56", 123456),
+    ("12,5", 1250),
+    ("€ 1.000,00", 100000),
+    (0.29, 29),
+    (1234.5, 123450),
+    ("0,005", 1),
+])
+def test_amount_to_cents_parses_like_amount_in_words(amount, cents):
+    assert amount_to_cents(amount) == cents
+
+@pytest.mark.parametrize("amount", ["", "abc", "Infinity", "-inf", "NaN", "1e30", float("inf")])
+def test_amount_to_cents_rejects_invalid_amounts(amount):
+    assert amount_to_cents(amount) is None
+
+def test_record_many_survives_invalid_amounts(archive, tmp_path):
+    output = tmp_path / "unico.docx"
+    output.write_bytes(b"x")
+    archive.record_many([_doc("1", "1.234,56"), _doc("2", "Infinity"), _doc("3", "1e30")], str(output))
+    rows = {row["numero"]: row["importo_centesimi"] for row in archive.search()}
+    assert rows == {"1": 123456, "2": None, "3": None}
+    assert [row["numero"] for row in archive.search(min_amount="1.000,00")] == ["1"]
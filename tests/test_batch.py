@@ -0,0 +1,36 @@
+import json
+
+import pytest
+
+from manrev.batch import iter_ledger, prepare_row_data
+
+def test_csv_rows_keep_their_line_numbers(tmp_path):
+    path = tmp_path / "registro.csv"
+    path.write_text("Tipo;Capitolo\nMandato;1\n\nMandato;2\n", encoding="utf-8")
+    assert [(number, row["Capitolo"]) for number, row in iter_ledger(str(path))] == [(2, "1"), (4, "2")]
+
+def test_json_items_are_numbered_from_one(tmp_path):
+    path = tmp_path / "registro.json"
+    path.write_text(json.dumps([{"Capitolo": "1"}, {"Capitolo": "2"}]), encoding="utf-8")
+    assert [(number, row["Capitolo"]) for number, row in iter_ledger(str(path))] == [(1, "1"), (2, "2")]
+
+def test_xlsx_rows_keep_their_sheet_numbers(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    path = tmp_path / "registro.xlsx"
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for values in (["Tipo", "Capitolo"], ["Mandato", 1], [None, None], ["Mandato", 2]):
+        sheet.append(values)
+    workbook.save(path)
+    assert [(number, row["Capitolo"]) for number, row in iter_ledger(str(path))] == [(2, "1"), (4, "2")]
+
+def test_unparsable_date_without_year_setting_fails(monkeypatch):
+    from manrev.settings import manrev_settings
+
+    row = {"Tipo": "Mandato", "Numero": "1", "Capitolo": "1", "Importo in €": "10,00",
+           "Descrizione del pagamento": "prova", "Data": "marzo 2025"}
+    monkeypatch.setitem(manrev_settings.current_settings, "year", None)
+    with pytest.raises(ValueError, match="anno non impostato"):
+        prepare_row_data(row)
+    monkeypatch.setitem(manrev_settings.current_settings, "year", 2025)
+    assert prepare_row_data(row)["anno"] == "2025"
@@ -0,0 +1,56 @@
+import os
+
+from manrev.image_cache import ImageCache, image_extension
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"png"
+JPEG = b"\xff\xd8\xff\xe0" + b"jpeg"
+
+def _cache(tmp_path, **kwargs):
+    cache = ImageCache(**kwargs)
+    cache._cache_dir = str(tmp_path / "cache")
+    os.makedirs(cache._cache_dir)
+    return cache
+
+def _source(tmp_path, name, content=b"sorgente"):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+def test_extension_follows_image_format():
+    assert image_extension(PNG) == ".png"
+    assert image_extension(JPEG) == ".jpg"
+    assert image_extension(b"GIF89a") == ".gif"
+
+def test_jpeg_variant_is_saved_with_jpg_extension_and_reloaded(tmp_path):
+    cache = _cache(tmp_path)
+    source = _source(tmp_path, "sede.jpg")
+    calls = []
+
+    def process(path):
+        calls.append(path)
+        return JPEG
+
+    assert cache.get(source, "sede-compatta", process) == JPEG
+    assert [name.rsplit(".", 1)[1] for name in os.listdir(cache.cache_dir)] == ["jpg"]
+
+    # Un nuovo avvio legge l'immagine dal disco senza rielaborarla
+    restarted = _cache(tmp_path / "riavvio")
+    restarted._cache_dir = cache.cache_dir
+    assert restarted.get(source, "sede-compatta", process) == JPEG
+    assert len(calls) == 1
+
+def test_disk_pruning_includes_jpeg_files(tmp_path):
+    cache = _cache(tmp_path, max_disk_entries=3)
+    for index in range(6):
+        source = _source(tmp_path, f"immagine{index}", bytes([index]))
+        cache.get(source, "variante", lambda path: JPEG if index % 2 else PNG)
+    assert len(os.listdir(cache.cache_dir)) == 3
+
+def test_content_hashes_are_bounded(tmp_path):
+    cache = _cache(tmp_path, max_hashes=4)
+    sources = [_source(tmp_path, f"firma{index}.png", bytes([index])) for index in range(10)]
+    for source in sources:
+        cache.get(source, "firma", lambda path: PNG, persist=False)
+    assert len(cache._content_hashes) == 4
+    # Le voci più recenti restano
+    assert {key[0] for key in cache._content_hashes} == set(sources[-4:])
@@ -0,0 +1,71 @@
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtCore import QCoreApplication
+
+from manrev.jobs import CANCELED, DONE, GenerationQueue
+
+@pytest.fixture(scope="module")
+def qt_app():
+    return QCoreApplication.instance() or QCoreApplication([])
+
+def _data(numero):
+    return {
+        "Tipo": "Mandato",
+        "Numero": str(numero),
+        "Capitolo": "1",
+        "Importo in €": "10,00",
+        "Descrizione del pagamento": "prova",
+        "Data": "01/03/2025",
+        "anno": "2025",
+        "Luogo": "Decimoputzu",
+        "Il Tesoriere": "",
+        "Il Presidente": "",
+        "L'Addetto Contabile": ""
+    }
+
+def test_finished_jobs_can_be_forgotten(qt_app, tmp_path):
+    queue = GenerationQueue()
+    job_ids = [queue.submit(_data(n), str(tmp_path / f"M_{n}.docx")) for n in range(3)]
+    assert queue.wait_for_done(30000)
+    assert {queue.jobs[job_id].status for job_id in job_ids} == {DONE}
+    assert all(queue.forget(job_id) for job_id in job_ids)
+    assert queue.jobs == {}
+    assert not queue.forget(job_ids[0])
+
+def test_pending_jobs_are_kept_and_can_be_canceled(qt_app, tmp_path):
+    queue = GenerationQueue()
+    job_ids = [queue.submit(_data(n), str(tmp_path / f"M_{n}.docx")) for n in range(20)]
+    assert not queue.forget(job_ids[-1])
+    assert queue.cancel_pending() > 0
+    assert queue.wait_for_done(30000)
+    assert queue.pending() == []
+    statuses = [queue.jobs[job_id].status for job_id in job_ids]
+    # I lavori terminati prima dell'annullamento restano completati
+    assert statuses[-1] == CANCELED
+    assert set(statuses) <= {DONE, CANCELED}
+    assert not (tmp_path / "M_19.docx").exists()
+    assert all(queue.forget(job_id) for job_id in job_ids)
+
+def test_print_error_after_generation_keeps_document(qt_app, tmp_path, monkeypatch):
+    from manrev.print_aftergen import print_manager
+
+    def broken_prepare(file_path, payloads):
+        raise RuntimeError("disco pieno")
+
+    monkeypatch.setattr(print_manager, "prepare_print_file", broken_prepare)
+    queue = GenerationQueue()
+    failed, print_failed = [], []
+    queue.signals.failed.connect(lambda *args: failed.append(args))
+    queue.signals.print_failed.connect(lambda *args: print_failed.append(args))
+
+    output_file = str(tmp_path / "M_1.docx")
+    job_id = queue.submit(_data(1), output_file, printer="Ufficio")
+    assert queue.wait_for_done(30000)
+    qt_app.processEvents()
+
+    assert failed == []
+    assert print_failed == [(job_id, output_file, "disco pieno")]
+    assert queue.jobs[job_id].status == DONE
+    assert (tmp_path / "M_1.docx").exists()
@@ -0,0 +1,65 @@
+import pytest
+
+from manrev.batch import prepare_row_data
+from manrev.numbering import NumberSequence
+
+def _row(numero=""):
+    return {
+        "Tipo": "Mandato",
+        "Numero": numero,
+        "Capitolo": "1",
+        "Importo in €": "10,00",
+        "Descrizione del pagamento": "prova",
+        "Data": "01/03/2025"
+    }
+
+def test_observed_number_is_not_assigned_again(allocator):
+    with NumberSequence(allocator) as numbers:
+        first = numbers.next_number(2025, "Mandato")
+        numbers.observe(2025, "Mandato", first + 2)
+        assigned = [numbers.next_number(2025, "Mandato") for _ in range(4)]
+    assert first + 2 not in assigned
+    assert len(set(assigned)) == 4
+
+def test_observed_number_reaches_allocator_immediately(allocator):
+    with NumberSequence(allocator) as numbers:
+        numbers.observe(2025, "Mandato", "3")
+        # Un altro operatore non riceve il numero inserito a mano
+        assert allocator.peek(2025, "Mandato") == 4
+        assert numbers.next_number(2025, "Mandato") == 4
+
+def test_release_keeps_counter_past_observed_number(allocator):
+    with NumberSequence(allocator) as numbers:
+        numbers.next_number(2025, "Mandato")
+        numbers.observe(2025, "Mandato", "50")
+    assert allocator.peek(2025, "Mandato") == 51
+
+def test_ledger_with_numbered_and_unnumbered_rows(allocator):
+    rows = [_row(), _row("3"), _row(), _row(), _row("5"), _row(), _row()]
+    with NumberSequence(allocator) as numbers:
+        payloads = [prepare_row_data(row, numbers) for row in rows]
+    assigned = [data["Numero"] for data in payloads]
+    assert len(set(assigned)) == len(assigned)
+    assert assigned[1] == "3" and assigned[4] == "5"
+    assert allocator.peek(2025, "Mandato") > max(int(numero) for numero in assigned)
+
+def test_short_and_full_tipo_share_one_counter(allocator):
+    first = allocator.next_number(2025, "Mandato")
+    assert allocator.next_number(2025, "mandato di  pagamento") == first + 1
+    assert allocator.peek(2025, "Mandato di Pagamento") == first + 2
+    with NumberSequence(allocator, block_size=5) as numbers:
+        assert numbers.next_number(2025, "MANDATO") == first + 2
+
+def test_unknown_tipo_is_rejected(allocator):
+    with pytest.raises(ValueError, match="Tipo di documento non valido"):
+        allocator.next_number(2025, "Fattura")
+    with pytest.raises(ValueError, match="Tipo di documento non valido"):
+        prepare_row_data(_row("1") | {"Tipo": "Mandato di Incasso"})
+
+def test_row_tipo_is_normalized():
+    assert prepare_row_data(_row("3") | {"Tipo": "reversale"})["Tipo"] == "Reversale di Esazione"
+
+def test_legacy_short_tipo_counter_is_continued(allocator, archive):
+    with archive.connection as connection:
+        connection.execute("INSERT INTO numbering (anno, tipo, last) VALUES (2025, 'Mandato', 40)")
+    assert allocator.peek(2025, "Mandato di Pagamento") == 41
@@ -0,0 +1,191 @@
+import os
+import sys
+import time
+
+import pytest
+
+from manrev import print_queue as print_queue_module
+from manrev.print_queue import (
+    CANCELED, DONE, FAILED, MAX_ATTEMPTS, PRINTING, QUEUED, STALE_AFTER,
+    PrintQueue, PrintSpooler, backoff_delay, print_files, print_temp_dir, print_with_lp
+)
+
+FAKE_LP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks", "fake_lp.py")
+
+@pytest.fixture
+def fake_lp(monkeypatch, tmp_path):
+    """lp sostituito da benchmarks/fake_lp.py; restituisce il file con le stampe eseguite"""
+    log_path = tmp_path / "lp.log"
+    monkeypatch.setenv("MANREV_LP_COMMAND", f'"{sys.executable}" "{FAKE_LP}"')
+    monkeypatch.setenv("FAKE_LP_LOG", str(log_path))
+    monkeypatch.delenv("MANREV_WORD_BACKEND", raising=False)
+    monkeypatch.delenv("FAKE_LP_FAIL_RATE", raising=False)
+    monkeypatch.delenv("FAKE_LP_REJECT", raising=False)
+    return log_path
+
+@pytest.fixture
+def queue(archive):
+    return PrintQueue(archive)
+
+def _printed(log_path):
+    if not log_path.exists():
+        return []
+    return [line.split("\t")[1] for line in log_path.read_text(encoding="utf-8").splitlines()]
+
+def _pdfs(tmp_path, names):
+    paths = []
+    for name in names:
+        path = tmp_path / f"{name}.pdf"
+        path.write_bytes(b"%PDF-1.4")
+        paths.append(str(path))
+    return paths
+
+def test_batched_lp_failure_falls_back_to_single_files(fake_lp, monkeypatch, tmp_path):
+    files = _pdfs(tmp_path, ["a", "rifiutato", "c"])
+    monkeypatch.setenv("FAKE_LP_REJECT", "rifiutato")
+    errors = print_files(files, "Ufficio")
+    assert errors[0] is None and errors[2] is None
+    assert "unsupported document-format" in str(errors[1])
+    # Il lotto fallito non ha stampato nulla: ogni file buono una volta sola
+    assert _printed(fake_lp) == [files[0], files[2]]
+
+def test_batch_goes_to_lp_with_one_request(fake_lp, tmp_path):
+    files = _pdfs(tmp_path, ["a", "b", "c"])
+    assert print_files(files, "Ufficio") == [None, None, None]
+    assert _printed(fake_lp) == files
+
+def test_lp_error_message_is_reported(fake_lp, tmp_path):
+    with pytest.raises(RuntimeError, match="lp ha restituito 1"):
+        print_with_lp(str(tmp_path / "manca.pdf"))
+
+def test_failed_attempt_is_requeued_with_backoff(queue, tmp_path):
+    job_id = queue.submit(_pdfs(tmp_path, ["a"])[0], "Ufficio")
+    job = queue.claim()
+    assert job["id"] == job_id and job["attempts"] == 1
+    before = time.time()
+    queue.fail(job, "stampante spenta")
+    stored = queue.get(job_id)
+    assert stored["status"] == QUEUED
+    assert stored["error"] == "stampante spenta"
+    assert stored["next_attempt_at"] >= before + backoff_delay(1)
+    # Non viene ripreso prima dell'attesa
+    assert queue.claim() is None
+    assert 0 < queue.seconds_to_next() <= backoff_delay(1)
+
+def test_job_fails_after_max_attempts(queue, archive, tmp_path):
+    job_id = queue.submit(_pdfs(tmp_path, ["a"])[0])
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        with archive.connection as connection:
+            connection.execute("UPDATE print_jobs SET next_attempt_at = 0 WHERE id = ?", (job_id,))
+        job = queue.claim()
+        assert job["attempts"] == attempt
+        queue.fail(job, "errore")
+    assert queue.get(job_id)["status"] == FAILED
+
+def test_backoff_grows_up_to_maximum():
+    delays = [backoff_delay(attempts) for attempts in range(1, 20)]
+    assert delays == sorted(delays)
+    assert delays[1] == 2 * delays[0]
+    assert delays[-1] == print_queue_module.BACKOFF_MAX
+
+def test_spooler_retries_until_printed(fake_lp, queue, monkeypatch, tmp_path):
+    monkeypatch.setattr(print_queue_module, "BACKOFF_BASE", 0.01)
+    calls = []
+
+    def flaky_print(file_path, printer=None):
+        calls.append(file_path)
+        if len(calls) <= 2:
+            raise RuntimeError("scheduler not responding")
+        return print_with_lp(file_path, printer)
+
+    spooler = PrintSpooler(queue, print_function=flaky_print, workers=1, poll_interval=0.05)
+    job_ids = spooler.submit_many(_pdfs(tmp_path, ["a"]))
+    counts = spooler.run_until_done(job_ids, timeout=10)
+    assert counts == {DONE: 1}
+    assert len(calls) == 3
+    assert queue.get(job_ids[0])["attempts"] == 3
+
+def test_spooler_does_not_retry_missing_file(queue, tmp_path):
+    spooler = PrintSpooler(queue, print_function=print_queue_module.print_file, workers=1, poll_interval=0.05)
+    job_ids = spooler.submit_many([str(tmp_path / "manca.pdf")])
+    assert spooler.run_until_done(job_ids, timeout=10) == {FAILED: 1}
+    assert queue.get(job_ids[0])["attempts"] == 1
+
+def test_spooler_batches_jobs_and_waits_only_for_own_jobs(fake_lp, queue, archive, tmp_path):
+    # Un lavoro di un'altra istanza, in attesa di un nuovo tentativo
+    other = queue.submit(_pdfs(tmp_path, ["altro"])[0])
+    with archive.connection as connection:
+        connection.execute("UPDATE print_jobs SET next_attempt_at = ? WHERE id = ?", (time.time() + 3600, other))
+
+    spooler = PrintSpooler(queue, workers=2, poll_interval=0.05, print_batch_function=print_files, batch_size=20)
+    files = _pdfs(tmp_path, [f"doc{index}" for index in range(10)])
+    job_ids = spooler.submit_many(files, "Ufficio")
+    started = time.monotonic()
+    assert spooler.run_until_done(job_ids, timeout=30) == {DONE: 10}
+    assert time.monotonic() - started < 30
+    assert sorted(_printed(fake_lp)) == sorted(files)
+    assert queue.get(other)["status"] == QUEUED
+
+def test_stale_jobs_are_recovered_on_start(fake_lp, queue, archive, tmp_path):
+    stale, recent = (queue.submit(path) for path in _pdfs(tmp_path, ["vecchio", "recente"]))
+    queue.claim_batch(2)
+    with archive.connection as connection:
+        connection.execute("UPDATE print_jobs SET updated_at = ? WHERE id = ?",
+                           (time.time() - STALE_AFTER - 1, stale))
+
+    assert queue.recover_stale() == 1
+    assert queue.get(stale)["status"] == QUEUED
+    # Un lavoro in stampa da poco appartiene a un'istanza ancora attiva
+    assert queue.get(recent)["status"] == PRINTING
+
+    spooler = PrintSpooler(queue, workers=1, poll_interval=0.05)
+    assert spooler.run_until_done([stale], timeout=10) == {DONE: 1}
+    assert queue.get(recent)["status"] == PRINTING
+
+def test_cancel_and_retry(queue, tmp_path):
+    job_id = queue.submit(_pdfs(tmp_path, ["a"])[0])
+    assert queue.cancel(job_id)
+    assert queue.get(job_id)["status"] == CANCELED
+    assert queue.claim() is None
+    assert queue.retry(job_id)
+    assert queue.claim()["id"] == job_id
+
+def _print_file(name):
+    path = os.path.join(print_temp_dir(), name)
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4")
+    return path
+
+def test_printed_temp_file_is_deleted_and_user_file_kept(fake_lp, queue, tmp_path):
+    temp_file = _print_file("Mandato_1_20250301.pdf")
+    user_file = _pdfs(tmp_path, ["utente"])[0]
+    spooler = PrintSpooler(queue, workers=1, poll_interval=0.05)
+    job_ids = spooler.submit_many([temp_file, user_file])
+    assert spooler.run_until_done(job_ids, timeout=10) == {DONE: 2}
+    assert not os.path.exists(temp_file)
+    assert os.path.exists(user_file)
+
+def test_temp_file_shared_by_queued_job_is_kept(queue):
+    temp_file = _print_file("condiviso.pdf")
+    queue.submit_many([temp_file, temp_file])
+    job = queue.claim()
+    queue.complete(job["id"])
+    assert not queue.discard_print_file(temp_file)
+    assert os.path.exists(temp_file)
+
+def test_sweep_removes_only_unused_old_print_files(queue):
+    failed, canceled, orphan, recent = (
+        _print_file(name) for name in ("fallito.pdf", "annullato.pdf", "orfano.pdf", "recente.pdf")
+    )
+    old = time.time() - STALE_AFTER - 1
+    for path in (failed, canceled, orphan):
+        os.utime(path, (old, old))
+    _, canceled_id = queue.submit_many([failed, canceled])
+    queue.fail(queue.claim(), "errore", retry=False)
+    queue.cancel(canceled_id)
+
+    assert queue.sweep_print_files() == 2
+    # Il lavoro fallito si può ancora riprovare
+    assert os.path.exists(failed)
+    assert os.path.exists(recent)
+    assert not os.path.exists(canceled) and not os.path.exists(orphan)
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("PyQt5")
+
+from PyQt5.QtWidgets import QApplication
+
+from manrev import print_aftergen
+from manrev.print_queue import DEFAULT_PRINTER
+from manrev.printers import PrinterRegistry
+
+@pytest.fixture(scope="module")
+def qt_app():
+    return QApplication.instance() or QApplication([])
+
+class SlowDiscovery:
+    """Ricerca delle stampanti che termina solo quando il test lo decide"""
+
+    def __init__(self, printers):
+        self.printers = printers
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.release.wait(10)
+        return self.printers
+
+def _wait_until(app, condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        app.processEvents()
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_printers_never_wait_for_first_discovery():
+    discovery = SlowDiscovery(["Ufficio"])
+    registry = PrinterRegistry(discover=discovery)
+    found = []
+    registry.add_listener(found.append)
+    started = time.monotonic()
+    assert registry.printers() is None
+    assert time.monotonic() - started < 0.5
+    discovery.release.set()
+    registry.refresh_async().join(5)
+    assert found == [["Ufficio"]]
+    assert registry.printers() == ["Ufficio"]
+
+def test_dialog_opens_before_discovery_and_updates(qt_app, monkeypatch):
+    discovery = SlowDiscovery(["Ufficio", "Ragioneria"])
+    registry = PrinterRegistry(discover=discovery)
+    monkeypatch.setattr(print_aftergen, "printer_registry", registry)
+    monkeypatch.setattr(registry, "last_printer", lambda doc_type=None: "Ragioneria")
+
+    dialog = print_aftergen.PrinterDialog(doc_type="Mandato di Pagamento")
+    assert dialog.selected_printer() == "Ragioneria"
+    assert dialog.printer_combo.count() == 1
+
+    discovery.release.set()
+    assert _wait_until(qt_app, lambda: dialog.printer_combo.count() == 2)
+    assert dialog.selected_printer() == "Ragioneria"
+    dialog.reject()
+    assert registry._listeners == []
+
+def test_dialog_without_last_printer_starts_from_default(qt_app, monkeypatch):
+    discovery = SlowDiscovery(["Ufficio"])
+    registry = PrinterRegistry(discover=discovery)
+    monkeypatch.setattr(print_aftergen, "printer_registry", registry)
+    monkeypatch.setattr(registry, "last_printer", lambda doc_type=None: None)
+    dialog = print_aftergen.PrinterDialog()
+    assert dialog.selected_printer() == DEFAULT_PRINTER
+    discovery.release.set()
+    assert _wait_until(qt_app, lambda: dialog.selected_printer() == "Ufficio")
+    dialog.reject()
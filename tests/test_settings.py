@@ -0,0 +1,95 @@
+import json
+import threading
+import time
+
+import pytest
+
+from manrev import settings as settings_module
+from manrev.settings import ManRevSettings
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    """Impostazioni con il file in una directory temporanea e scritture differite brevi"""
+    monkeypatch.setattr(settings_module, "SAVE_DELAY", 0.05)
+    instance = ManRevSettings()
+    instance.config_dir = str(tmp_path)
+    instance.settings_file = str(tmp_path / "manrev_config.json")
+    yield instance
+    instance.flush()
+
+def _on_disk(settings):
+    with open(settings.settings_file, encoding="utf-8") as f:
+        return json.load(f)
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+def test_deferred_save_notifies_from_timer_after_write(settings):
+    notified = []
+    settings.add_listener(lambda changed: notified.append((changed, threading.get_ident())))
+
+    settings.update({"last_directory": "/tmp/a"}, deferred=True)
+    settings.update({"last_directory": "/tmp/b"}, deferred=True)
+    # Nessuna notifica (né scrittura) nel thread che modifica
+    assert notified == []
+
+    assert _wait_until(lambda: notified)
+    assert notified == [({"last_directory"}, notified[0][1])]
+    assert notified[0][1] != threading.get_ident()
+    assert _on_disk(settings)["last_directory"] == "/tmp/b"
+
+def test_immediate_save_notifies_and_writes(settings):
+    notified = []
+    settings.add_listener(notified.append)
+    settings.update({"default_place": "Cagliari"})
+    assert notified == [{"default_place"}]
+    assert _on_disk(settings)["default_place"] == "Cagliari"
+
+def test_concurrent_updates_during_deferred_writes(settings):
+    errors = []
+
+    def writer(key, count):
+        try:
+            for index in range(count):
+                settings.update({key: f"{key}-{index}"}, deferred=True)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [
+        threading.Thread(target=writer, args=(key, 300))
+        for key in ("last_directory", "default_treasurer", "default_president")
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    settings.flush()
+
+    assert errors == []
+    on_disk = _on_disk(settings)
+    for key in ("last_directory", "default_treasurer", "default_president"):
+        assert on_disk[key] == f"{key}-299"
+        assert settings.current_settings[key] == f"{key}-299"
+
+def test_update_copies_nested_values(settings):
+    firme = {"tesoriere_firma": "a.png", "presidente_firma": "", "addetto_firma": ""}
+    settings.update({"firme": firme})
+    firme["tesoriere_firma"] = "b.png"
+    assert settings.current_settings["firme"]["tesoriere_firma"] == "a.png"
+
+def test_remembered_printer_is_saved_deferred(tmp_path, monkeypatch):
+    from manrev.printers import printer_registry
+    from manrev.settings import manrev_settings
+
+    monkeypatch.setattr(settings_module, "SAVE_DELAY", 0.05)
+    monkeypatch.setattr(manrev_settings, "settings_file", str(tmp_path / "manrev_config.json"))
+    printer_registry.remember("Ufficio", "Mandato")
+    assert printer_registry.last_printer("Mandato") == "Ufficio"
+    assert _wait_until(lambda: (tmp_path / "manrev_config.json").exists())
+    manrev_settings.flush()
+    assert _on_disk(manrev_settings)["last_printers"] == {"": "Ufficio", "Mandato": "Ufficio"}
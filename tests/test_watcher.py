@@ -0,0 +1,53 @@
+import csv
+import os
+
+import pytest
+
+from manrev import numbering
+from manrev.watcher import AssignedNumbers, InboxFile, InboxWatcher
+
+FIELDS = ["Tipo", "Capitolo", "Importo in €", "Descrizione del pagamento", "Data", "Numero"]
+
+@pytest.fixture
+def watcher(tmp_path, allocator, monkeypatch):
+    monkeypatch.setattr(numbering, "number_allocator", allocator)
+    watcher = InboxWatcher(str(tmp_path / "ingresso"), output_dir=str(tmp_path / "documenti"))
+    for directory in (watcher.inbox_dir, watcher.processing_dir, watcher.numbers_dir):
+        os.makedirs(directory, exist_ok=True)
+    return watcher
+
+def _ledger(path, rows):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(dict({"Tipo": "Mandato di Pagamento", "Capitolo": "1",
+                                  "Importo in €": "10,00", "Data": "01/03/2025", "Numero": ""}, **row))
+
+def _numbers(watcher, name):
+    """Numeri delle righe di un file in_corso, come se venisse elaborato da capo"""
+    path = f"{watcher.processing_dir}/{name}"
+    inbox_file = InboxFile(name, path, AssignedNumbers(watcher._numbers_path(name)))
+    numbers = [data["Numero"] for _, data, _ in watcher._iter_tasks(inbox_file)]
+    inbox_file.close_numbers()
+    return numbers
+
+def test_rows_keep_their_numbers_when_file_is_processed_again(watcher, allocator):
+    rows = [{"Descrizione del pagamento": "affitto"}, {"Descrizione del pagamento": "luce"},
+            {"Descrizione del pagamento": "affitto"}, {"Descrizione del pagamento": "acqua", "Numero": "50"}]
+    _ledger(f"{watcher.processing_dir}/marzo.csv", rows)
+    first = _numbers(watcher, "marzo.csv")
+    assert first == ["1", "2", "3", "50"]
+
+    # Ripresa dopo un'interruzione, con una riga corretta e una nuova in testa
+    rows.insert(0, {"Descrizione del pagamento": "gas"})
+    _ledger(f"{watcher.processing_dir}/marzo.csv", rows)
+    assert _numbers(watcher, "marzo.csv") == ["51", "1", "2", "3", "50"]
+    assert allocator.peek(2025, "Mandato di Pagamento") == 52
+
+def test_numbers_are_discarded_after_successful_file(watcher, tmp_path):
+    assigned = AssignedNumbers(watcher._numbers_path("aprile.csv"))
+    assigned.record(assigned.key({"Descrizione del pagamento": "affitto"}), "7")
+    assigned.discard()
+    assert not (tmp_path / "ingresso" / "numeri" / "aprile.csv.numeri").exists()
+    assert AssignedNumbers(watcher._numbers_path("aprile.csv")).numbers == {}
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from manrev.word_session import FakeWordBackend, WordSessionPool
+
+def _documents(tmp_path, count, prefix="doc"):
+    paths = []
+    for index in range(count):
+        path = tmp_path / f"{prefix}{index}.docx"
+        path.write_bytes(b"docx")
+        paths.append(str(path))
+    return paths
+
+def _wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+@pytest.fixture
+def backend():
+    return FakeWordBackend()
+
+@pytest.fixture
+def pool(backend):
+    pool = WordSessionPool(size=1, backend=backend, print_timeout=10)
+    yield pool
+    pool.close()
+
+class CrashingBackend(FakeWordBackend):
+    """Word che si chiude durante la stampa del file indicato, una volta sola"""
+
+    def __init__(self, crash_on):
+        super().__init__()
+        self.crash_on = crash_on
+
+    def print_file(self, app, file_path):
+        if file_path == self.crash_on:
+            self.crash_on = None
+            self.crash()
+        super().print_file(app, file_path)
+
+def test_session_is_reused_across_batches(pool, backend, tmp_path):
+    files = _documents(tmp_path, 6)
+    for start in range(0, 6, 2):
+        assert pool.print_files(files[start:start + 2], "Ufficio") == [None, None]
+    assert backend.starts == 1
+    assert [path for _, path in backend.printed] == files
+    assert {printer for printer, _ in backend.printed} == {"Ufficio"}
+    assert pool.stats()[0]["printed"] == 6
+
+def test_crash_between_batches_restarts_word(pool, backend, tmp_path):
+    first, second = _documents(tmp_path, 2)
+    pool.print_file(first)
+    backend.crash()
+    pool.print_file(second)
+    assert backend.starts == 2
+    assert pool.stats()[0]["restarts"] == 1
+    assert [path for _, path in backend.printed] == [first, second]
+
+def test_crash_during_print_retries_file_with_new_instance(tmp_path):
+    files = _documents(tmp_path, 3)
+    backend = CrashingBackend(crash_on=files[1])
+    pool = WordSessionPool(size=1, backend=backend, print_timeout=10)
+    try:
+        assert pool.print_files(files, "Ufficio") == [None, None, None]
+    finally:
+        pool.close()
+    assert backend.starts == 2
+    assert [path for _, path in backend.printed] == files
+    # La nuova istanza riceve di nuovo la stampante
+    assert backend.printed[-1][0] == "Ufficio"
+
+def test_document_error_is_not_retried(tmp_path):
+    backend = FakeWordBackend(fail_rate=1.0)
+    pool = WordSessionPool(size=1, backend=backend, print_timeout=10)
+    try:
+        errors = pool.print_files(_documents(tmp_path, 2))
+    finally:
+        pool.close()
+    assert all(isinstance(error, RuntimeError) for error in errors)
+    assert backend.starts == 1
+
+def test_missing_file_is_reported_without_starting_word(pool, backend, tmp_path):
+    errors = pool.print_files([str(tmp_path / "manca.docx")])
+    assert isinstance(errors[0], FileNotFoundError)
+    assert backend.starts == 0
+
+def test_idle_session_quits_word_and_restarts_on_demand(backend, tmp_path):
+    first, second = _documents(tmp_path, 2)
+    pool = WordSessionPool(size=1, backend=backend, idle_timeout=0.1, print_timeout=10)
+    try:
+        pool.print_file(first)
+        assert _wait_until(lambda: backend.quits == 1)
+        assert not pool.stats()[0]["running"]
+        pool.print_file(second)
+        assert backend.starts == 2
+    finally:
+        pool.close()
+    assert backend.quits == 2